@@ -0,0 +1,101 @@
+"""
+Compares the dataframe codec of `benchmarks.frame_codec` with pandas' JSON.
+
+For the default selection of the dashboard and for all regions, every
+filtered frame the charts use is encoded and decoded with
+`DataFrame.to_json`/`pd.read_json` and with `encode_frame`/`decode_frame`
+at every compression, and the encoded size, the encode and decode times
+and whether the dtypes survive the round trip are reported::
+
+    python -m benchmarks.codec
+    python -m benchmarks.codec --scale 10
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from .frame_codec import COMPRESSIONS, decode_frame, encode_frame
+from .run import REPO_DIR, base_data_dir, load_app
+from .synthetic import base_titles, write_dataset
+
+# The grains of the filtered frames, see `rows` in src/backends.py
+GRAINS = ["box", "map", "actor"]
+
+
+def best_time(function, repeat: int):
+    """Returns the result of `function` and its fastest run in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings) * 1000
+
+
+def codecs():
+    """Returns the (encode, decode) functions to compare, by name."""
+    return {
+        "pandas json": (lambda data: data.to_json(), lambda encoded: pd.read_json(io.StringIO(encoded))),
+        **{
+            f"arrow {compression or 'raw'}": (
+                lambda data, compression=compression: encode_frame(data, compression), decode_frame
+            )
+            for compression in COMPRESSIONS
+        }
+    }
+
+
+def measure(data: pd.DataFrame, repeat: int):
+    """Encodes and decodes `data` with every codec, returns one result per codec."""
+    results = {}
+    for name, (encode, decode) in codecs().items():
+        encoded, encode_ms = best_time(lambda: encode(data), repeat)
+        decoded, decode_ms = best_time(lambda: decode(encoded), repeat)
+        results[name] = {
+            "bytes": len(encoded.encode("utf-8")),
+            "encode_ms": round(encode_ms, 2),
+            "decode_ms": round(decode_ms, 2),
+            "dtypes_kept": list(decoded.dtypes) == list(data.dtypes)
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the dataframe codec with pandas' JSON.")
+    parser.add_argument("--scale", type=float, help="Use a synthetic dataset of this scale, see benchmarks.run")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measure, the fastest is kept")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="imdb-codec-") as work_dir:
+        data_dir = base_data_dir()
+        if args.scale:
+            data_dir = os.path.join(work_dir, "data")
+            write_dataset(
+                data_dir, args.scale, base_titles(os.path.join(base_data_dir(), "imdb_2011-2020.feather")),
+                os.path.join(REPO_DIR, "data", "country_codes.csv")
+            )
+        app = load_app(data_dir, work_dir)
+        selections = {
+            "default": (["Action", "Horror", "Romance"], ["United States of America", "India"], [2011, 2020]),
+            "all regions": (["Action", "Horror", "Romance"], sorted(app.dataset_manager.current.backend.regions), [2011, 2020])
+        }
+
+        columns = ["bytes", "encode_ms", "decode_ms", "dtypes_kept"]
+        print(f"{'selection':<13}{'grain':<7}{'rows':>8}  {'codec':<13}" + "".join(f"{column:>12}" for column in columns))
+        for selection, (genres, regions, years) in selections.items():
+            for grain in GRAINS:
+                data = app.dataset_manager.current.backend.rows(genres, regions, years, grain)
+                for name, result in measure(data, args.repeat).items():
+                    print(f"{selection:<13}{grain:<7}{len(data):>8}  {name:<13}"
+                          + "".join(f"{str(result[column]):>12}" for column in columns))
+        app.render_pool.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Compact text encoding of dataframes for `dcc.Store` and other JSON payloads.
+
+A frame is written as an Arrow IPC stream, which stores categoricals as
+dictionary-encoded columns and keeps the pandas metadata (dtypes and
+index), then base64-encoded. `decode_frame` returns a frame equal to the
+encoded one, dtypes included, unlike `DataFrame.to_json` and `pd.read_json`.
+Repeated strings, e.g. the title of a movie on every one of its rows,
+are dictionary-encoded too and decoded back to plain strings.
+"""
+import base64
+import gzip
+import json
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Prefix of every encoded frame, followed by the compression
+FORMAT = "arrow1"
+
+# "zstd" and "lz4" compress the Arrow buffers, "gzip" the whole stream
+COMPRESSIONS = (None, "zstd", "lz4", "gzip")
+
+# Schema metadata listing the string columns dictionary-encoded by `encode_frame`
+DICTIONARY_COLUMNS = b"dictionary_columns"
+
+
+def _dictionary_encode(table: pa.Table):
+    """Dictionary-encodes the string columns with repeated values."""
+    encoded = []
+    for i, field in enumerate(table.schema):
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            column = table.column(i)
+            if pc.count_distinct(column).as_py() * 2 <= len(column):
+                table = table.set_column(i, field.name, pc.dictionary_encode(column))
+                encoded.append(field.name)
+    metadata = {**(table.schema.metadata or {}), DICTIONARY_COLUMNS: json.dumps(encoded).encode("utf-8")}
+    return table.replace_schema_metadata(metadata)
+
+
+def _dictionary_decode(table: pa.Table):
+    """Reverts `_dictionary_encode`."""
+    for name in json.loads((table.schema.metadata or {}).get(DICTIONARY_COLUMNS, b"[]")):
+        i = table.schema.get_field_index(name)
+        table = table.set_column(i, name, table.column(i).cast(table.schema.field(i).type.value_type))
+    return table
+
+
+def encode_frame(data: pd.DataFrame, compression=None):
+    """
+    Encodes a dataframe to a string.
+
+    Parameters
+    ----------
+    data : pandas dataframe
+        The frame to encode.
+    compression : string, optional
+        One of `COMPRESSIONS`.
+
+    Returns
+    -------
+    encoded : string
+        The frame as `arrow1:<compression>:<base64 Arrow IPC stream>`.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression {compression!r}, expected one of {COMPRESSIONS}")
+    table = _dictionary_encode(pa.Table.from_pandas(data, preserve_index=True))
+    options = pa.ipc.IpcWriteOptions(compression=compression if compression in ("zstd", "lz4") else None)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    payload = sink.getvalue().to_pybytes()
+    if compression == "gzip":
+        payload = gzip.compress(payload, compresslevel=6)
+    return f"{FORMAT}:{compression or ''}:{base64.b64encode(payload).decode('ascii')}"
+
+
+def decode_frame(encoded: str):
+    """
+    Decodes a string written by `encode_frame`.
+
+    Parameters
+    ----------
+    encoded : string
+        The encoded frame.
+
+    Returns
+    -------
+    data : pandas dataframe
+        The frame, with its original dtypes and index.
+    """
+    prefix, compression, payload = encoded.split(":", 2)
+    if prefix != FORMAT:
+        raise ValueError(f"Not an encoded frame: {encoded[:20]!r}")
+    payload = base64.b64decode(payload)
+    if compression == "gzip":
+        payload = gzip.decompress(payload)
+    return _dictionary_decode(pa.ipc.open_stream(payload).read_all()).to_pandas()
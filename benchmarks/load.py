@@ -0,0 +1,431 @@
+"""
+Load tests the dashboard with concurrent virtual users.
+
+The command starts `src.app:server` under gunicorn with the repository's
+`gunicorn.conf.py`, or targets a running server with `--url`, and lets
+`--users` virtual users interact with it for `--duration` seconds. Every
+user replays what the browser sends: it toggles genres, picks regions,
+drags the years slider and changes the line chart metric or the number of
+actors, and posts the `_dash-update-component` requests those changes
+trigger, in the order and with the concurrency of the Dash renderer::
+
+    python -m benchmarks.load --users 20 --workers 5 --threads 4
+    python -m benchmarks.load --users 20 --scale 10 --no-render-cache
+
+It reports the throughput, the p50/p95/p99 latency of every output (the
+filter store, `box`, `line`, `map`, `bar` and the KPIs) and the resident
+memory of the gunicorn workers over time.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.kpis import KPIS
+
+from .synthetic import base_titles, write_dataset
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Relative frequency of every interaction
+INTERACTIONS = {
+    "genres": 0.25,
+    "regions": 0.25,
+    "years": 0.2,
+    "ycol": 0.15,
+    "top_n": 0.15
+}
+
+
+def parse_outputs(output: str):
+    """Returns the (id, property) pairs of a Dash dependency's output string."""
+    if output.startswith(".."):
+        return [tuple(item.rsplit(".", 1)) for item in output[2:-2].split("...")]
+    return [tuple(output.rsplit(".", 1))]
+
+
+def output_label(component_id: str):
+    """Groups the outputs of the report, e.g. every KPI under `kpis`."""
+    if component_id in KPIS:
+        return "kpis"
+    if component_id == "filtered-data":
+        return "filter"
+    return component_id.removesuffix("-payload")
+
+
+def find_props(layout, props=None):
+    """Returns the initial value of every property of every component of a Dash layout, by (id, property)."""
+    if props is None:
+        props = {}
+    if isinstance(layout, dict):
+        if "id" in layout.get("props", {}):
+            for name, value in layout["props"].items():
+                props[(layout["props"]["id"], name)] = value
+        for value in layout.values():
+            find_props(value, props)
+    elif isinstance(layout, list):
+        for value in layout:
+            find_props(value, props)
+    return props
+
+
+class Page:
+    """
+    One browser page: the values of the component properties and the callbacks they trigger.
+
+    Parameters
+    ----------
+    url : string
+        Base URL of the app.
+    dependencies : list
+        The app's `/_dash-dependencies`.
+    layout : dict
+        The app's `/_dash-layout`.
+    record : callable
+        Called with (labels, seconds, status) for every request.
+    """
+
+    def __init__(self, url: str, dependencies: list, layout: dict, record):
+        self.url = url
+        self.record = record
+        self.props = find_props(layout)
+        self.callbacks = []
+        for dependency in dependencies:
+            outputs = parse_outputs(dependency["output"])
+            # The request stamp is the only clientside callback with server-side consumers
+            if dependency.get("clientside_function") and outputs != [("request-stamp", "data")]:
+                continue
+            self.callbacks.append({
+                "output": dependency["output"],
+                "outputs": outputs,
+                "inputs": [(item["id"], item["property"]) for item in dependency["inputs"]],
+                "state": [(item["id"], item["property"]) for item in dependency["state"]],
+                "clientside": bool(dependency.get("clientside_function"))
+            })
+        self.session = uuid.uuid4().hex
+        self.seq = 0
+        self.pool = ThreadPoolExecutor(len(self.callbacks), thread_name_prefix="page")
+
+    def _post(self, callback: dict, changed: set):
+        def value(item):
+            return {"id": item[0], "property": item[1], "value": self.props.get(item)}
+        outputs = [{"id": id_, "property": prop} for id_, prop in callback["outputs"]]
+        body = {
+            "output": callback["output"],
+            "outputs": outputs if callback["output"].startswith("..") else outputs[0],
+            "inputs": [value(item) for item in callback["inputs"]],
+            "changedPropIds": [f"{id_}.{prop}" for id_, prop in callback["inputs"] if (id_, prop) in changed],
+            "state": [value(item) for item in callback["state"]]
+        }
+        request = urllib.request.Request(
+            f"{self.url}/_dash-update-component", json.dumps(body).encode("utf-8"),
+            {"Content-Type": "application/json"}
+        )
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as error:
+            status, payload = error.code, b""
+        except OSError:
+            status, payload = 0, b""
+        seconds = time.perf_counter() - start
+
+        updates = {}
+        if status == 200:
+            for id_, props in json.loads(payload)["response"].items():
+                for prop, prop_value in props.items():
+                    updates[(id_, prop)] = prop_value
+        # A 204 (PreventUpdate) is reported under all the callback's outputs
+        labels = sorted({output_label(id_) for id_, _ in (updates or callback["outputs"])})
+        self.record(labels, seconds, status)
+        return updates
+
+    def _stamp(self):
+        self.seq += 1
+        return {("request-stamp", "data"): {"session": self.session, "seq": self.seq}}
+
+    def change(self, values: dict):
+        """
+        Sets some properties and runs the callbacks they trigger, like the Dash renderer.
+
+        The callbacks triggered together are posted concurrently, a callback
+        waits for those whose outputs it reads.
+        """
+        self.props.update(values)
+        changed = set(values)
+        while changed:
+            triggered = [callback for callback in self.callbacks if changed & set(callback["inputs"])]
+            # Every output the triggered callbacks will update, directly or through other callbacks
+            pending = set()
+            downstream = triggered
+            while downstream:
+                outputs = {output for callback in downstream for output in callback["outputs"]} - pending
+                pending |= outputs
+                downstream = [callback for callback in self.callbacks if outputs & set(callback["inputs"])]
+            ready = [callback for callback in triggered if not pending & set(callback["inputs"])]
+            deferred = {item for callback in triggered if callback not in ready for item in callback["inputs"]}
+
+            updates = {}
+            futures = []
+            for callback in ready:
+                if callback["clientside"]:
+                    updates.update(self._stamp())
+                else:
+                    futures.append(self.pool.submit(self._post, callback, changed))
+            for future in futures:
+                updates.update(future.result())
+            self.props.update(updates)
+            changed = set(updates) | (changed & deferred)
+
+    def close(self):
+        self.pool.shutdown()
+
+
+def interaction(page: Page, rng: random.Random):
+    """Picks the next interaction of a user and returns the properties it changes."""
+    kind = rng.choices(list(INTERACTIONS), weights=list(INTERACTIONS.values()))[0]
+    if kind == "genres":
+        options = [option["value"] for option in page.props[("genres-checklist", "options")]]
+        genres = set(page.props[("genres-checklist", "value")]) ^ {rng.choice(options)}
+        return {("genres-checklist", "value"): sorted(genres) or [rng.choice(options)]}
+    if kind == "regions":
+        options = [option["value"] for option in page.props[("region-checklist", "options")]]
+        return {("region-checklist", "value"): rng.sample(options, rng.randint(1, 5))}
+    if kind == "years":
+        low, high = page.props[("years-range", "min")], page.props[("years-range", "max")]
+        return {("years-range", "value"): sorted([rng.randint(low, high), rng.randint(low, high)])}
+    if kind == "ycol":
+        options = [option["value"] for option in page.props[("ycol", "options")]]
+        return {("ycol", "value"): rng.choice([option for option in options if option != page.props[("ycol", "value")]])}
+    return {("top_n", "value"): rng.randint(page.props[("top_n", "min")], page.props[("top_n", "max")])}
+
+
+def virtual_user(url: str, dependencies: list, layout: dict, record, deadline: float, think: float, seed: int):
+    """Loads the page, then interacts with it until `deadline`, returns the number of interactions."""
+    rng = random.Random(seed)
+    page = Page(url, dependencies, layout, record)
+    # The initial call of every callback, as on page load
+    page.change({item: page.props.get(item) for callback in page.callbacks for item in callback["inputs"]})
+    interactions = 0
+    while time.monotonic() < deadline:
+        time.sleep(rng.expovariate(1 / think) if think else 0)
+        page.change(interaction(page, rng))
+        interactions += 1
+    page.close()
+    return interactions
+
+
+def worker_pids(master: int):
+    """Returns the pids of the child processes of `master`."""
+    pids = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as stat:
+                    # The command name, in parentheses, may contain spaces
+                    if int(stat.read().rsplit(")", 1)[1].split()[1]) == master:
+                        pids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    return pids
+
+
+def resident_memory(pid: int):
+    """Returns the resident set size of a process in bytes, 0 if it is gone."""
+    try:
+        with open(f"/proc/{pid}/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def sample_memory(master: int, interval: float, stop: threading.Event, samples: list):
+    """Appends (seconds, [worker RSS in MiB]) to `samples` every `interval` until `stop` is set."""
+    start = time.monotonic()
+    while not stop.wait(interval):
+        samples.append((
+            round(time.monotonic() - start, 1),
+            [round(resident_memory(pid) / 1024 ** 2, 1) for pid in sorted(worker_pids(master))]
+        ))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int, workers: int, threads: int, env: dict):
+    """Starts gunicorn and waits until the app answers."""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "src.app:server"],
+        cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        env={**os.environ, **env, "PORT": str(port), "WEB_CONCURRENCY": str(workers), "IMDB_WORKER_THREADS": str(threads)}
+    )
+    for _ in range(600):
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {server.returncode}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/_dash-layout", timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("gunicorn did not start within 60 seconds")
+
+
+def summarize(requests: list, elapsed: float, interactions: int):
+    """
+    Computes the throughput and the latency percentiles of every output.
+
+    Parameters
+    ----------
+    requests : list
+        (labels, seconds, status) of every request.
+    elapsed : float
+        Duration of the test in seconds.
+    interactions : int
+        Number of user interactions.
+
+    Returns
+    -------
+    summary : dict
+        The totals and, by output, the request count, errors and latency percentiles in milliseconds.
+    """
+    outputs = {}
+    for labels, seconds, status in requests:
+        for label in labels:
+            stats = outputs.setdefault(label, {"timings": [], "errors": 0})
+            stats["timings"].append(seconds)
+            stats["errors"] += status not in (200, 204)
+    summary = {
+        "requests": len(requests),
+        "requests_per_s": round(len(requests) / elapsed, 1),
+        "interactions_per_s": round(interactions / elapsed, 1),
+        "errors": sum(status not in (200, 204) for _, _, status in requests),
+        "outputs": {}
+    }
+    for label, stats in sorted(outputs.items()):
+        p50, p95, p99 = np.percentile(np.array(stats["timings"]) * 1000, [50, 95, 99])
+        summary["outputs"][label] = {
+            "requests": len(stats["timings"]),
+            "errors": stats["errors"],
+            "p50_ms": round(float(p50), 1),
+            "p95_ms": round(float(p95), 1),
+            "p99_ms": round(float(p99), 1)
+        }
+    return summary
+
+
+def report(summary: dict, memory: list):
+    """Prints the summary and the memory curve."""
+    print(f"{summary['requests']} requests, {summary['requests_per_s']} requests/s, "
+          f"{summary['interactions_per_s']} interactions/s, {summary['errors']} errors")
+    columns = ["requests", "errors", "p50_ms", "p95_ms", "p99_ms"]
+    print(f"{'output':<15}" + "".join(f"{column:>10}" for column in columns))
+    for label, stats in summary["outputs"].items():
+        print(f"{label:<15}" + "".join(f"{stats[column]:>10}" for column in columns))
+    if memory:
+        print("Worker resident memory (MiB)")
+        step = max(len(memory) // 10, 1)
+        for seconds, workers in memory[::step] + ([memory[-1]] if (len(memory) - 1) % step else []):
+            print(f"{seconds:>8.1f}s  total {sum(workers):>8.1f}  " + " ".join(f"{rss:.1f}" for rss in workers))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the dashboard with concurrent virtual users.")
+    parser.add_argument("--url", help="A running app to target, by default gunicorn is started")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds of interactions per user")
+    parser.add_argument("--think", type=float, default=1.0, help="Mean seconds between two interactions of a user")
+    parser.add_argument("--workers", type=int, default=5, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=4, help="Threads per gunicorn worker")
+    parser.add_argument("--scale", type=float, help="Serve a synthetic dataset of this scale, see benchmarks.run")
+    parser.add_argument("--no-render-cache", action="store_true", help="Disable the render cache")
+    parser.add_argument("--memory-interval", type=float, default=1.0, help="Seconds between two memory samples")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the summary and the memory samples to this JSON file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="imdb-load-") as work_dir:
+        server = None
+        if args.url:
+            url = args.url.rstrip("/")
+        else:
+            # Fresh request registry and render cache, nothing is warm before the test
+            env = {
+                "IMDB_REQUEST_REGISTRY_PATH": os.path.join(work_dir, "requests.sqlite"),
+                "IMDB_RENDER_CACHE_PATH": os.path.join(work_dir, "renders.sqlite")
+            }
+            if args.no_render_cache:
+                env["IMDB_RENDER_CACHE_BYTES"] = "0"
+            if args.scale:
+                from src.config import DATA_PATH
+
+                env["IMDB_DATA_DIR"] = os.path.join(work_dir, "data")
+                rows = write_dataset(
+                    env["IMDB_DATA_DIR"], args.scale, base_titles(DATA_PATH),
+                    os.path.join(REPO_DIR, "data", "country_codes.csv"), args.seed
+                )
+                print(f"Scale {args.scale:g}: {rows} rows")
+            port = free_port()
+            server = start_server(port, args.workers, args.threads, env)
+            url = f"http://127.0.0.1:{port}"
+
+        try:
+            with urllib.request.urlopen(f"{url}/_dash-dependencies") as response:
+                dependencies = json.load(response)
+            with urllib.request.urlopen(f"{url}/_dash-layout") as response:
+                layout = json.load(response)
+
+            memory = []
+            stop = threading.Event()
+            if server is not None:
+                sampler = threading.Thread(
+                    target=sample_memory, args=(server.pid, args.memory_interval, stop, memory), daemon=True
+                )
+                sampler.start()
+
+            requests = []
+
+            def record(labels, seconds, status):
+                requests.append((labels, seconds, status))
+
+            print(f"{args.users} users for {args.duration:g}s against {url}")
+            start = time.monotonic()
+            with ThreadPoolExecutor(args.users, thread_name_prefix="user") as users:
+                interactions = sum(future.result() for future in [
+                    users.submit(virtual_user, url, dependencies, layout, record,
+                                 start + args.duration, args.think, args.seed + user)
+                    for user in range(args.users)
+                ])
+            elapsed = time.monotonic() - start
+            stop.set()
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    summary = summarize(requests, elapsed, interactions)
+    report(summary, memory)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({**summary, "users": args.users, "memory_mib": memory}, file, indent=2)
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
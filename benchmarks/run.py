@@ -0,0 +1,255 @@
+"""
+Benchmarks the callback and chart generation hot paths on synthetic data.
+
+A synthetic dataset `--scale` times the size of the current feather file is
+written to a temporary data directory and loaded by the app. Every
+benchmark then runs over a matrix of filter selections and reports its
+latency percentiles, the peak memory it allocates and the size of what it
+returns::
+
+    python -m benchmarks.run --scale 10 --save-baseline benchmarks/baseline-10x.json
+    python -m benchmarks.run --scale 10 --baseline benchmarks/baseline-10x.json
+
+With `--baseline`, the command fails when a benchmark got slower or used
+more memory than the baseline allows.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from src.cache import size_of
+
+from .synthetic import base_titles, write_dataset
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def base_data_dir():
+    """
+    Returns the data directory of `src.config`, without importing it.
+
+    `src.config` reads the environment once, when it is imported, so it
+    must not be imported before `load_app` has set the environment.
+    """
+    return os.environ.get("IMDB_DATA_DIR", "/app/data")
+
+
+def load_app(data_dir: str, work_dir: str):
+    """Imports `src.app` on the data in `data_dir`, without any cache kept across runs."""
+    if "src.config" in sys.modules:
+        raise RuntimeError("src.config was imported before the benchmark environment was set")
+    os.environ["IMDB_DATA_DIR"] = data_dir
+    os.environ["IMDB_SHARED_DATA"] = "0"
+    os.environ["IMDB_RENDER_CACHE_BYTES"] = "0"
+    os.environ["IMDB_RELOAD_INTERVAL"] = "0"
+    os.environ["IMDB_REQUEST_REGISTRY_PATH"] = os.path.join(work_dir, "requests.sqlite")
+    from src import app
+    return app
+
+
+def selections(app):
+    """Returns the matrix of (genres, regions, years) filter selections."""
+    genres = sorted(app.dataset_manager.current.backend.genres)
+    regions = sorted(app.dataset_manager.current.backend.regions)
+    return list(itertools.product(
+        [genres[:1], ["Action", "Horror", "Romance"], genres],
+        [["United States of America", "India"], regions[:20], regions],
+        [[2011, 2020], [2015, 2015], [2013, 2017]]
+    ))
+
+
+def payload_size(value):
+    """Returns the size in bytes of a rendered chart or list of them as sent to the browser, or of a query result."""
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, pd.DataFrame):
+        return size_of(value)  # In memory, the frame is never sent as it is
+    return len(json.dumps(value).encode("utf-8"))
+
+
+def benchmarks(app):
+    """
+    Builds every benchmark.
+
+    Each benchmark turns a filter selection into a zero-argument function
+    running the timed code. The data the function needs is prepared
+    beforehand and not timed. The backend queries are timed on their
+    own, the `serve_*` functions, the KPIs and the chart callback as on
+    the first request for a selection, with the result cache emptied.
+    """
+    dataset = app.dataset_manager.current
+    backend = dataset.backend
+
+    def uncached(function):
+        def run():
+            app.filtered_cache.clear()
+            return function()
+        return run
+
+    def serve(function, *args):
+        def build(genres, regions, years):
+            store = app.update_data(None, genres, regions, years)
+            return uncached(lambda: function(dataset, store, *args))
+        return build
+
+    def update_kpis(genres, regions, years):
+        store = app.update_data(None, genres, regions, years)
+        return uncached(lambda: app.update_kpis(store))
+
+    def serve_charts(genres, regions, years):
+        store = app.update_data(None, genres, regions, years)
+        return uncached(lambda: list(app.render_charts(store, "averageRating", 10, app.CHART_SPECS).values()))
+
+    return {
+        "summary": lambda genres, regions, years: lambda: backend.summary(genres, regions, years),
+        "box_data": lambda genres, regions, years: lambda: backend.box_data(genres, regions, years),
+        "line_series": lambda genres, regions, years: lambda: backend.line_series(genres, regions, years),
+        "top_rated": lambda genres, regions, years: lambda: backend.top_rated(genres, years),
+        "top_actors": lambda genres, regions, years: lambda: backend.top_actors(genres, regions, years),
+        "serve_box_plot": serve(app.serve_box_plot),
+        "serve_line_plot": serve(app.serve_line_plot, "averageRating"),
+        "serve_map": serve(app.serve_map),
+        "serve_bar_chart": serve(app.serve_bar_chart, 10),
+        "update_kpis": update_kpis,
+        "serve_charts": serve_charts
+    }
+
+
+def measure(build, matrix: list, repeat: int):
+    """
+    Runs one benchmark over every selection.
+
+    Parameters
+    ----------
+    build : callable
+        Turns a selection into the function to time.
+    matrix : list
+        The (genres, regions, years) selections.
+    repeat : int
+        Timed runs per selection, after one untimed warm-up run.
+
+    Returns
+    -------
+    result : dict
+        Latency percentiles in milliseconds, peak traced memory in KiB and
+        mean payload size in bytes.
+    """
+    timings = []
+    peaks = []
+    sizes = []
+    for genres, regions, years in matrix:
+        run = build(genres, regions, years)
+        sizes.append(payload_size(run()))
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+
+        # Separate run, tracing allocations slows the code down
+        tracemalloc.start()
+        run()
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    p50, p95, p99 = np.percentile(np.array(timings) * 1000, [50, 95, 99])
+    return {
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "peak_kib": round(max(peaks) / 1024, 1),
+        "payload_bytes": int(np.mean(sizes))
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """
+    Compares results with a baseline.
+
+    Parameters
+    ----------
+    results : dict
+        The results of this run, by benchmark.
+    baseline : dict
+        The results of the baseline run, by benchmark.
+    tolerance : float
+        Allowed relative increase of the p95 latency and the peak memory.
+
+    Returns
+    -------
+    regressions : list
+        One message per regressed metric.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric in ["p95_ms", "peak_kib"]:
+            before, after = baseline[name][metric], result[metric]
+            if after > before * (1 + tolerance):
+                regressions.append(f"{name} {metric}: {before} -> {after} (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def report(results: dict):
+    """Prints the results as a table."""
+    columns = ["p50_ms", "p95_ms", "p99_ms", "peak_kib", "payload_bytes"]
+    print(f"{'benchmark':<20}" + "".join(f"{column:>15}" for column in columns))
+    for name, result in results.items():
+        print(f"{name:<20}" + "".join(f"{result[column]:>15}" for column in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard hot paths on synthetic data.")
+    parser.add_argument("--scale", type=float, default=1, help="Dataset size relative to the current feather file")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per selection")
+    parser.add_argument("--only", nargs="*", help="Benchmarks to run, all by default")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="imdb-benchmarks-") as work_dir:
+        data_dir = os.path.join(work_dir, "data")
+        base = base_titles(os.path.join(base_data_dir(), "imdb_2011-2020.feather"))
+        rows = write_dataset(
+            data_dir, args.scale, base, os.path.join(REPO_DIR, "data", "country_codes.csv"), args.seed
+        )
+        print(f"Scale {args.scale:g}: {int(base * args.scale)} movies, {rows} rows")
+        app = load_app(data_dir, work_dir)
+        matrix = selections(app)
+
+        results = {}
+        for name, build in benchmarks(app).items():
+            if not args.only or name in args.only:
+                results[name] = measure(build, matrix, args.repeat)
+        app.render_pool.shutdown()
+
+    report(results)
+    output = {"scale": args.scale, "rows": rows, "selections": len(matrix), "results": results}
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(output, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline["scale"] != args.scale:
+            print(f"Warning: the baseline was measured at scale {baseline['scale']:g}")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
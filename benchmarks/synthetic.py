@@ -0,0 +1,109 @@
+"""
+Synthetic IMDb-shaped datasets for the benchmarks.
+
+The rows look like the cleaned `imdb_2011-2020.feather`: one row per
+(movie, actor, genre, region), with 1 to 3 genres, 1 to 3 regions and
+0 to 4 actors per movie, about 10% missing ratings and 5% missing runtimes.
+"""
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from src.constants import genre_color_map
+
+# Movies in the 1x dataset when there is no feather file to measure
+BASE_TITLES = 20_000
+
+
+def base_titles(data_path: str):
+    """Returns the number of movies in the current feather file, or `BASE_TITLES` if it is missing."""
+    if not os.path.exists(data_path):
+        return BASE_TITLES
+    return pd.read_feather(data_path, columns=["tconst"])["tconst"].nunique()
+
+
+def _pick(rng, n_titles: int, choices: int, low: int, high: int):
+    """Draws between `low` and `high` distinct choices per movie, returns (title, choice) pairs."""
+    counts = rng.integers(low, high + 1, n_titles)
+    titles = np.repeat(np.arange(n_titles), counts)
+    pairs = pd.DataFrame({"title": titles, "choice": rng.integers(0, choices, len(titles))})
+    return pairs.drop_duplicates()
+
+
+def make_dataset(n_titles: int, regions: list, seed=0):
+    """
+    Generates a synthetic dataset.
+
+    Parameters
+    ----------
+    n_titles : int
+        Number of movies.
+    regions : list
+        The `alpha_2` region codes to draw from.
+    seed : int
+        Seed of the random generator.
+
+    Returns
+    -------
+    data : pandas dataframe
+        The rows, with the columns of the cleaned feather file.
+    """
+    rng = np.random.default_rng(seed)
+    genres = np.array(list(genre_color_map))
+    titles = pd.DataFrame({
+        "title": np.arange(n_titles),
+        "tconst": [f"tt{i:08d}" for i in range(n_titles)],
+        "primaryTitle": [f"Title {i}" for i in range(n_titles)],
+        "startYear": rng.integers(2011, 2021, n_titles).astype("float64"),
+        "runtimeMinutes": np.where(rng.random(n_titles) < 0.05, np.nan, rng.integers(60, 180, n_titles)),
+        "averageRating": np.where(rng.random(n_titles) < 0.1, np.nan, rng.integers(10, 101, n_titles) / 10)
+    })
+
+    title_genres = _pick(rng, n_titles, len(genres), 1, 3)
+    title_genres["genres"] = genres[title_genres.pop("choice")]
+    title_regions = _pick(rng, n_titles, len(regions), 1, 3)
+    title_regions["region"] = np.asarray(regions, dtype=object)[title_regions.pop("choice")]
+    title_actors = _pick(rng, n_titles, 2 * n_titles, 0, 4)
+    title_actors["primaryName"] = "Actor " + title_actors.pop("choice").astype(str)
+
+    # Movies without actors keep one row with a missing name
+    data = titles.merge(title_actors, on="title", how="left")
+    data = data.merge(title_genres, on="title").merge(title_regions, on="title")
+    data = data.drop(columns="title")
+    data.insert(0, "Unnamed: 0", np.arange(len(data)))
+    return data[[
+        "Unnamed: 0", "tconst", "primaryTitle", "startYear", "runtimeMinutes",
+        "averageRating", "region", "primaryName", "genres"
+    ]]
+
+
+def write_dataset(directory: str, scale: float, base: int, codes_path: str, seed=0):
+    """
+    Writes a synthetic dataset and the region lookup table the app reads.
+
+    Parameters
+    ----------
+    directory : string
+        The data directory to create, used as `IMDB_DATA_DIR`.
+    scale : float
+        Size of the dataset relative to `base` movies.
+    base : int
+        Number of movies at scale 1.
+    codes_path : string
+        The `country_codes.csv` file to copy.
+    seed : int
+        Seed of the random generator.
+
+    Returns
+    -------
+    rows : int
+        Number of rows written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    shutil.copy(codes_path, os.path.join(directory, "country_codes.csv"))
+    regions = pd.read_csv(codes_path, usecols=["alpha_2"])["alpha_2"].dropna().tolist()
+    data = make_dataset(max(int(base * scale), 1), regions, seed)
+    data.to_feather(os.path.join(directory, "imdb_2011-2020.feather"))
+    return len(data)
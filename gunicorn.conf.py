@@ -0,0 +1,21 @@
+import os
+
+# Threaded workers: the chart, KPI and spec requests of one interaction are
+# served concurrently by a worker instead of queueing behind each other.
+# Every worker also renders the charts of a request in its own render pool
+# (IMDB_RENDER_THREADS), see `serve_charts` in src/app.py.
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", 5))
+threads = int(os.environ.get("IMDB_WORKER_THREADS", 4))
+
+# Load the app, and build the shared dataset files, once before forking
+preload_app = True
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+
+
+def post_fork(server, worker):
+    # Every worker checks the dataset files for a new version from the start, see src/datasets.py
+    from src.app import dataset_manager
+
+    dataset_manager.watch()
@@ -1,501 +1,927 @@
 
-from dash import Dash, html, dcc, Input, Output, State
-import altair as alt
+from .timing import PhaseTimer
+
+startup = PhaseTimer("Startup")  # Reported once the app is ready
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from importlib.metadata import version
+
+from dash import Dash, html, dcc, Input, Output, State, ClientsideFunction, callback_context, no_update
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
-import pandas as pd
+import flask
 
+import logging
+import os
 import sys
 sys.path.append("/app/")
-from .boxplot import generate_box_plot
-from .line_plot import generate_line_plot
-from .bar_chart import generate_bar_chart
-from .map_plot import generate_map
+from .boxplot import box_plot_spec
+from .line_plot import line_plot_data, line_plot_spec
+from .bar_chart import EMBED_OPTIONS as BAR_EMBED_OPTIONS, TOP_K, bar_chart_data, bar_chart_spec
+from .map_plot import WORLD_MAP_FILE, map_data, map_spec
+from .rendering import VEGA_ASSETS, chart_payload, render_html, spec_url, vega_libraries
+from .cache import RenderCache, ResultCache, filter_key, render_key
+from .backends import DuckDBBackend, PandasBackend
+from .datasets import Dataset, DatasetManager
+from .instrumentation import (install as install_instrumentation, count_rows, instrument_callbacks, instrumented,
+                              metrics)
+from .responses import install as install_responses
+from .kpis import KPIS, compute_kpis
+from .schema import StarSchema
+from .search import search_option
+from .sessions import LatestRequests
+from .config import (COUNTRY_CODES_PATH, DATA_PATH, LOG_LEVEL, QUERY_BACKEND, QUERY_DATA_PATH, RELOAD_INTERVAL,
+                     RENDER_CACHE_BYTES, RENDER_CACHE_PATH, RENDER_MODE, RENDER_THREADS, REQUEST_REGISTRY_PATH,
+                     RESULT_CACHE_BYTES, SHARED_DATA, SHARED_DATA_PATH)
+from .loader import dataset_version, load_dataset, load_shared_tables
+
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+startup.mark("imports")
+
+# Type-ahead search over every actor and movie name
+SEARCH_LIMIT = 10
+
+
+def load_data(version: str, timer=None):
+    """
+    Loads a version of the dataset files and builds everything derived from them.
+
+    Parameters
+    ----------
+    version : string
+        The `dataset_version` of the files.
+    timer : PhaseTimer, optional
+        Times the loading and the indexing, a reload is timed and logged on its own.
+
+    Returns
+    -------
+    dataset : Dataset
+        The query backend and the search index of the version.
+    """
+    report = timer is None
+    timer = timer or PhaseTimer(f"Loading dataset version {version}")
+    if QUERY_BACKEND == "duckdb":
+        # Queries the data files, nothing but the results is held in memory
+        backend = DuckDBBackend(QUERY_DATA_PATH, COUNTRY_CODES_PATH, TOP_K)
+        timer.mark("data")
+    else:
+        if SHARED_DATA:
+            # Stored in filter index order so that the index can use the mapped rows as they are
+            schema = StarSchema.from_tables(load_shared_tables(
+                DATA_PATH, COUNTRY_CODES_PATH, SHARED_DATA_PATH,
+                build=lambda frame: StarSchema.from_rows(frame).tables
+            ))
+        else:
+            schema = StarSchema.from_rows(load_dataset(DATA_PATH, COUNTRY_CODES_PATH))
+        timer.mark("data")
+        backend = PandasBackend(schema, TOP_K)
+    search_index = backend.search_index
+    timer.mark("indexes")
+    if report:
+        timer.report()
+    return Dataset(version, backend, search_index)
+
+
+# The dataset of the current version of the files, swapped for a new one when they change
+DATASET_PATHS = [QUERY_DATA_PATH if QUERY_BACKEND == "duckdb" else DATA_PATH, COUNTRY_CODES_PATH]
+dataset_manager = DatasetManager(
+    DATASET_PATHS, load_data, RELOAD_INTERVAL, current=load_data(dataset_version(*DATASET_PATHS), startup)
+)
+
+# Filtered datasets live server-side, the browser only holds their key, prefixed with the dataset version
+filtered_cache = ResultCache(RESULT_CACHE_BYTES)
+# Latest filter update of every session, older ones are dropped
+latest_requests = LatestRequests(REQUEST_REGISTRY_PATH)
+# Renders the charts of one interaction concurrently, its threads start on first use
+render_pool = ThreadPoolExecutor(RENDER_THREADS, thread_name_prefix="render")
+# Rendered charts on disk, a new dataset or render setup never reuses older ones
+render_cache = RenderCache(RENDER_CACHE_PATH, RENDER_CACHE_BYTES)
+
+
+def cache_counters():
+    """Returns the hits and misses of the caches by the function looking them up, and the reloads."""
+    counters = {"imdb_dataset_reloads_total": dataset_manager.reloads}
+    for cache, lookups in [("result", filtered_cache.lookups), ("render", render_cache.lookups)]:
+        for function, (hits, misses) in list(lookups.items()):
+            label = f'{{function="{function}"}}' if function else ""
+            counters[f"imdb_{cache}_cache_hits_total{label}"] = hits
+            counters[f"imdb_{cache}_cache_misses_total{label}"] = misses
+    return counters
+
+
+if metrics is not None:
+    metrics.collectors.append(cache_counters)
+    metrics.shared_collectors.append(lambda: {"imdb_stale_requests_skipped_total": latest_requests.stale_skipped})
+# Static files of the page, including the vendored third-party files, see src/vendor_assets.py
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+# Everything besides the dataset version the rendered charts depend on
+RENDER_SETUP = ":".join([
+    version("altair"), RENDER_MODE, QUERY_BACKEND,
+    "vendored" if os.path.isdir(os.path.join(ASSETS_DIR, VEGA_ASSETS)) else "cdn"
+])
+
+
+def render_version(dataset: Dataset):
+    """Identifies the dataset and the render setup of the rendered charts, see `render_key`."""
+    return f"{dataset.version}:{RENDER_SETUP}"
+
+
+def evict_stale(old: Dataset, new: Dataset):
+    """Drops the cached results and rendered charts of the previous dataset versions."""
+    filtered_cache.evict(lambda key: key.startswith(f"{new.version}:"))
+    # The other workers may still render the previous version until their next checks
+    render_cache.evict(render_version(new), idle=2 * RELOAD_INTERVAL)
+
+
+dataset_manager.listeners.append(evict_stale)
+
+# Spec builders of every chart, compiled once per set of static parameters
+CHART_SPECS = {
+    "box": box_plot_spec,
+    "line": line_plot_spec,
+    "bar": bar_chart_spec,
+    "map": map_spec
+}
+
+# The y-axes of the line chart
+YCOLS = ["averageRating", "runtimeMinutes"]
+
+# Inputs the browser applies to the payload of a persistent Vega view, see src/assets/vega_views.js
+BROWSER_INPUTS = {"line": "ycol", "bar": "top_n"} if RENDER_MODE == "vega" else {}
+
+
+def chart_container(chart_id: str, style: dict, loading: dict):
+    """
+    Builds the element a chart is drawn in.
+
+    In "html" render mode this is an iframe receiving a full HTML document
+    on every update. In "vega" mode it is a div holding a persistent Vega
+    view, fed by a store that only receives the chart's data.
+
+    Parameters
+    ----------
+    chart_id : string
+        Id of the chart element.
+    style : dict
+        Style of the chart element.
+    loading : dict
+        Arguments of the `dcc.Loading` spinner used in "html" mode.
+
+    Returns
+    -------
+    container : dash component
+        The chart element.
+    """
+    if RENDER_MODE == "vega":
+        # No loading spinner, the view is updated in place and must stay mounted
+        return html.Div([
+            dcc.Store(id=f"{chart_id}-payload"),
+            html.Div(id=chart_id, style=style)
+        ])
+    return dcc.Loading(children=html.Iframe(id=chart_id, style=style), **loading)
+
 
-alt.data_transformers.disable_max_rows()
-alt.renderers.set_embed_options(actions=False)
-data = pd.read_feather("/app/data/imdb_2011-2020.feather")
-country_codes = pd.read_csv("/app/data/country_codes.csv")
+def chart_output(chart_id: str):
+    """Returns the callback output a chart is rendered to in the configured render mode."""
+    if RENDER_MODE == "vega":
+        return Output(f"{chart_id}-payload", "data")
+    return Output(chart_id, "srcDoc")
+
+
+def render_chart(chart: str, datasets: dict, embed_options=None, **params):
+    """
+    Renders a chart for the configured render mode.
+
+    Parameters
+    ----------
+    chart : string
+        One of the `CHART_SPECS` names.
+    datasets : dict
+        Maps every dataset name of the chart's spec to its values.
+    embed_options : dict, optional
+        Options passed to vega-embed.
+    **params
+        The static parameters of the chart's spec.
+
+    Returns
+    -------
+    chart : string or dict
+        The chart's HTML document in "html" mode, its data-only payload in "vega" mode.
+    """
+    if RENDER_MODE == "vega":
+        url = spec_url(app.config.requests_pathname_prefix, chart, **params)
+        return chart_payload(url, datasets, embed_options)
+    return render_html(CHART_SPECS[chart](**params), datasets, embed_options, vega_scripts())
+
+
+@lru_cache(maxsize=None)
+def vega_scripts():
+    """Returns the URLs of the Vega libraries, the vendored ones where present and the CDN's otherwise."""
+    missing = [path for path, _ in vega_libraries() if not os.path.exists(os.path.join(ASSETS_DIR, path))]
+    if missing:
+        logger.warning("%s not vendored, the charts load them from the CDN, see src/vendor_assets.py", ", ".join(missing))
+    return [url if path in missing else app.get_asset_url(path) for path, url in vega_libraries()]
 
-data = pd.merge(data, country_codes, left_on="region", right_on="alpha_2")
 
 # Setup app and layout/frontend
-app = Dash(__name__, external_stylesheets=[dbc.themes.CYBORG])
+# The vendored Vega libraries are only loaded where needed, see `vega_scripts`
+app = Dash(
+    __name__, external_stylesheets=[dbc.themes.CYBORG], assets_folder=ASSETS_DIR, assets_path_ignore=[f"^{VEGA_ASSETS}$"]
+)
 app.title = "IMDb Dashboard"
 server = app.server
-app.layout = dbc.Container([
-    dcc.Store(id="filtered-data"),  # Used to store the data as it is filtered
+
+# The world map is served from the assets once vendored, see src/vendor_assets.py
+if os.path.exists(os.path.join(ASSETS_DIR, WORLD_MAP_FILE)):
+    CHART_SPECS["map"] = partial(map_spec, app.get_asset_url(WORLD_MAP_FILE))
+else:
+    logger.warning("%s is not vendored, the map loads it from the CDN, see src/vendor_assets.py", WORLD_MAP_FILE)
+
+# The persistent Vega views need the Vega runtime in the page itself, loaded once for all charts
+if RENDER_MODE == "vega":
+    app.config.external_scripts.extend(vega_scripts())
+
+def build_layout(backend):
+    """Builds the page, with the filter options of a dataset's query backend."""
+    return dbc.Container([
+        dcc.Store(id="filtered-data"),  # Used to store the key of the filtered data
+        dcc.Store(id="request-stamp"),  # Session id and number of the latest filter update
     
-    # First row containing only the title
-    dbc.Row([
-        dbc.Col([
-            html.Img(
-                src=app.get_asset_url("projector.gif"),
-                id="projector",
-                style={'width': "120%"}
-            )
-        ],
-        width=1),
-        dbc.Col([
-            html.Div([
-                html.Div(
-                    "IMDb Dashboard",
-                    style={'font-size': 50, 'display': "inline", 'color': "#DBA506"}
-                ),
-                html.Div("Plan your next movie.",
-                    style={'font-size': 20, 'display': "flex", 'position': "absolute", 'top': 40, 'right': 30, 'color': "#F2DB83"}
-                )
-            ]),
-            html.Div([
-                html.I(
-                    html.Img(
-                        src=app.get_asset_url("info-64.png"),
-                        id="info",
-                        style={'width': "100%", 'background': "#000000"}
-                    ),
-                    id="collapse-button",
-                    n_clicks=0,
-                    style={'width': "2%", 'position': "absolute", 'top': 38, 'right': 3, 'color': "#DBA506", 'margin': 0}
-                ),
-                dbc.Collapse(
-                    dbc.Card(dbc.CardBody("The IMDb dashboard is primarily targeted towards movie producers to present a consolidated crisp view of the average ratings and runtime for movies by genres and regions with interactive abilities to help them choose and plan their next movie.")),
-                    id="collapse",
-                    is_open=False,
-                    style={'width': "100%", 'position': "absolute", 'top': 72, 'left': 0, 'zIndex': 999, 'color': "#DBA506", 'background': "#000000", 'border': "3px solid gold"},
+        # First row containing only the title
+        dbc.Row([
+            dbc.Col([
+                html.Img(
+                    src=app.get_asset_url("projector.gif"),
+                    id="projector",
+                    style={'width': "120%"}
                 )
-            ])
-        ],
-        width=11,
-        style={'position': "relative"}
-        )
-    ],
-    style={'height': "70px"}
-    ),
-
-    # Second row containing reel image and KPIs
-    dbc.Row([
-        html.Div([
-            # Reel image
-            html.Img(
-                src=app.get_asset_url("reel.png"),
-                id="reel",
-                style={'width': "100%", 'height': "200px", 'background': "#DBA506"}
-            ),
-            # KPI: Total Movies
-            html.Div([
-                dbc.Row([
-                    html.Strong(
-                        html.Div(
-                            "Total Movies",
-                            style={'fontSize': 20, 'display': "inline-block", 'position': "absolute", 'top': 50, 'left': "9.5%", 'textAlign': "center", 'color': "#000000"}
-                        )
-                    ),
+            ],
+            width=1),
+            dbc.Col([
+                html.Div([
                     html.Div(
-                        html.H2(
-                            dcc.Loading(
-                                children=[html.Div(id="total_movies")],
-                                style={'display': "flex", 'position': "absolute", 'top': 0, 'left': 30}
-                            ),
-                            style={'display': "flex", 'position': "absolute", 'top': 80, 'left': "10%", 'textAlign': "center", 'color': "#000000"}
-                        )
-                    )
-                ])
-            ]),
-            # KPI: Total Actors
-            html.Div([
-                dbc.Row([
-                    html.Strong(
-                        html.Div(
-                            "Total Actors",
-                            style={'fontSize': 20, 'display': "flex", 'position': "absolute", 'top': 50, 'left': "34.2%", 'textAlign': "center", 'color': "#000000"}
-                        )
-                    ),
-                    html.Div(
-                        html.H2(
-                            dcc.Loading(
-                                children=[html.Div(id="total_actors")],
-                                style={'display': "flex", 'position': "absolute", 'top': 0, 'left': 30}
-                            ),
-                            style={'display': "flex", 'position': "absolute", 'top': 80, 'left': "34.3%", 'textAlign': "center", 'color': "#000000"}
-                        )
-                    )
-                ])
-            ]),
-            # KPI: Average Runtime
-            html.Div([
-                dbc.Row([
-                    html.Strong(
-                        html.Div(
-                            "Average Runtime",
-                            style={'fontSize': 20, 'display': "flex", 'position': "absolute", 'top': 50, 'right': "32.8%", 'textAlign': "center", 'color': "#000000"}
-                        )
+                        "IMDb Dashboard",
+                        style={'font-size': 50, 'display': "inline", 'color': "#DBA506"}
                     ),
-                    html.Div(
-                        html.H2(
-                            dcc.Loading(
-                                children=[html.Div(id="avg_runtime")],
-                                style={'display': "flex", 'position': "absolute", 'top': 0, 'right': 0}
-                            ),
-                            style={'display': "flex", 'position': "absolute", 'top': 80, 'right': "37%", 'textAlign': "center", 'color': "#000000"}
-                        )
+                    html.Div("Plan your next movie.",
+                        style={'font-size': 20, 'display': "flex", 'position': "absolute", 'top': 40, 'right': 30, 'color': "#F2DB83"}
                     )
-                ])
-            ]),
-            # "mins" label
-            html.Div([
-                dbc.Row([
-                    html.Strong(
-                        html.Div(
-                            "mins",
-                            style={'fontSize': 20, 'display': "flex", 'position': "absolute", 'top': 103, 'right': "34%", 'textAlign': "center", 'color': "#000000"}
-                        )
-                    )
-                ])
-            ]),
-            # KPI: Average Rating
-            html.Div([
-                dbc.Row([
-                    html.Strong(
-                        html.Div(
-                            "Average Rating",
-                            style={'fontSize': 20, 'display': "flex", 'position': "absolute", 'top': 50, 'right': "8.6%", 'textAlign': "center", 'color': "#000000"}
-                        )
+                ]),
+                html.Div([
+                    html.I(
+                        html.Img(
+                            src=app.get_asset_url("info-64.png"),
+                            id="info",
+                            style={'width': "100%", 'background': "#000000"}
+                        ),
+                        id="collapse-button",
+                        n_clicks=0,
+                        style={'width': "2%", 'position': "absolute", 'top': 38, 'right': 3, 'color': "#DBA506", 'margin': 0}
                     ),
-                    html.Div(
-                        html.H2(
-                            dcc.Loading(
-                                children=[html.Div(id="avg_rating")],
-                                style={'display': "flex", 'position': "absolute", 'top': 0, 'right': 0}
-                            ),
-                            style={'display': "flex", 'position': "absolute", 'top': 80, 'right': "11.1%", 'textAlign': "center", 'color': "#000000"}
-                        )
+                    dbc.Collapse(
+                        dbc.Card(dbc.CardBody("The IMDb dashboard is primarily targeted towards movie producers to present a consolidated crisp view of the average ratings and runtime for movies by genres and regions with interactive abilities to help them choose and plan their next movie.")),
+                        id="collapse",
+                        is_open=False,
+                        style={'width': "100%", 'position': "absolute", 'top': 72, 'left': 0, 'zIndex': 999, 'color': "#DBA506", 'background': "#000000", 'border': "3px solid gold"},
                     )
                 ])
-            ])
+            ],
+            width=11,
+            style={'position': "relative"}
+            )
         ],
-        style={'width': "100%", 'position': "relative", 'border-top': "6px solid gold", 'border-bottom': "6px solid gold"}
-        )
-    ]),
-    
-    # Third row containing filters towards left and charts toward right
-    dbc.Row([
-        # First column containing filters separated by dividers
-        dbc.Col([
+        style={'height': "70px"}
+        ),
+
+        # Second row containing reel image and KPIs
+        dbc.Row([
             html.Div([
-                # Genre Checklist
-                html.H6(
-                    "Select Genre(s):",
-                    style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506", 'margin-top': "6px"}
-                ),
-                dbc.Checklist(
-                    id="genres-checklist",
-                    options=[
-                        {"label": genre, "value": genre} for genre in sorted(
-                            data.genres.unique().astype(str)
-                            ) if genre != "nan"
-                        ],
-                    value=["Action", "Horror", "Romance"],
-                    style={'width': "100%", 'height': "100%", 'color': "#DBA506"}
-                ),
-                html.Br(),
-                # Top N actors
-                html.H6(
-                    "Top N (actors):",
-                    style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506"}
-                ),
-                dcc.Slider(
-                    id="top_n",
-                    min=1,
-                    max=15,
-                    step=1,
-                    value=10,
-                    marks=None,
-                    included=False,
-                    tooltip={"placement": "bottom", "always_visible": True}
-                ),
-                html.Br(),
-                # Year Range
-                html.H6(
-                    "Year Range:",
-                    style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506"}
+                # Reel image
+                html.Img(
+                    src=app.get_asset_url("reel.png"),
+                    id="reel",
+                    style={'width': "100%", 'height': "200px", 'background': "#DBA506"}
                 ),
-                dcc.RangeSlider(
-                    id="years-range",
-                    marks={
-                        2011: '2011',
-                        2020: '2020'
-                    },
-                    min=2011,
-                    max=2020,
-                    step=1,
-                    value=[2011, 2020],
-                    dots=True,
-                    tooltip={"placement": "bottom", "always_visible": False}
-                ),
-                html.Br(),
-                # Region dropdown
-                html.H6(
-                    "Select Region(s):",
-                    style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506"}
-                ),
-                dcc.Dropdown(
-                    id="region-checklist",
-                    options=[
-                        {"label": name, "value": name} for name in sorted(
-                            data.name.unique().astype(str)
-                            ) if name != "nan"
-                        ],
-                    multi=True,
-                    clearable=False,
-                    placeholder="Select Region(s)",
-                    value=["United States of America", "India"],
-                    style={'width': "100%", 'height': "100px", 'color': "#DBA506", 'background': "#000000"}
-                ),
-            ])
-        ],
-        width=2,
-        style={'border-right': "6px solid gold"}
-        ),
-        # Second column containing charts separated by title boxes
-        dbc.Col([
-            dbc.Row([
-                # Distribution of movies by Genre
-                dbc.Col([
-                    html.Div([
-                        html.H6(
-                            "Distribution of movies by Genre",
-                            style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506", 'margin-top': "6px"}
-                        )
-                    ]),
-                    html.Div([
-                        dcc.Loading(
-                            type="graph",
-                            children=html.Iframe(
-                                id='box',
-                                style={'width': "100%", 'height': "350px", 'border': "1px solid gold"}
+                # KPI: Total Movies
+                html.Div([
+                    dbc.Row([
+                        html.Strong(
+                            html.Div(
+                                "Total Movies",
+                                style={'fontSize': 20, 'display': "inline-block", 'position': "absolute", 'top': 50, 'left': "9.5%", 'textAlign': "center", 'color': "#000000"}
+                            )
+                        ),
+                        html.Div(
+                            html.H2(
+                                dcc.Loading(
+                                    children=[html.Div(id="total_movies")],
+                                    style={'display': "flex", 'position': "absolute", 'top': 0, 'left': 30}
+                                ),
+                                style={'display': "flex", 'position': "absolute", 'top': 80, 'left': "10%", 'textAlign': "center", 'color': "#000000"}
                             )
                         )
                     ])
-                ],
-                width=6
-                ),
-                # Average Revenue/Runtime by Genre over Time
-                dbc.Col([
-                    html.Div([
-                        html.H6(
-                            children=[
-                                html.Div(id='ycol_title', style={'display': 'inline'}),
-                                " by Genre over Time"
-                            ],
-                            style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506", 'margin-top': "6px"}
-                        )
-                    ]),
-                    html.Div([
-                        dcc.Loading(
-                            type="graph",
-                            children=html.Iframe(
-                                id='line',
-                                style={'width': "100%", 'height': "320px", 'border': "1px solid gold"}
+                ]),
+                # KPI: Total Actors
+                html.Div([
+                    dbc.Row([
+                        html.Strong(
+                            html.Div(
+                                "Total Actors",
+                                style={'fontSize': 20, 'display': "flex", 'position': "absolute", 'top': 50, 'left': "34.2%", 'textAlign': "center", 'color': "#000000"}
+                            )
+                        ),
+                        html.Div(
+                            html.H2(
+                                dcc.Loading(
+                                    children=[html.Div(id="total_actors")],
+                                    style={'display': "flex", 'position': "absolute", 'top': 0, 'left': 30}
+                                ),
+                                style={'display': "flex", 'position': "absolute", 'top': 80, 'left': "34.3%", 'textAlign': "center", 'color': "#000000"}
                             )
                         )
-                    ]),
+                    ])
+                ]),
+                # KPI: Average Runtime
+                html.Div([
                     dbc.Row([
-                    # Y-axis of line chart
-                        dbc.Col([
-                            html.H6(
-                                "Select Y-axis:",
-                                style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506"}
-                                ),
-                        ],
-                        width=4
+                        html.Strong(
+                            html.Div(
+                                "Average Runtime",
+                                style={'fontSize': 20, 'display': "flex", 'position': "absolute", 'top': 50, 'right': "32.8%", 'textAlign': "center", 'color': "#000000"}
+                            )
                         ),
-                        dbc.Col([
-                            dcc.RadioItems(
-                                id='ycol',
-                                style={'width': "100%", 'height': "20px"},
-                                value='averageRating',
-                                inline=True,
-                                inputStyle={'margin-right': "10px", 'margin-left': "10px"},
-                                options=[
-                                    {'label': "Average Rating", 'value': "averageRating"},
-                                    {'label': "Average Runtime", 'value': "runtimeMinutes"}
-                                ]
+                        html.Div(
+                            html.H2(
+                                dcc.Loading(
+                                    children=[html.Div(id="avg_runtime")],
+                                    style={'display': "flex", 'position': "absolute", 'top': 0, 'right': 0}
+                                ),
+                                style={'display': "flex", 'position': "absolute", 'top': 80, 'right': "37%", 'textAlign': "center", 'color': "#000000"}
                             )
-                        ],
-                        width=8
                         )
-                    ]),
-                ],
-                width=6
-                )
-            ]),
-            dbc.Row([
-                dbc.Col([
-                    html.Div([
-                        html.H6(
-                            children=[
-                                "Top ",
-                                html.Div(id='top_n_val', style={'display': 'inline'}),
-                                " Actors from the best rated movies"
-                            ],
-                            style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506"}
-                        ),
-                    ]),
-                    html.Div([
-                        dcc.Loading(
-                            type="graph",
-                            children=html.Iframe(
-                                id='bar',
-                                style={'width': "100%", 'height': "350px", 'border': "1px solid gold"}
+                    ])
+                ]),
+                # "mins" label
+                html.Div([
+                    dbc.Row([
+                        html.Strong(
+                            html.Div(
+                                "mins",
+                                style={'fontSize': 20, 'display': "flex", 'position': "absolute", 'top': 103, 'right': "34%", 'textAlign': "center", 'color': "#000000"}
                             )
                         )
                     ])
-                ],
-                width=4
-                ),
-                dbc.Col([
-                    html.Div([
-                        html.H6(
-                            "Top rated movie in each region",
-                            style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506"}
+                ]),
+                # KPI: Average Rating
+                html.Div([
+                    dbc.Row([
+                        html.Strong(
+                            html.Div(
+                                "Average Rating",
+                                style={'fontSize': 20, 'display': "flex", 'position': "absolute", 'top': 50, 'right': "8.6%", 'textAlign': "center", 'color': "#000000"}
+                            )
                         ),
-                    ]),
-                    html.Div([
-                        dcc.Loading(
-                            type="graph",
-                            color="#DBA506",
-                            children=html.Iframe(
-                                id='map',
-                                style={'width': "100%", 'height': "350px", 'border': "1px solid gold"}
+                        html.Div(
+                            html.H2(
+                                dcc.Loading(
+                                    children=[html.Div(id="avg_rating")],
+                                    style={'display': "flex", 'position': "absolute", 'top': 0, 'right': 0}
+                                ),
+                                style={'display': "flex", 'position': "absolute", 'top': 80, 'right': "11.1%", 'textAlign': "center", 'color': "#000000"}
                             )
                         )
                     ])
-                ],
-                width=8
-                ),
-            ]),
-        ],
-        width=10
-        )
-    ])
-],
-style={'border': "6px solid gold", 'fontFamily': "Bahnschrift Condensed"}
-)
+                ])
+            ],
+            style={'width': "100%", 'position': "relative", 'border-top': "6px solid gold", 'border-bottom': "6px solid gold"}
+            )
+        ]),
+    
+        # Third row containing filters towards left and charts toward right
+        dbc.Row([
+            # First column containing filters separated by dividers
+            dbc.Col([
+                html.Div([
+                    # Genre Checklist
+                    html.H6(
+                        "Select Genre(s):",
+                        style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506", 'margin-top': "6px"}
+                    ),
+                    dbc.Checklist(
+                        id="genres-checklist",
+                        options=[
+                            {"label": genre, "value": genre} for genre in sorted(backend.genres)
+                            ],
+                        value=["Action", "Horror", "Romance"],
+                        style={'width': "100%", 'height': "100%", 'color': "#DBA506"}
+                    ),
+                    html.Br(),
+                    # Top N actors
+                    html.H6(
+                        "Top N (actors):",
+                        style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506"}
+                    ),
+                    dcc.Slider(
+                        id="top_n",
+                        min=1,
+                        max=TOP_K,
+                        step=1,
+                        value=10,
+                        updatemode="mouseup",  # No request per intermediate value while dragging
+                        marks=None,
+                        included=False,
+                        tooltip={"placement": "bottom", "always_visible": True}
+                    ),
+                    html.Br(),
+                    # Year Range
+                    html.H6(
+                        "Year Range:",
+                        style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506"}
+                    ),
+                    dcc.RangeSlider(
+                        id="years-range",
+                        marks={
+                            backend.min_year: str(backend.min_year),
+                            backend.max_year: str(backend.max_year)
+                        },
+                        min=backend.min_year,
+                        max=backend.max_year,
+                        step=1,
+                        value=[backend.min_year, backend.max_year],
+                        dots=True,
+                        updatemode="mouseup",
+                        tooltip={"placement": "bottom", "always_visible": False}
+                    ),
+                    html.Br(),
+                    # Region dropdown
+                    html.H6(
+                        "Select Region(s):",
+                        style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506"}
+                    ),
+                    dcc.Dropdown(
+                        id="region-checklist",
+                        options=[
+                            {"label": name, "value": name} for name in sorted(backend.regions)
+                            ],
+                        multi=True,
+                        clearable=False,
+                        placeholder="Select Region(s)",
+                        value=["United States of America", "India"],
+                        style={'width': "100%", 'height': "100px", 'color': "#DBA506", 'background': "#000000"}
+                    ),
+                    html.Br(),
+                    # Actor or movie search, its options are looked up as the user types
+                    html.H6(
+                        "Search Actor or Movie:",
+                        style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506"}
+                    ),
+                    dcc.Dropdown(
+                        id="search",
+                        options=[],
+                        placeholder="Type a name",
+                        clearable=True,
+                        style={'width': "100%", 'color': "#DBA506", 'background': "#000000"}
+                    ),
+                ])
+            ],
+            width=2,
+            style={'border-right': "6px solid gold"}
+            ),
+            # Second column containing charts separated by title boxes
+            dbc.Col([
+                dbc.Row([
+                    # Distribution of movies by Genre
+                    dbc.Col([
+                        html.Div([
+                            html.H6(
+                                "Distribution of movies by Genre",
+                                style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506", 'margin-top': "6px"}
+                            )
+                        ]),
+                        html.Div([
+                            chart_container(
+                                'box',
+                                style={'width': "100%", 'height': "350px", 'border': "1px solid gold"},
+                                loading={"type": "graph"}
+                            )
+                        ])
+                    ],
+                    width=6
+                    ),
+                    # Average Revenue/Runtime by Genre over Time
+                    dbc.Col([
+                        html.Div([
+                            html.H6(
+                                children=[
+                                    html.Div(id='ycol_title', style={'display': 'inline'}),
+                                    " by Genre over Time"
+                                ],
+                                style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506", 'margin-top': "6px"}
+                            )
+                        ]),
+                        html.Div([
+                            chart_container(
+                                'line',
+                                style={'width': "100%", 'height': "320px", 'border': "1px solid gold"},
+                                loading={"type": "graph"}
+                            )
+                        ]),
+                        dbc.Row([
+                        # Y-axis of line chart
+                            dbc.Col([
+                                html.H6(
+                                    "Select Y-axis:",
+                                    style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506"}
+                                    ),
+                            ],
+                            width=4
+                            ),
+                            dbc.Col([
+                                dcc.RadioItems(
+                                    id='ycol',
+                                    style={'width': "100%", 'height': "20px"},
+                                    value='averageRating',
+                                    inline=True,
+                                    inputStyle={'margin-right': "10px", 'margin-left': "10px"},
+                                    options=[
+                                        {'label': "Average Rating", 'value': "averageRating"},
+                                        {'label': "Average Runtime", 'value': "runtimeMinutes"}
+                                    ]
+                                )
+                            ],
+                            width=8
+                            )
+                        ]),
+                    ],
+                    width=6
+                    )
+                ]),
+                dbc.Row([
+                    dbc.Col([
+                        html.Div([
+                            html.H6(
+                                children=[
+                                    "Top ",
+                                    html.Div(id='top_n_val', style={'display': 'inline'}),
+                                    " Actors from the best rated movies"
+                                ],
+                                style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506"}
+                            ),
+                        ]),
+                        html.Div([
+                            chart_container(
+                                'bar',
+                                style={'width': "100%", 'height': "350px", 'border': "1px solid gold"},
+                                loading={"type": "graph"}
+                            )
+                        ])
+                    ],
+                    width=4
+                    ),
+                    dbc.Col([
+                        html.Div([
+                            html.H6(
+                                "Top rated movie in each region",
+                                style={'width': "100%", 'color': "#000000", 'textAlign': "center", 'fontWeight': "bold", 'background': "#DBA506"}
+                            ),
+                        ]),
+                        html.Div([
+                            chart_container(
+                                'map',
+                                style={'width': "100%", 'height': "350px", 'border': "1px solid gold"},
+                                loading={"type": "graph", "color": "#DBA506"}
+                            )
+                        ])
+                    ],
+                    width=8
+                    ),
+                ]),
+            ],
+            width=10
+            )
+        ])
+    ],
+    style={'border': "6px solid gold", 'fontFamily': "Bahnschrift Condensed"}
+    )
 
-# Callback to filter data based on filter values
-@app.callback(
-    Output("filtered-data", "data"),
+
+def update_layout(old: Dataset, new: Dataset):
+    """Gives the next page loads the filter options of a reloaded dataset."""
+    app.layout = build_layout(new.backend)
+
+
+app.layout = build_layout(dataset_manager.current.backend)
+dataset_manager.listeners.append(update_layout)
+
+
+def get_summary(selection: dict, dataset=None):
+    """
+    Computes the KPI statistics of the selection in the `filtered-data` store.
+
+    Parameters
+    ----------
+    selection : dict
+        The value of the `filtered-data` store.
+    dataset : Dataset, optional
+        The dataset to query, the current one by default.
+
+    Returns
+    -------
+    summary : dict
+        The summary statistics computed by the query backend.
+    """
+    dataset = dataset or dataset_manager.current
+    return filtered_cache.get_or_compute(
+        f"{dataset.version}:{selection['key']}:summary",
+        lambda: dataset.backend.summary(
+            selection["genres"], selection["regions"], selection["years"], selection.get("search")
+        ),
+        "update_kpis"
+    )
+
+
+startup.mark("layout")
+
+
+def skip_if_stale(selection: dict):
+    """
+    Drops a callback working on a filter update that a newer one superseded.
+
+    Parameters
+    ----------
+    selection : dict
+        The value of the `filtered-data` store.
+
+    Raises
+    ------
+    PreventUpdate
+        If a newer filter update of the same session was registered.
+    """
+    session = selection.get("session")
+    if session is not None and latest_requests.is_stale(session, selection["seq"]):
+        latest_requests.skip()
+        raise PreventUpdate
+
+
+# Number every filter update in the browser
+app.clientside_callback(
+    ClientsideFunction(namespace="requests", function_name="stamp"),
+    Output("request-stamp", "data"),
     Input("genres-checklist", "value"),
     Input("region-checklist", "value"),
-    Input("years-range", "value")
+    Input("years-range", "value"),
+    Input("search", "value"),
+    State("request-stamp", "data")
 )
-def update_data(genres: list, regions: list, years: list):
-    filtered_data = data[data.genres.isin(genres)]
-    filtered_data = filtered_data[filtered_data.name.isin(regions)]
-    filtered_data = filtered_data[(filtered_data.startYear >= years[0]) & (filtered_data.startYear <= years[1])]
-    return filtered_data.to_json()
 
-# Box Plot
+# Callback to filter data based on filter values
 @app.callback(
-    Output('box', 'srcDoc'),
-    Input('filtered-data', 'data')
+    Output("filtered-data", "data"),
+    Input("request-stamp", "data"),
+    State("genres-checklist", "value"),
+    State("region-checklist", "value"),
+    State("years-range", "value"),
+    State("search", "value")
 )
-def serve_box_plot(df):
-    df = pd.read_json(df)  # Convert the filtered data from a json string to a df
-    chart = generate_box_plot(df)
-    return chart
+def update_data(stamp: dict, genres: list, regions: list, years: list, search=None):
+    selection = {
+        "key": filter_key(genres, regions, years, search),
+        "genres": genres,
+        "regions": regions,
+        "years": years,
+        "search": search
+    }
+    if stamp:
+        if not latest_requests.register(stamp["session"], stamp["seq"]):
+            latest_requests.skip()
+            raise PreventUpdate
+        selection.update(stamp)
+    return selection
 
-# Line Plot
+# Type-ahead options of the search box
 @app.callback(
-    Output('line', 'srcDoc'),
-    Input('filtered-data', 'data'),
-    Input('ycol', 'value')
+    Output("search", "options"),
+    Input("search", "search_value"),
+    State("search", "value")
 )
-def serve_line_plot(df, ycol):
-    df = pd.read_json(df)  # Convert the filtered data from a json string to a df
-    chart = generate_line_plot(df, ycol)
-    return chart
+def update_search_options(search_value: str, value: str):
+    if not search_value:
+        raise PreventUpdate
+    options = dataset_manager.current.search_index.options(search_value, SEARCH_LIMIT)
+    # Keep the picked name among the options, or the dropdown clears it
+    if value and value not in [option["value"] for option in options]:
+        options.append(search_option(value))
+    return options
+
+@instrumented
+def serve_box_plot(dataset, selection):
+    genres, datasets = filtered_cache.get_or_compute(
+        f"{dataset.version}:{selection['key']}:box",
+        lambda: dataset.backend.box_data(selection["genres"], selection["regions"], selection["years"], selection.get("search")),
+        "serve_box_plot"
+    )
+    count_rows(datasets, datasets)
+    return render_chart("box", datasets, genres=genres)
+
+
+@instrumented
+def serve_line_plot(dataset, selection, ycol=None):
+    series = filtered_cache.get_or_compute(
+        f"{dataset.version}:{selection['key']}:line",
+        lambda: dataset.backend.line_series(selection["genres"], selection["regions"], selection["years"], selection.get("search")),
+        "serve_line_plot"
+    )
+    years = (dataset.backend.min_year, dataset.backend.max_year)  # The x-axis spans the whole dataset
+    if ycol is None:
+        # Both y-axes and the spec of each, the browser shows the selected one
+        genres, datasets = line_plot_data(series, YCOLS)
+        count_rows(series, datasets)
+        prefix = app.config.requests_pathname_prefix
+        return chart_payload(
+            {ycol: spec_url(prefix, "line", ycol=ycol, genres=genres, years=years) for ycol in YCOLS}, datasets
+        )
+    genres, datasets = line_plot_data(series, ycol)
+    count_rows(series, datasets)
+    return render_chart("line", datasets, ycol=ycol, genres=genres, years=years)
+
+
+@instrumented
+def serve_map(dataset, selection):
+    # Only depends on the genres and years, so the key ignores the regions
+    df = filtered_cache.get_or_compute(
+        f"{dataset.version}:map:{filter_key(selection['genres'], [], selection['years'], selection.get('search'))}",
+        lambda: dataset.backend.top_rated(selection["genres"], selection["years"], selection.get("search")),
+        "serve_map"
+    )
+    datasets = map_data(df)
+    count_rows(df, datasets)
+    return render_chart("map", datasets)
+
+
+@instrumented
+def serve_bar_chart(dataset, selection, top_n=None):
+    # The top K of the selection is cached, the slider only slices it
+    df = filtered_cache.get_or_compute(
+        f"{dataset.version}:{selection['key']}:bar",
+        lambda: dataset.backend.top_actors(selection["genres"], selection["regions"], selection["years"], selection.get("search")),
+        "serve_bar_chart"
+    )
+    if top_n is None:
+        # The whole top K, the browser keeps the first N
+        datasets = bar_chart_data(df, TOP_K)
+        count_rows(df, datasets)
+        url = spec_url(app.config.requests_pathname_prefix, "bar")
+        return chart_payload(url, datasets, BAR_EMBED_OPTIONS, head=["bar"])
+    datasets = bar_chart_data(df, top_n)
+    count_rows(df, datasets)
+    return render_chart("bar", datasets, BAR_EMBED_OPTIONS)
 
-# Map Plot
-@app.callback(
-    Output('map', 'srcDoc'),
-    Input('filtered-data', 'data'),
-)
-def serve_map(df):
-    df = pd.read_json(df)  # Convert the filtered data from a json string to a df
-    chart = generate_map(df)  # TODO: the map shouldn't receive filtered data!!
-    return chart
 
-# Bar Chart
+# Inputs besides the filters that each chart depends on
+CHART_INPUTS = {
+    "box": set(),
+    "line": {"ycol"},
+    "map": set(),
+    "bar": {"top_n"}
+}
+
+
+def render_charts(selection: dict, ycol: str, top_n: int, charts):
+    """
+    Renders some charts of a selection concurrently in the render pool.
+
+    Every chart is first looked up in the render cache under everything it
+    depends on. All of them are rendered from the dataset current when the
+    call starts, even if a new one is swapped in meanwhile.
+
+    Parameters
+    ----------
+    selection : dict
+        The value of the `filtered-data` store.
+    ycol : string
+        The y-axis of the line chart, None for a "vega" mode payload with both.
+    top_n : int
+        Number of actors in the bar chart, None for a "vega" mode payload
+        with the top K.
+    charts : iterable
+        Names of the charts to render.
+
+    Returns
+    -------
+    renders : dict
+        Maps every chart name to the value of its `chart_output`.
+    """
+    dataset = dataset_manager.current
+    rendered_from = render_version(dataset)
+    # The parameters of the render key, the serve function and its arguments besides the dataset and selection
+    renderers = {
+        "box": ([selection["key"]], serve_box_plot, []),
+        "line": ([selection["key"], ycol], serve_line_plot, [ycol]),
+        "map": ([filter_key(selection["genres"], [], selection["years"], selection.get("search"))], serve_map, []),
+        "bar": ([selection["key"], top_n], serve_bar_chart, [top_n])
+    }
+    futures = {}
+    for chart in charts:
+        params, serve, args = renderers[chart]
+        futures[chart] = render_pool.submit(
+            render_cache.get_or_compute,
+            render_key(chart, rendered_from, *params), partial(serve, dataset, selection, *args), rendered_from,
+            serve.__name__
+        )
+    return {chart: future.result() for chart, future in futures.items()}
+
+
+# All charts in one request, rendered concurrently by the render pool
 @app.callback(
-    Output('bar', 'srcDoc'),
+    [chart_output(chart) for chart in CHART_SPECS],
     Input('filtered-data', 'data'),
-    Input('top_n', 'value')
+    *[Input(name, 'value') for name in ["ycol", "top_n"] if name not in BROWSER_INPUTS.values()]
 )
-def serve_bar_chart(df, top_n):
-    df = pd.read_json(df)  # Convert the filtered data from a json string to a df
-    chart = generate_bar_chart(df, top_n)
-    return chart
+def serve_charts(selection, ycol=None, top_n=None):
+    skip_if_stale(selection)
+    # Empty on the initial call, then only the charts depending on a changed input are rendered
+    triggered = set(callback_context.triggered_prop_ids.values())
+    renders = render_charts(selection, ycol, top_n, [
+        chart for chart in CHART_SPECS
+        if not triggered or "filtered-data" in triggered or triggered & CHART_INPUTS[chart]
+    ])
+    return [renders.get(chart, no_update) for chart in CHART_SPECS]
+
+# Chart specs for the persistent Vega views, see `render_chart`
+@server.route("/charts/spec/<chart>")
+def serve_chart_spec(chart):
+    if chart not in CHART_SPECS:
+        flask.abort(404)
+    params = {}
+    for name, value in flask.request.args.items():
+        if name == "genres":
+            params[name] = tuple(genre for genre in value.split(",") if genre)
+            if not set(params[name]) <= set(dataset_manager.current.backend.genres):
+                flask.abort(400)
+        elif name == "years":
+            try:
+                params[name] = tuple(int(year) for year in value.split(","))
+            except ValueError:
+                flask.abort(400)
+            if len(params[name]) != 2:
+                flask.abort(400)
+        elif name == "ycol" and value in ("averageRating", "runtimeMinutes"):
+            params[name] = value
+        else:
+            flask.abort(400)
+    try:
+        spec = CHART_SPECS[chart](**params)
+    except TypeError:
+        flask.abort(400)
+    response = flask.jsonify(spec)
+    response.cache_control.public = True
+    response.cache_control.max_age = 24 * 60 * 60
+    return response
+
+if RENDER_MODE == "vega":
+    for chart_id in CHART_SPECS:
+        if chart_id in BROWSER_INPUTS:
+            # Changing the input only updates the view in the browser
+            app.clientside_callback(
+                ClientsideFunction(namespace="vega_views", function_name="render_with"),
+                Output(chart_id, "className"),
+                Input(f"{chart_id}-payload", "data"),
+                Input(BROWSER_INPUTS[chart_id], "value"),
+                State(chart_id, "id")
+            )
+        else:
+            app.clientside_callback(
+                ClientsideFunction(namespace="vega_views", function_name="render"),
+                Output(chart_id, "className"),
+                Input(f"{chart_id}-payload", "data"),
+                State(chart_id, "id")
+            )
 
 # Top N Value
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace="chart_titles", function_name="top_n"),
     Output('top_n_val', 'children'),
     Input('top_n', 'value')
 )
-def update_ticker_header(top_n_val):
-    return [f'{top_n_val}']
 
 # Line Chart Title
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace="chart_titles", function_name="ycol"),
     Output('ycol_title', 'children'),
     Input('ycol', 'value')
 )
-def update_ycol_title(ycol):
-    # Set up dynamic axis labels
-    if ycol == "averageRating":
-        label = "Average Rating"
-    if ycol == "runtimeMinutes":
-        label = "Average Runtime"
-    return label
-
-# Total Movies
-@app.callback(
-    Output('total_movies', 'children'),
-    Input('filtered-data', 'data')
-)
-def total_movies_count(df):
-    df = pd.read_json(df)  # Convert the filtered data from a json string to a df
-    movies = df["primaryTitle"].nunique()
-    return movies
-
-# Total Actors
-@app.callback(
-    Output('total_actors', 'children'),
-    Input('filtered-data', 'data')
-)
-def total_movies_count(df):
-    df = pd.read_json(df)  # Convert the filtered data from a json string to a df
-    actors = df["primaryName"].nunique()
-    return actors
 
-# Average Runtime
+# KPIs, all computed from one rollup and sent back in one response
 @app.callback(
-    Output('avg_runtime', 'children'),
+    [Output(name, 'children') for name in KPIS],
     Input('filtered-data', 'data')
 )
-def total_movies_count(df):
-    df = pd.read_json(df)  # Convert the filtered data from a json string to a df
-    avg_runtime = df["runtimeMinutes"].mean().round(0)
-    return avg_runtime
-
-# Average Rating
-@app.callback(
-    Output('avg_rating', 'children'),
-    Input('filtered-data', 'data')
-)
-def total_movies_count(df):
-    df = pd.read_json(df)  # Convert the filtered data from a json string to a df
-    avg_rating = df["averageRating"].mean().round(1)
-    return avg_rating
+def update_kpis(selection):
+    skip_if_stale(selection)
+    return compute_kpis(get_summary(selection))
 
 # Information
 @app.callback(
@@ -508,5 +934,19 @@ def toggle_collapse(n, is_open):
         return not is_open
     return is_open
 
+# Every worker checks the dataset files for a new version, see src/datasets.py. Under gunicorn the
+# post_fork hook starts it, other servers start it on the first request
+server.before_request(dataset_manager.watch)
+
+# ETags and compression of the callback responses, see src/responses.py
+install_responses(server)
+
+# Opt-in, see src/instrumentation.py
+instrument_callbacks(app)
+install_instrumentation(server)
+
+startup.mark("callbacks")
+startup.report()
+
 if __name__ == '__main__':
-    app.run_server(debug=True)
+    app.run(debug=True)
@@ -0,0 +1,13 @@
+// Chart titles following the chart inputs, updated without a server request.
+var YCOL_TITLES = {averageRating: "Average Rating", runtimeMinutes: "Average Runtime"};
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    chart_titles: {
+        top_n: function(top_n) {
+            return String(top_n);
+        },
+        ycol: function(ycol) {
+            return YCOL_TITLES[ycol];
+        }
+    }
+});
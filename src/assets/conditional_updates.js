@@ -0,0 +1,49 @@
+// Keeps the latest responses of every callback output and sends their
+// ETags with the next request for that output, so that the server answers
+// a repeated selection with 304 Not Modified instead of the same body.
+(function() {
+    var MAX_RESPONSES = 16;  // Per output, the least recently used are dropped
+    var responses = {};  // Output -> Map of ETag -> response body
+    var fetch = window.fetch.bind(window);
+
+    function jsonResponse(body) {
+        return new Response(body, {status: 200, headers: {"Content-Type": "application/json"}});
+    }
+
+    window.fetch = function(resource, init) {
+        var url = typeof resource === "string" ? resource : resource.url;
+        if (!init || init.method !== "POST" || typeof init.body !== "string"
+                || !/_dash-update-component(\?|$)/.test(url)) {
+            return fetch(resource, init);
+        }
+        var output = JSON.parse(init.body).output;
+        var known = responses[output] = responses[output] || new Map();
+        var headers = new Headers(init.headers);
+        if (known.size) {
+            headers.set("If-None-Match", Array.from(known.keys()).join(", "));
+        }
+        return fetch(resource, Object.assign({}, init, {headers: headers})).then(function(response) {
+            var etag = response.headers.get("ETag");
+            if (!etag || (response.status !== 200 && response.status !== 304)) {
+                return response;
+            }
+            if (response.status === 304) {
+                if (!known.has(etag)) {
+                    return response;
+                }
+                var body = known.get(etag);
+                known.delete(etag);
+                known.set(etag, body);
+                return jsonResponse(body);
+            }
+            return response.text().then(function(body) {
+                known.delete(etag);
+                known.set(etag, body);
+                if (known.size > MAX_RESPONSES) {
+                    known.delete(known.keys().next().value);
+                }
+                return jsonResponse(body);
+            });
+        });
+    };
+})();
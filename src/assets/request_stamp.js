@@ -0,0 +1,15 @@
+// Numbers the filter updates of this browser tab, so that the server can
+// drop the requests of updates that a newer one has superseded.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    requests: {
+        stamp: function(genres, regions, years, search, previous) {
+            if (!previous) {
+                var session = window.crypto && window.crypto.randomUUID
+                    ? window.crypto.randomUUID()
+                    : Math.random().toString(36).slice(2) + Date.now().toString(36);
+                return {session: session, seq: 1};
+            }
+            return {session: previous.session, seq: previous.seq + 1};
+        }
+    }
+});
@@ -0,0 +1,61 @@
+// Persistent Vega views for the "vega" render mode.
+// Each chart's spec is fetched and embedded once, later payloads only
+// replace the values of its named datasets.
+var vegaViews = {};
+
+function drawVegaView(payload, id) {
+    var state = vegaViews[id];
+    if (!state || state.spec !== payload.spec) {
+        if (state) {
+            state.view.then(function(view) { view.finalize(); });
+        }
+        var element = document.getElementById(id);
+        state = vegaViews[id] = {spec: payload.spec};
+        state.view = fetch(payload.spec)
+            .then(function(response) { return response.json(); })
+            .then(function(spec) { return vegaEmbed(element, spec, payload.embed); })
+            .then(function(result) { return result.view; });
+    }
+    state.view.then(function(view) {
+        if (vegaViews[id] !== state) {
+            return;  // A newer spec replaced this view in the meantime
+        }
+        Object.keys(payload.datasets).forEach(function(name) {
+            view.change(name, vega.changeset().remove(vega.truthy).insert(payload.datasets[name]));
+        });
+        return view.runAsync();
+    });
+    return "vega-view";
+}
+
+// Applies the value of a chart's input to its payload: picks the spec
+// for that value and keeps that many rows of the `head` datasets.
+function selectPayload(payload, value) {
+    var datasets = {};
+    Object.keys(payload.datasets).forEach(function(name) {
+        var values = payload.datasets[name];
+        datasets[name] = (payload.head || []).indexOf(name) >= 0 ? values.slice(0, value) : values;
+    });
+    return {
+        spec: typeof payload.spec === "string" ? payload.spec : payload.spec[value],
+        datasets: datasets,
+        embed: payload.embed
+    };
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    vega_views: {
+        render: function(payload, id) {
+            if (!payload) {
+                return window.dash_clientside.no_update;
+            }
+            return drawVegaView(payload, id);
+        },
+        render_with: function(payload, value, id) {
+            if (!payload) {
+                return window.dash_clientside.no_update;
+            }
+            return drawVegaView(selectPayload(payload, value), id);
+        }
+    }
+});
@@ -0,0 +1,388 @@
+"""
+Query backends answering the filter selections of the dashboard.
+
+Every backend exposes the filter options (`genres`, `regions`,
+`min_year`, `max_year`), the `search_index` of its names and the queries the
+callbacks run for a selection of genres, region names, an inclusive year
+range and optionally the actor or movie picked in the search box, as a
+`src.search` option value:
+
+- `rows` returns the filtered rows at the grain of a chart
+- `summary` returns the KPI statistics
+- `line_series` returns the mean rating and runtime per genre and year
+- `box_data` returns the boxplot statistics
+- `top_rated` returns the top rated movie of every country, for all regions
+- `top_actors` returns the best (actor, movie) pairs
+
+`PandasBackend` holds the normalised dataset and its indexes in memory
+and is the reference. `DuckDBBackend` runs every query as one SQL query
+over the feather file or the year-partitioned Parquet dataset written by
+`src.etl`, so the data does not need to fit in the memory of every worker.
+"""
+import logging
+import os
+import threading
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from .bar_chart import TOP_K, TopActorsIndex
+from .boxplot import RatingCountsIndex, box_summary_data, rating_values
+from .cube import Cube
+from .filter_index import expand_ranges
+from .loader import load_region_codes
+from .map_plot import TopRatedIndex, top_rated_per_country
+from .search import NameIndex, parse_search
+
+logger = logging.getLogger(__name__)
+
+
+class PandasBackend:
+    """
+    Reference backend over the in-memory `StarSchema`.
+
+    A search narrows the selection to a few movies, so its queries run on
+    the selected facts instead of the precomputed indexes.
+
+    Parameters
+    ----------
+    schema : StarSchema
+        The normalised dataset.
+    k : int
+        Number of (actor, movie) pairs `top_actors` returns.
+    """
+
+    name = "pandas"
+
+    def __init__(self, schema, k=TOP_K):
+        self.schema = schema
+        self.k = k
+        # Built once per worker, turns every filter into a few range lookups
+        self.index = schema.index
+        self.genres = self.index.genres
+        self.regions = self.index.regions
+        self.min_year = self.index.min_year
+        self.max_year = self.index.max_year
+        self.cube = Cube.from_schema(schema)
+        # The map shows every region, whatever the region filter
+        self._top_rated = TopRatedIndex(schema.box_rows(self.genres, self.regions, [self.min_year, self.max_year]))
+        self._top_actors = TopActorsIndex(schema, k)
+        self._rating_counts = RatingCountsIndex(schema)
+
+    @cached_property
+    def search_index(self):
+        """Returns the `NameIndex` of the actor and movie names, the actor positions are actor ids."""
+        return NameIndex({
+            "actor": self.schema.actors["primaryName"].to_numpy(dtype=object).tolist(),
+            "title": self.schema.titles["primaryTitle"].dropna().astype(str).unique().tolist()
+        })
+
+    @cached_property
+    def _titles_by_name(self):
+        return pd.Series(np.arange(len(self.schema.titles))).groupby(
+            self.schema.titles["primaryTitle"].astype(str).to_numpy()
+        ).indices
+
+    @cached_property
+    def _titles_by_actor(self):
+        pairs = self.schema.title_actor
+        return pd.Series(pairs["title_id"].to_numpy()).groupby(pairs["actor_id"].to_numpy()).indices
+
+    def search_titles(self, search: str):
+        """Returns the sorted title ids of the picked actor or movie."""
+        kind, name = parse_search(search)
+        if kind == "title":
+            return self._titles_by_name.get(name, np.array([], dtype="int64"))
+        actor_ids = self.search_index.find("actor", name)
+        pairs = self.schema.title_actor["title_id"].to_numpy()
+        rows = [self._titles_by_actor.get(actor_id, np.array([], dtype="int64")) for actor_id in actor_ids]
+        return np.unique(pairs[np.concatenate(rows)]) if rows else np.array([], dtype="int64")
+
+    def _search_cells(self, genres: list, regions: list, years: list, search: str):
+        """Returns the selected facts of the picked actor or movie."""
+        cells = self.index.filter(genres, regions, years)
+        return cells[np.isin(cells["title_id"].to_numpy(), self.search_titles(search))]
+
+    def rows(self, genres: list, regions: list, years: list, grain: str, search=None):
+        """Returns the rows of one of the "box", "map" or "actor" `StarSchema` queries."""
+        rows = getattr(self.schema, f"{grain}_rows")(genres, regions, years)
+        if search:
+            rows = rows[np.isin(rows["title_id"].to_numpy(), self.search_titles(search))].reset_index(drop=True)
+        return rows
+
+    def summary(self, genres: list, regions: list, years: list, search=None):
+        """Returns the KPI statistics, see `Cube.rollup`."""
+        if not search:
+            return self.cube.rollup(genres, regions, years)
+        cells = self._search_cells(genres, regions, years, search)
+        title_ids = np.unique(cells["title_id"].to_numpy())
+        actor_rows = expand_ranges(*self.schema.actor_ranges(title_ids))
+        summary = {
+            "total_movies": self.schema.titles["primaryTitle"].iloc[title_ids].nunique(),
+            "total_actors": len(np.unique(self.schema.title_actor["actor_id"].to_numpy()[actor_rows]))
+        }
+        weights = cells["rows"].to_numpy(dtype="float64")
+        for measure in self.cube.measures:
+            values = self.schema.titles[measure].to_numpy(dtype="float64", na_value=np.nan)[cells["title_id"].to_numpy()]
+            present = ~np.isnan(values)
+            count = weights[present].sum()
+            summary[measure] = (values[present] * weights[present]).sum() / count if count else np.nan
+        return summary
+
+    def line_series(self, genres: list, regions: list, years: list, search=None):
+        """Returns the means per genre and year, see `Cube.line_series`."""
+        if not search:
+            return self.cube.line_series(genres, regions, years)
+        cells = self._search_cells(genres, regions, years, search)
+        frame = cells[["genres", "startYear"]].copy()
+        for measure in self.cube.measures:
+            values = self.schema.titles[measure].to_numpy(dtype="float64", na_value=np.nan)[cells["title_id"].to_numpy()]
+            present = ~np.isnan(values)
+            frame[f"{measure}_sum"] = np.where(present, values, 0) * cells["rows"].to_numpy()
+            frame[f"{measure}_count"] = np.where(present, cells["rows"].to_numpy(), 0)
+        frame = frame.groupby(["genres", "startYear"], sort=True, observed=True).sum().reset_index()
+        series = frame[["genres", "startYear"]].copy()
+        for measure in self.cube.measures:
+            count = frame[f"{measure}_count"].to_numpy(dtype="float64")
+            series[measure] = np.divide(
+                frame[f"{measure}_sum"].to_numpy(dtype="float64"), count,
+                out=np.full(len(count), np.nan), where=count > 0
+            )
+        return series
+
+    def box_data(self, genres: list, regions: list, years: list, search=None):
+        """Returns the boxplot statistics, see `RatingCountsIndex.box_data`."""
+        if not search:
+            return self._rating_counts.box_data(genres, regions, years)
+        cells = self._search_cells(genres, regions, years, search)
+        values, codes = rating_values(self.schema.titles["averageRating"].to_numpy()[cells["title_id"].to_numpy()])
+        genre_codes = cells["genres"].cat.codes.to_numpy()
+        present = codes >= 0
+        totals = np.zeros((len(self.genres), len(values)), dtype="int64")
+        np.add.at(totals, (genre_codes[present], codes[present]), 1)
+        return box_summary_data(list(cells["genres"].cat.categories), values, totals)
+
+    def top_rated(self, genres: list, years: list, search=None):
+        """Returns the top rated movie of every country, see `TopRatedIndex.select`."""
+        if not search:
+            return self._top_rated.select(genres, years)
+        return top_rated_per_country(self.rows(genres, self.regions, years, "box", search))
+
+    def top_actors(self, genres: list, regions: list, years: list, search=None):
+        """Returns the best (actor, movie) pairs, see `TopActorsIndex.top`."""
+        if not search:
+            return self._top_actors.top(genres, regions, years)
+        pairs = self.rows(genres, regions, years, "actor", search).drop_duplicates(["title_id", "primaryName"])
+        pairs = pairs.sort_values(
+            ["averageRating", "primaryName", "primaryTitle"], ascending=[False, True, True], na_position="last"
+        )
+        return pairs[["primaryName", "primaryTitle", "averageRating"]].head(self.k).reset_index(drop=True)
+
+
+class DuckDBBackend:
+    """
+    Backend running SQL queries with DuckDB directly over the data files.
+
+    The rows are scanned when a query runs, with the filters pushed down
+    to the scan, and only the aggregated results are kept in memory.
+    Queries are vectorized and use all the threads DuckDB is allowed.
+
+    Parameters
+    ----------
+    data_path : string
+        The feather file, or the directory of the Parquet dataset written
+        by `src.etl`.
+    codes_path : string
+        Path to `country_codes.csv`.
+    k : int
+        Number of (actor, movie) pairs `top_actors` returns.
+    """
+
+    name = "duckdb"
+
+    def __init__(self, data_path: str, codes_path: str, k=TOP_K):
+        import duckdb  # Optional dependency, only needed by this backend
+        import pyarrow.dataset as ds
+
+        self.k = k
+        self._duckdb = duckdb
+        if os.path.isdir(data_path):
+            self._source = ds.dataset(data_path, format="parquet", partitioning="hive")
+        else:
+            self._source = ds.dataset(data_path, format="feather")
+        self._region_codes = load_region_codes(codes_path).reset_index()
+        self._local = threading.local()
+        self._pid = None
+
+        options = self.query(
+            "SELECT list(DISTINCT genres ORDER BY genres), list(DISTINCT name ORDER BY name), "
+            "min(startYear), max(startYear) FROM imdb WHERE genres IS NOT NULL AND startYear IS NOT NULL"
+        ).iloc[0]
+        self.genres = list(options.iloc[0])
+        self.regions = list(options.iloc[1])
+        self.min_year = int(options.iloc[2])
+        self.max_year = int(options.iloc[3])
+        logger.info("Querying %s with DuckDB %s", data_path, duckdb.__version__)
+
+    def _cursor(self):
+        """Opens a cursor of the process' connection, with the `imdb` view over the data files."""
+        cursor = self._connection.cursor()
+        # Registered objects and temporary views are only visible to their cursor
+        cursor.register("source", self._source)
+        cursor.register("region_codes", self._region_codes)
+        cursor.execute("""
+            CREATE TEMP VIEW imdb AS
+            SELECT
+                data.tconst,
+                data.primaryTitle,
+                CAST(data.startYear AS INTEGER) AS startYear,
+                CAST(data.runtimeMinutes AS FLOAT) AS runtimeMinutes,
+                CAST(data.averageRating AS FLOAT) AS averageRating,
+                data.primaryName,
+                data.genres,
+                region_codes.name,
+                region_codes.country_code
+            FROM source AS data
+            JOIN region_codes ON data.region = region_codes.alpha_2
+            WHERE data.tconst IS NOT NULL
+        """)
+        return cursor
+
+    def query(self, sql: str, parameters=None):
+        """
+        Runs a query and returns its result.
+
+        Every thread queries through its own cursor of the process' connection,
+        the connection is reopened after a fork.
+
+        Parameters
+        ----------
+        sql : string
+            The query, reading the `imdb` view.
+        parameters : list, optional
+            The values of the query's `?` placeholders.
+
+        Returns
+        -------
+        result : pandas dataframe
+            The rows of the result.
+        """
+        if self._pid != os.getpid():
+            self._connection = self._duckdb.connect()
+            self._local = threading.local()
+            self._pid = os.getpid()
+        if not hasattr(self._local, "cursor"):
+            self._local.cursor = self._cursor()
+        return self._local.cursor.execute(sql, parameters or []).df()
+
+    @cached_property
+    def search_index(self):
+        """Returns the `NameIndex` of the distinct actor and movie names."""
+        return NameIndex({
+            kind: self.query(f"SELECT DISTINCT {column} AS name FROM imdb WHERE {column} IS NOT NULL")["name"].tolist()
+            for kind, column in [("actor", "primaryName"), ("title", "primaryTitle")]
+        })
+
+    @staticmethod
+    def _where(genres: list, regions, years: list, search=None):
+        """Returns the filter of a selection and its parameters, `regions=None` keeps all regions."""
+        condition = "list_contains(?, genres) AND startYear BETWEEN ? AND ?"
+        parameters = [list(genres or []), int(years[0]), int(years[1])]
+        if regions is not None:
+            condition += " AND list_contains(?, name)"
+            parameters.append(list(regions or []))
+        if search:
+            kind, name = parse_search(search)
+            if kind == "title":
+                condition += " AND primaryTitle = ?"
+            else:
+                # Every actor of the movies of the picked actor
+                condition += " AND tconst IN (SELECT tconst FROM imdb WHERE primaryName = ?)"
+            parameters.append(name)
+        return condition, parameters
+
+    def rows(self, genres: list, regions: list, years: list, grain: str, search=None):
+        """
+        Returns the rows of one of the "box", "map" or "actor" grains.
+
+        The columns are those of the `StarSchema` queries, with the title
+        identified by `tconst` instead of `title_id`.
+        """
+        where, parameters = self._where(genres, regions, years, search)
+        columns = {
+            "box": "tconst, genres, name, country_code, startYear, primaryTitle, runtimeMinutes, averageRating",
+            "map": "tconst, name, country_code, primaryTitle, averageRating",
+            "actor": "tconst, primaryName, primaryTitle, averageRating"
+        }[grain]
+        extra = " AND primaryName IS NOT NULL" if grain == "actor" else ""
+        return self.query(f"SELECT DISTINCT {columns} FROM imdb WHERE {where}{extra} ORDER BY ALL", parameters)
+
+    def summary(self, genres: list, regions: list, years: list, search=None):
+        """Returns the same statistics as `Cube.rollup`, with exact distinct counts."""
+        where, parameters = self._where(genres, regions, years, search)
+        summary = self.query(f"""
+            SELECT
+                count(DISTINCT primaryTitle) AS total_movies,
+                count(DISTINCT primaryName) AS total_actors,
+                avg(averageRating) AS averageRating,
+                avg(runtimeMinutes) AS runtimeMinutes
+            FROM imdb WHERE {where}
+        """, parameters).iloc[0]
+        return {
+            "total_movies": int(summary["total_movies"]),
+            "total_actors": int(summary["total_actors"]),
+            "averageRating": float(summary["averageRating"]) if pd.notna(summary["averageRating"]) else np.nan,
+            "runtimeMinutes": float(summary["runtimeMinutes"]) if pd.notna(summary["runtimeMinutes"]) else np.nan
+        }
+
+    def line_series(self, genres: list, regions: list, years: list, search=None):
+        """Returns the mean of every measure per genre and year, over the exploded rows like the cube."""
+        where, parameters = self._where(genres, regions, years, search)
+        return self.query(f"""
+            SELECT genres, startYear, avg(averageRating) AS averageRating, avg(runtimeMinutes) AS runtimeMinutes
+            FROM imdb WHERE {where}
+            GROUP BY genres, startYear
+            ORDER BY genres, startYear
+        """, parameters)
+
+    def box_data(self, genres: list, regions: list, years: list, search=None):
+        """Returns the boxplot statistics, one rating per (title, genre, region)."""
+        where, parameters = self._where(genres, regions, years, search)
+        counts = self.query(f"""
+            SELECT genres, round(CAST(averageRating AS DOUBLE), 1) AS rating, count(*) AS n
+            FROM (SELECT DISTINCT tconst, genres, name, averageRating FROM imdb WHERE {where})
+            WHERE averageRating IS NOT NULL
+            GROUP BY genres, rating
+        """, parameters)
+        values = np.unique(counts["rating"].to_numpy(dtype="float64"))
+        totals = np.zeros((len(self.genres), len(values)), dtype="int64")
+        genre_codes = pd.Categorical(counts["genres"], categories=self.genres).codes
+        np.add.at(totals, (genre_codes, np.searchsorted(values, counts["rating"].to_numpy())), counts["n"].to_numpy())
+        return box_summary_data(self.genres, values, totals)
+
+    def top_rated(self, genres: list, years: list, search=None):
+        """Returns the top rated movie of every country, ties broken by title."""
+        where, parameters = self._where(genres, None, years, search)
+        return self.query(f"""
+            SELECT country_code, primaryTitle, averageRating
+            FROM imdb WHERE {where}
+            QUALIFY row_number() OVER (
+                PARTITION BY country_code
+                ORDER BY averageRating DESC NULLS LAST, primaryTitle ASC NULLS LAST
+            ) = 1
+            ORDER BY country_code
+        """, parameters)
+
+    def top_actors(self, genres: list, regions: list, years: list, search=None):
+        """Returns the K best (actor, movie) pairs, by rating and then by actor and title name."""
+        where, parameters = self._where(genres, regions, years, search)
+        return self.query(f"""
+            SELECT primaryName, primaryTitle, averageRating
+            FROM (
+                SELECT DISTINCT tconst, primaryName, primaryTitle, averageRating
+                FROM imdb WHERE {where} AND primaryName IS NOT NULL
+            )
+            ORDER BY averageRating DESC NULLS LAST, primaryName, primaryTitle
+            LIMIT {int(self.k)}
+        """, parameters)
@@ -1,36 +1,31 @@
+from functools import lru_cache
+
+import numpy as np
 import pandas as pd
-import altair as alt
+from .filter_index import expand_ranges
+from .instrumentation import instrumented
+from .rendering import chart_spec, render_html, to_values
 
-def generate_bar_chart(data, top):
+EMBED_OPTIONS = {"actions": False, "theme": "dark"}
+TOP_K = 15  # Largest value of the top N slider
+
+
+@lru_cache(maxsize=None)
+def bar_chart_spec():
     """
-    Generate the horizontal bar chart to show top actors in the top rated movies.
+    Build the horizontal bar chart spec, it has no static parameters and is compiled once.
 
-    Parameters
-    ----------
-    data : pandas dataframe
-           Dataframe containing the data to plot.
-    top : int
-          Number of actors to show. 
-    
     Results
     -------
-    chart : html of altair Chart
-            The generated bar chart converted to html
+    spec : dict
+           The Vega-Lite spec, reading its rows from the `bar` dataset.
     """
+    import altair as alt  # Imported on first use, it is slow to import
 
-    alt.renderers.set_embed_options(theme='dark')
-    x = 'averageRating'
-    y = 'primaryName'
-    t = 'primaryTitle'
-
-    actors = (data[[x, y, t]]
-            .groupby([y, t])[x]
-            .mean()
-            .sort_values(ascending=False)
-            .head(top))
-    actors = pd.DataFrame.from_dict(actors)
-    actors = actors.reset_index()
-    actors.columns = [y, t, x]
+    x = 'averageRating:Q'
+    y = 'primaryName:N'
+    t = 'primaryTitle:N'
+    actors = alt.Data(name="bar")
 
     chart = alt.Chart(
         data=actors
@@ -72,7 +67,7 @@ def generate_bar_chart(data, top):
         color=alt.value('white')
     )
 
-    return (chart + text).configure_axis(
+    return chart_spec((chart + text).configure_axis(
                 grid=False
             ).configure_view(
                 strokeWidth=0
@@ -87,4 +82,143 @@ def generate_bar_chart(data, top):
                 width=180,
                 background='#000000'
             ).interactive(
-            ).to_html()
\ No newline at end of file
+            ))
+
+
+class TopActorsIndex:
+    """
+    Precomputed top K (actor, movie) pairs of every (genre, region, year) cell.
+
+    Every pair gets one global rank, by rating and then by actor and title
+    name. A pair in the top K of a selection is in the top K of each of its
+    cells, so merging the lists of the selected cells and keeping the K
+    smallest distinct ranks gives the exact leaderboard without touching
+    the full actor table.
+
+    Parameters
+    ----------
+    schema : StarSchema
+        The normalised dataset.
+    k : int
+        Number of pairs kept per cell.
+    """
+
+    def __init__(self, schema, k=TOP_K):
+        self.k = k
+        self.index = schema.index
+        titles = schema.titles
+        pairs = schema.title_actor
+        title_ids = pairs["title_id"].to_numpy()
+        actor_ids = pairs["actor_id"].to_numpy()
+
+        # Global rank of every title_actor row
+        ratings = titles["averageRating"].to_numpy(dtype="float64")[title_ids]
+        title_names = pd.factorize(titles["primaryTitle"].astype(str), sort=True)[0][title_ids]
+        actor_names = pd.factorize(schema.actors["primaryName"].astype(str), sort=True)[0][actor_ids]
+        order = np.lexsort((title_names, actor_names, np.where(np.isnan(ratings), np.inf, -ratings)))
+        ranks = np.empty(len(order), dtype="int64")
+        ranks[order] = np.arange(len(order))
+        self._pairs = order
+
+        # Every fact row contributes the actors of its title to its cell
+        cells = self.index.row_cells()
+        valid = cells >= 0
+        starts, lengths = schema.actor_ranges(self.index.data["title_id"].to_numpy()[valid])
+        pair_ranks = ranks[expand_ranges(starts, lengths)]
+        pair_cells = np.repeat(cells[valid], lengths)
+
+        # Keep the K best ranks of every cell
+        order = np.lexsort((pair_ranks, pair_cells))
+        pair_ranks, pair_cells = pair_ranks[order], pair_cells[order]
+        cell_starts = np.searchsorted(pair_cells, np.arange(self.index.n_cells + 1))
+        keep = np.arange(len(pair_cells)) - cell_starts[pair_cells] < k
+        self._ranks = pair_ranks[keep]
+        self._offsets = np.searchsorted(pair_cells[keep], np.arange(self.index.n_cells + 1))
+
+        self._titles = titles["primaryTitle"]
+        self._ratings = titles["averageRating"]
+        self._names = schema.actors["primaryName"]
+        self._title_ids = title_ids
+        self._actor_ids = actor_ids
+
+    def top(self, genres: list, regions: list, years: list):
+        """
+        Finds the K best (actor, movie) pairs of a filter selection.
+
+        Parameters
+        ----------
+        genres : list
+            The genres to keep.
+        regions : list
+            The region names to keep.
+        years : list
+            The inclusive [start, end] years to keep.
+
+        Returns
+        -------
+        top : pandas dataframe
+            The `primaryName`, `primaryTitle` and `averageRating` of at most
+            K pairs, best first.
+        """
+        cells = self.index.cell_ids(genres, regions, years)
+        starts = self._offsets[cells]
+        candidates = self._ranks[expand_ranges(starts, self._offsets[cells + 1] - starts)]
+        rows = self._pairs[np.unique(candidates)[:self.k]]
+        title_ids = self._title_ids[rows]
+        return pd.DataFrame({
+            "primaryName": self._names.to_numpy()[self._actor_ids[rows]],
+            "primaryTitle": self._titles.to_numpy()[title_ids],
+            "averageRating": self._ratings.to_numpy()[title_ids]
+        })
+
+
+def bar_chart_data(data, top):
+    """
+    Compute the top actors in the top rated movies.
+
+    Parameters
+    ----------
+    data : pandas dataframe
+           Dataframe containing the data to plot.
+    top : int
+          Number of actors to show.
+
+    Results
+    -------
+    datasets : dict
+               The values of the `bar` dataset.
+    """
+    x = 'averageRating'
+    y = 'primaryName'
+    t = 'primaryTitle'
+
+    # Partial selection, ties keep the (actor, movie) name order
+    actors = (data[[x, y, t]]
+            .groupby([y, t], observed=True)[x]
+            .mean()
+            .nlargest(top))
+    actors = pd.DataFrame.from_dict(actors)
+    actors = actors.reset_index()
+    actors.columns = [y, t, x]
+    actors[x] = actors[x].astype("float64").round(1)  # Ratings are stored as float32
+    return {"bar": to_values(actors)}
+
+
+@instrumented
+def generate_bar_chart(data, top):
+    """
+    Generate the horizontal bar chart to show top actors in the top rated movies.
+
+    Parameters
+    ----------
+    data : pandas dataframe
+           Dataframe containing the data to plot.
+    top : int
+          Number of actors to show.
+
+    Results
+    -------
+    chart : html of altair Chart
+            The generated bar chart converted to html
+    """
+    return render_html(bar_chart_spec(), bar_chart_data(data, top), EMBED_OPTIONS)
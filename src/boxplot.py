@@ -1,49 +1,72 @@
-import altair as alt
-import pandas as pd
-from .constants import genre_color_map
+from functools import lru_cache
 
+import numpy as np
+import pandas as pd
+from .constants import genre_color
+from .instrumentation import instrumented
+from .rendering import chart_spec, render_html, to_values
 
 
-def generate_box_plot(data: pd.DataFrame):
+@lru_cache(maxsize=None)
+def box_plot_spec(genres: tuple):
     """"
-    Generates the boxplot for the dashboard
+    Builds the boxplot spec, compiled once per set of genres
 
     Parameters
     ----------
-    data : pandas dataframe
-        The dataframe that contains the data to plot.
+    genres : tuple
+        The genres shown in the legend, in legend order.
 
     Returns
     -------
-    chart : html of altair Chart
-        The generated boxplot converted to html
+    spec : dict
+        The Vega-Lite spec, reading its rows from the `box` dataset.
     """
+    import altair as alt  # Imported on first use, it is slow to import
 
-    # Prepare data for boxplot
-    data = data.drop(['primaryName','Unnamed: 0'], axis=1)
-    data = data.drop_duplicates()
-    
     # Filter the colours for the legend
-    genre_names = data.genres.unique()
+    genre_names = list(genres)
     genre_colors = []
     for genre in genre_names:
-        genre_colors.append(genre_color_map[genre])
-
-    # Create Boxplot
-    chart = alt.Chart(data).mark_boxplot(size=25, color="gold").encode(
-        x=alt.X('genres',
-                axis=alt.Axis(title="", labelAngle=-45)),
-        y=alt.Y('averageRating',
-                title="IMDb Rating"),
-        color=alt.Color('genres',
-                        scale=alt.Scale(
-                            domain=genre_names,
-                            range=genre_colors
-                        ),
-                        title="Genre")
+        genre_colors.append(genre_color(genre))
+
+    # Create Boxplot from the quartiles computed on the server
+    x = alt.X('genres:N', axis=alt.Axis(title="", labelAngle=-45))
+    color = alt.Color('genres:N',
+                      scale=alt.Scale(
+                          domain=genre_names,
+                          range=genre_colors
+                      ),
+                      title="Genre")
+    tooltip = [alt.Tooltip('genres:N', title="Genre"),
+               alt.Tooltip('upper:Q', title="Upper Whisker"),
+               alt.Tooltip('q3:Q', title="Q3"),
+               alt.Tooltip('median:Q', title="Median"),
+               alt.Tooltip('q1:Q', title="Q1"),
+               alt.Tooltip('lower:Q', title="Lower Whisker")]
+    summary = alt.Chart(alt.Data(name="box")).encode(x=x)
+
+    whiskers = summary.mark_rule(color="gold").encode(
+        y=alt.Y('lower:Q', title="IMDb Rating"),
+        y2='upper:Q'
     )
+    boxes = summary.mark_bar(size=25).encode(
+        y='q1:Q',
+        y2='q3:Q',
+        color=color,
+        tooltip=tooltip
+    )
+    medians = summary.mark_tick(size=25, color="white").encode(
+        y='median:Q'
+    )
+    outliers = alt.Chart(alt.Data(name="box_outliers")).mark_point().encode(
+        x=x,
+        y='averageRating:Q',
+        color=color
+    )
+    chart = alt.layer(whiskers, boxes, medians, outliers)
 
-    return chart.configure_axis(
+    return chart_spec(chart.configure_axis(
                 grid=False
             ).configure_view(
                 strokeWidth=0
@@ -60,4 +83,168 @@ def generate_box_plot(data: pd.DataFrame):
                 height=260,
                 width=350,
                 background='#000000'
-            ).to_html()
+            ))
+
+
+def _sorted_value(cumulative, position):
+    """Returns the index of the distinct value at each 0-based position of the sorted ratings."""
+    return np.searchsorted(cumulative, position, side="right")
+
+
+def box_summary_data(genres: list, values, counts):
+    """"
+    Computes the boxplot statistics of each genre from its rating counts
+
+    The quartiles are interpolated like Vega's (type 7), the whiskers reach
+    the most extreme ratings within 1.5 IQR of the box and every rating
+    beyond them is an outlier.
+
+    Parameters
+    ----------
+    genres : list
+        The genre of every row of `counts`.
+    values : numpy array
+        The sorted distinct ratings.
+    counts : numpy array
+        Number of ratings of each genre (rows) equal to each value (columns).
+
+    Returns
+    -------
+    genres : tuple
+        The genres present in the data, the static parameter of the spec.
+    datasets : dict
+        The statistics in the `box` dataset, the outliers in `box_outliers`.
+    """
+    summaries = []
+    outliers = []
+    for genre, genre_counts in zip(genres, counts):
+        total = genre_counts.sum()
+        if not total:
+            continue
+
+        cumulative = np.cumsum(genre_counts)
+        stats = {"genres": genre}
+        for name, q in [("q1", 0.25), ("median", 0.5), ("q3", 0.75)]:
+            position = (total - 1) * q
+            low = values[_sorted_value(cumulative, np.floor(position))]
+            high = values[_sorted_value(cumulative, np.ceil(position))]
+            stats[name] = low + (position - np.floor(position)) * (high - low)
+
+        iqr = stats["q3"] - stats["q1"]
+        present = values[genre_counts > 0]
+        inside = (present >= stats["q1"] - 1.5 * iqr) & (present <= stats["q3"] + 1.5 * iqr)
+        stats["lower"] = present[inside].min()
+        stats["upper"] = present[inside].max()
+        summaries.append(stats)
+        outliers.extend({"genres": genre, "averageRating": value} for value in present[~inside])
+
+    summaries = pd.DataFrame(summaries, columns=["genres", "lower", "q1", "median", "q3", "upper"])
+    summaries = summaries.sort_values("genres").round(2)
+    outliers = pd.DataFrame(outliers, columns=["genres", "averageRating"])
+    return tuple(summaries.genres), {"box": to_values(summaries), "box_outliers": to_values(outliers)}
+
+
+def rating_values(ratings):
+    """Returns the sorted distinct ratings, rounded to one decimal, and the value index of each rating, -1 if missing."""
+    ratings = np.asarray(ratings, dtype="float64").round(1)  # Ratings are stored as float32
+    present = ~np.isnan(ratings)
+    values, inverse = np.unique(ratings[present], return_inverse=True)
+    codes = np.full(len(ratings), -1, dtype="int64")
+    codes[present] = inverse
+    return values, codes
+
+
+def box_plot_data(data: pd.DataFrame):
+    """"
+    Prepares the statistics of the boxplot
+
+    Parameters
+    ----------
+    data : pandas dataframe
+        The dataframe that contains the data to plot, one row
+        per (title, genre, region).
+
+    Returns
+    -------
+    genres : tuple
+        The genres present in the data, the static parameter of the spec.
+    datasets : dict
+        The statistics in the `box` dataset, the outliers in `box_outliers`.
+    """
+    data = data[data.genres.notna() & data.averageRating.notna()]
+    values, codes = rating_values(data.averageRating)
+    genres, genre_codes = np.unique(data.genres.astype(str), return_inverse=True)
+    counts = np.bincount(genre_codes * len(values) + codes, minlength=len(genres) * len(values))
+    return box_summary_data(list(genres), values, counts.reshape(len(genres), len(values)))
+
+
+class RatingCountsIndex:
+    """"
+    Number of ratings equal to each distinct value, per (genre, region, year) cell
+
+    The counts of any selection are the sum of the counts of its cells,
+    so the exact boxplot statistics never need the selected rows.
+
+    Parameters
+    ----------
+    schema : StarSchema
+        The normalised dataset, one rating per (title, genre, region) fact.
+    """
+
+    def __init__(self, schema):
+        self.index = schema.index
+        cells = self.index.row_cells()
+        ratings = schema.titles["averageRating"].to_numpy()[self.index.data["title_id"].to_numpy()]
+        self.values, codes = rating_values(ratings)
+        keep = (cells >= 0) & (codes >= 0)
+        counts = np.bincount(
+            cells[keep] * len(self.values) + codes[keep],
+            minlength=self.index.n_cells * len(self.values)
+        )
+        self.counts = counts.astype("int32").reshape(self.index.n_cells, len(self.values))
+
+    def box_data(self, genres: list, regions: list, years: list):
+        """"
+        Prepares the statistics of the boxplot for a filter selection
+
+        Parameters
+        ----------
+        genres : list
+            The genres to keep.
+        regions : list
+            The region names to keep.
+        years : list
+            The inclusive [start, end] years to keep.
+
+        Returns
+        -------
+        genres : tuple
+            The genres present in the selection, the static parameter of the spec.
+        datasets : dict
+            The statistics in the `box` dataset, the outliers in `box_outliers`.
+        """
+        cells = self.index.cell_ids(genres, regions, years)
+        genre_codes = cells // (self.index.n_cells // len(self.index.genres))
+        totals = np.zeros((len(self.index.genres), len(self.values)), dtype="int64")
+        np.add.at(totals, genre_codes, self.counts[cells])
+        return box_summary_data(self.index.genres, self.values, totals)
+
+
+@instrumented
+def generate_box_plot(data: pd.DataFrame):
+    """"
+    Generates the boxplot for the dashboard
+
+    Parameters
+    ----------
+    data : pandas dataframe
+        The dataframe that contains the data to plot, one row
+        per (title, genre, region).
+
+    Returns
+    -------
+    chart : html of altair Chart
+        The generated boxplot converted to html
+    """
+    genres, datasets = box_plot_data(data)
+    return render_html(box_plot_spec(genres), datasets)
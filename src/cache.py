@@ -0,0 +1,337 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+
+import numpy as np
+import pandas as pd
+
+
+def filter_key(genres: list, regions: list, years: list, search=None):
+    """
+    Builds the canonical cache key for a filter selection.
+
+    The key does not depend on the order in which genres or regions
+    were picked, so equivalent selections share one cache entry.
+
+    Parameters
+    ----------
+    genres : list
+        The selected genres.
+    regions : list
+        The selected region names.
+    years : list
+        The selected [start, end] year range.
+    search : string, optional
+        The actor or movie picked in the search box.
+
+    Returns
+    -------
+    key : string
+        Hex digest identifying the selection.
+    """
+    signature = [sorted(genres or []), sorted(regions or []), [int(years[0]), int(years[1])]]
+    if search:
+        signature.append(search)  # Selections without a search keep their keys
+    signature = json.dumps(signature)
+    return hashlib.sha1(signature.encode("utf-8")).hexdigest()
+
+
+def _count_lookup(cache, name, hit: bool):
+    """Counts a hit or miss of `cache`, in total and for the caller `name`."""
+    counts = cache.lookups.setdefault(name, [0, 0])
+    if hit:
+        cache.hits += 1
+        counts[0] += 1
+    else:
+        cache.misses += 1
+        counts[1] += 1
+
+
+def size_of(value):
+    """
+    Estimates the memory footprint of a cached value in bytes.
+
+    Tuples, lists and dicts are measured with everything they hold.
+
+    Parameters
+    ----------
+    value : object
+        The value to measure.
+
+    Returns
+    -------
+    size : int
+        Approximate size in bytes.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, np.ndarray):
+        return sys.getsizeof(value) + (0 if value.flags.owndata else value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(size_of(key) + size_of(item) for key, item in value.items())
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(size_of(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache that evicts by total size in bytes.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Total size the cached values may occupy before the least
+        recently used entries are evicted.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # [hits, misses] by the name of the caller
+        self.lookups = {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, name=None):
+        """Returns the cached value for `key`, or None if it is missing, counting the lookup for `name`."""
+        with self._lock:
+            entry = self._entries.get(key)
+            _count_lookup(self, name, entry is not None)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        """Stores `value` under `key`, evicting old entries if needed."""
+        size = size_of(value)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return  # Too large to ever fit, don't flush the cache for it
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted
+
+    def get_or_compute(self, key, compute, name=None):
+        """
+        Returns the cached value for `key`, computing and storing it on a miss.
+
+        Parameters
+        ----------
+        key : hashable
+            The cache key.
+        compute : callable
+            Zero-argument function producing the value.
+        name : string, optional
+            The caller, its hits and misses are counted in `lookups`.
+
+        Returns
+        -------
+        value : object
+            The cached or freshly computed value.
+        """
+        value = self.get(key, name)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def evict(self, keep):
+        """Removes the entries whose key `keep` returns False for."""
+        with self._lock:
+            for key in [key for key in self._entries if not keep(key)]:
+                self.current_bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        """Removes every entry from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+
+def render_key(chart: str, version: str, *params):
+    """
+    Builds the content address of a rendered chart.
+
+    Parameters
+    ----------
+    chart : string
+        Name of the chart.
+    version : string
+        Identifies the dataset and the rendering setup, see `dataset_version`.
+    *params
+        Everything else the rendered chart depends on, JSON serialisable.
+
+    Returns
+    -------
+    key : string
+        Hex digest identifying the rendered chart.
+    """
+    signature = json.dumps([chart, version, *params])
+    return hashlib.sha256(signature.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """
+    Rendered charts stored on disk, shared by all workers and restarts.
+
+    The charts are stored compressed in a SQLite file under their
+    `render_key`, with the version they were rendered from. When the file
+    holds more than `max_bytes` of charts the least recently used ones are
+    evicted.
+
+    Parameters
+    ----------
+    path : string
+        Location of the SQLite file, created if missing.
+    max_bytes : int
+        Total compressed size of the stored charts, 0 disables the cache.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # [hits, misses] by the name of the caller
+        self.lookups = {}
+        self._lock = threading.Lock()
+        if not max_bytes:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS renders "
+                "(key TEXT PRIMARY KEY, value BLOB, size INTEGER, accessed REAL, version TEXT)"
+            )
+            # Files written before the charts recorded their version
+            if "version" not in [row[1] for row in connection.execute("PRAGMA table_info(renders)")]:
+                try:
+                    connection.execute("ALTER TABLE renders ADD COLUMN version TEXT")
+                except sqlite3.OperationalError:
+                    pass  # Added by another worker in the meantime
+            connection.execute("CREATE INDEX IF NOT EXISTS renders_accessed ON renders (accessed)")
+
+    @contextmanager
+    def _connect(self):
+        """Opens a connection, commits what it ran if nothing failed and closes it."""
+        with closing(sqlite3.connect(self.path, timeout=5)) as connection, connection:
+            yield connection
+
+    def __len__(self):
+        if not self.max_bytes:
+            return 0
+        with self._connect() as connection:
+            return connection.execute("SELECT count(*) FROM renders").fetchone()[0]
+
+    def get(self, key: str, name=None):
+        """Returns the chart stored under `key`, or None if it is missing, counting the lookup for `name`."""
+        if not self.max_bytes:
+            return None
+        with self._connect() as connection:
+            row = connection.execute("SELECT value FROM renders WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE renders SET accessed = ? WHERE key = ?", (time.time(), key))
+        with self._lock:
+            _count_lookup(self, name, row is not None)
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key: str, value, version=None):
+        """Stores a chart under `key`, evicting the least recently used ones if needed."""
+        if not self.max_bytes:
+            return
+        blob = zlib.compress(json.dumps(value).encode("utf-8"))
+        if len(blob) > self.max_bytes:
+            return
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO renders VALUES (?, ?, ?, ?, ?)", (key, blob, len(blob), time.time(), version)
+            )
+            excess = connection.execute("SELECT sum(size) FROM renders").fetchone()[0] - self.max_bytes
+            if excess > 0:
+                evicted = []
+                for old_key, size in connection.execute("SELECT key, size FROM renders ORDER BY accessed"):
+                    if excess <= 0:
+                        break
+                    evicted.append((old_key,))
+                    excess -= size
+                connection.executemany("DELETE FROM renders WHERE key = ?", evicted)
+
+    def get_or_compute(self, key: str, compute, version=None, name=None):
+        """
+        Returns the chart stored under `key`, rendering and storing it on a miss.
+
+        Parameters
+        ----------
+        key : string
+            The `render_key` of the chart.
+        compute : callable
+            Zero-argument function rendering the chart.
+        version : string, optional
+            The version the chart is rendered from, see `evict`.
+        name : string, optional
+            The caller, its hits and misses are counted in `lookups`.
+
+        Returns
+        -------
+        value : string or dict
+            The stored or freshly rendered chart.
+        """
+        value = self.get(key, name)
+        if value is None:
+            value = compute()
+            self.put(key, value, version)
+        return value
+
+    def evict(self, version: str, idle=0):
+        """
+        Removes the charts rendered from another version than `version`.
+
+        During a reload the workers run different versions for a while, so
+        only the charts no worker used for `idle` seconds are removed, the
+        others are left to the least recently used eviction.
+
+        Parameters
+        ----------
+        version : string
+            The version whose charts are kept.
+        idle : float
+            Seconds since the last use of a chart of another version before
+            it is removed.
+        """
+        if self.max_bytes:
+            with self._connect() as connection:
+                connection.execute(
+                    "DELETE FROM renders WHERE version IS NOT ? AND accessed < ?", (version, time.time() - idle)
+                )
+
+    def clear(self):
+        """Removes every stored chart."""
+        if self.max_bytes:
+            with self._connect() as connection:
+                connection.execute("DELETE FROM renders")
@@ -0,0 +1,54 @@
+import os
+import tempfile
+
+# Upper bound, in bytes, for the in-process cache of filtered datasets
+RESULT_CACHE_BYTES = int(os.environ.get("IMDB_RESULT_CACHE_BYTES", 256 * 1024 ** 2))
+
+# Location of the IMDb extract and the region lookup table
+DATA_DIR = os.environ.get("IMDB_DATA_DIR", "/app/data")
+DATA_PATH = os.path.join(DATA_DIR, "imdb_2011-2020.feather")
+COUNTRY_CODES_PATH = os.path.join(DATA_DIR, "country_codes.csv")
+
+# Share one memory-mapped Arrow copy of the dataset tables between all workers
+SHARED_DATA = os.environ.get("IMDB_SHARED_DATA", "0") == "1"
+SHARED_DATA_PATH = os.environ.get("IMDB_SHARED_DATA_PATH", os.path.join(DATA_DIR, "imdb_2011-2020-arrow"))
+
+# "pandas" answers the filters from in-memory indexes, "duckdb" queries QUERY_DATA_PATH, the
+# feather file or the year-partitioned Parquet directory written by src/etl.py, without loading it
+QUERY_BACKEND = os.environ.get("IMDB_QUERY_BACKEND", "pandas")
+QUERY_DATA_PATH = os.environ.get("IMDB_QUERY_DATA_PATH", DATA_PATH)
+
+# Seconds between two checks of the dataset files for a new version to load, 0 disables the reload
+RELOAD_INTERVAL = float(os.environ.get("IMDB_RELOAD_INTERVAL", 60))
+
+# "html" renders every chart to a full HTML document in an iframe, "vega"
+# keeps one Vega view per chart in the page and only sends it new data
+RENDER_MODE = os.environ.get("IMDB_RENDER_MODE", "vega")
+
+# Compress the callback responses, set IMDB_HTTP_COMPRESSION=0 when a proxy in front of the app does it
+HTTP_COMPRESSION = os.environ.get("IMDB_HTTP_COMPRESSION", "1") == "1"
+
+# Threads rendering the charts of one interaction concurrently, in every worker
+RENDER_THREADS = int(os.environ.get("IMDB_RENDER_THREADS", 4))
+
+# Latest filter update of every browser session, shared by the workers to drop stale requests
+REQUEST_REGISTRY_PATH = os.environ.get(
+    "IMDB_REQUEST_REGISTRY_PATH", os.path.join(tempfile.gettempdir(), "imdb_dashboard", "requests.sqlite")
+)
+
+# Rendered charts shared by the workers and kept across restarts, IMDB_RENDER_CACHE_BYTES=0 disables it
+RENDER_CACHE_PATH = os.environ.get(
+    "IMDB_RENDER_CACHE_PATH", os.path.join(tempfile.gettempdir(), "imdb_dashboard", "renders.sqlite")
+)
+RENDER_CACHE_BYTES = int(os.environ.get("IMDB_RENDER_CACHE_BYTES", 512 * 1024 ** 2))
+
+# Per-callback latency metrics at /metrics, summed over the workers through METRICS_PATH
+METRICS = os.environ.get("IMDB_METRICS", "0") == "1"
+METRICS_PATH = os.environ.get("IMDB_METRICS_PATH", os.path.join(tempfile.gettempdir(), "imdb_dashboard", "metrics"))
+
+# Share of the requests profiled with pyinstrument, the slow ones are written to PROFILE_DIR
+PROFILE_RATE = float(os.environ.get("IMDB_PROFILE_RATE", 0))
+PROFILE_SLOW_MS = float(os.environ.get("IMDB_PROFILE_SLOW_MS", 500))
+PROFILE_DIR = os.environ.get("IMDB_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "imdb_dashboard", "profiles"))
+
+LOG_LEVEL = os.environ.get("IMDB_LOG_LEVEL", "INFO")
@@ -1,3 +1,5 @@
+import zlib
+
 genre_color_map = {
     "Action": "#e60049",
     "Crime": "#0bb4ff",
@@ -7,3 +9,13 @@ genre_color_map = {
     "Sci-Fi": "#b3d4ff",
     "Thriller": "#dc0ab4"
     }
+
+# Colours of the genres missing from `genre_color_map`, e.g. in a full catalog
+fallback_genre_colors = ["#ffa300", "#00bfa0", "#fd7f6f", "#7eb0d5", "#b2e061", "#bd7ebe", "#ffb55a", "#8bd3c7"]
+
+
+def genre_color(genre: str):
+    """Returns the colour of a genre, a fallback colour picked from its name if it has none."""
+    if genre in genre_color_map:
+        return genre_color_map[genre]
+    return fallback_genre_colors[zlib.crc32(genre.encode("utf-8")) % len(fallback_genre_colors)]
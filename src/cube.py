@@ -0,0 +1,315 @@
+import numpy as np
+import pandas as pd
+
+from .filter_index import FilterIndex, expand_ranges
+
+# Distinct counts over at most this many (cell, value) pairs are exact, larger ones are estimated
+EXACT_DISTINCT_LIMIT = 500_000
+
+
+def _hash_column(column: pd.Series):
+    """Hashes every value of a column to a uint64, hashing each category only once."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        category_hashes = pd.util.hash_array(column.cat.categories.to_numpy(dtype=object))
+        codes = column.cat.codes.to_numpy()
+        hashes = category_hashes[np.maximum(codes, 0)]
+        return hashes, codes >= 0
+    values = column.to_numpy(dtype=object)
+    return pd.util.hash_array(values), ~pd.isna(values)
+
+
+def _bit_length(values):
+    """Vectorised int.bit_length for uint64 arrays."""
+    high = (values >> np.uint64(32)).astype("float64")
+    low = (values & np.uint64(0xFFFFFFFF)).astype("float64")
+    return np.where(high > 0, np.frexp(high)[1] + 32, np.frexp(low)[1])
+
+
+class HyperLogLog:
+    """
+    Batch of HyperLogLog distinct-count sketches sharing one register array.
+
+    Sketch `i` is the row `registers[i]`. Sketches are merged by taking the
+    element-wise maximum of their registers, so the distinct count of any
+    union of sketches can be estimated without touching the raw values.
+
+    Parameters
+    ----------
+    n_sketches : int
+        Number of sketches to allocate.
+    precision : int
+        Number of bits used to pick a register, the sketches use
+        2 ** precision registers each and have a relative standard error
+        of about 1.04 / sqrt(2 ** precision).
+    """
+
+    def __init__(self, n_sketches: int, precision: int = 10):
+        self.precision = precision
+        self.n_registers = 1 << precision
+        self.registers = np.zeros((n_sketches, self.n_registers), dtype="uint8")
+
+    def add(self, sketch_ids, hashes):
+        """
+        Adds hashed values to the sketches.
+
+        Parameters
+        ----------
+        sketch_ids : numpy array
+            The sketch each value belongs to.
+        hashes : numpy array
+            uint64 hashes of the values.
+        """
+        shift = np.uint64(64 - self.precision)
+        buckets = (hashes >> shift).astype("int64")
+        remainder = hashes & np.uint64((1 << (64 - self.precision)) - 1)
+        ranks = (64 - self.precision - _bit_length(remainder) + 1).astype("uint8")
+        flat = self.registers.reshape(-1)
+        np.maximum.at(flat, np.asarray(sketch_ids, dtype="int64") * self.n_registers + buckets, ranks)
+
+    def count(self, sketch_ids):
+        """
+        Estimates the number of distinct values in the union of some sketches.
+
+        Parameters
+        ----------
+        sketch_ids : numpy array
+            The sketches to merge.
+
+        Returns
+        -------
+        count : int
+            The estimated distinct count.
+        """
+        if not len(sketch_ids):
+            return 0
+        merged = self.registers[sketch_ids].max(axis=0)
+        m = self.n_registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -merged.astype("int64")))
+        zeros = int(np.count_nonzero(merged == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)  # Linear counting for small cardinalities
+        return int(round(estimate))
+
+
+class Cube:
+    """
+    Pre-aggregated (genre, region, year) cube for the KPIs and the line chart.
+
+    Every cell of the filter index holds the weighted sum and count of the
+    ratings and runtimes of its rows, plus the distinct values such as
+    titles and actors. Any filter selection is answered by rolling up the
+    selected cells instead of scanning raw rows. The distinct values of
+    every cell are kept as sorted hashes, so the distinct count of a
+    selection is exact up to `exact_limit` values and estimated from
+    HyperLogLog sketches beyond.
+
+    Parameters
+    ----------
+    index : FilterIndex
+        The filter index whose cells define the cube.
+    values : dict
+        Maps every measure name to its values, one per indexed row.
+    weights : numpy array, optional
+        Number of times every indexed row counts towards the means.
+    precision : int
+        HyperLogLog precision of the distinct-count sketches.
+    exact_limit : int
+        Largest number of (cell, value) pairs a distinct count is computed
+        exactly from.
+    """
+
+    def __init__(self, index: FilterIndex, values: dict, weights=None, precision=10, exact_limit=EXACT_DISTINCT_LIMIT):
+        self.index = index
+        self.precision = precision
+        self.exact_limit = exact_limit
+        self.measures = list(values)
+        cells = index.row_cells()
+        valid = cells >= 0
+        if weights is None:
+            weights = np.ones(len(cells))
+
+        self.sums = {}
+        self.counts = {}
+        for measure, measure_values in values.items():
+            measure_values = np.asarray(measure_values, dtype="float64")
+            present = valid & ~np.isnan(measure_values)
+            self.sums[measure] = np.bincount(
+                cells[present], weights=measure_values[present] * weights[present], minlength=index.n_cells
+            )
+            self.counts[measure] = np.bincount(cells[present], weights=weights[present], minlength=index.n_cells)
+
+        # Only allocate sketches for cells that actually hold rows
+        occupied = np.unique(cells[valid])
+        self._slots = np.full(index.n_cells, -1, dtype="int64")
+        self._slots[occupied] = np.arange(len(occupied))
+        self.distinct = {}
+        self.distinct_values = {}
+
+    @classmethod
+    def from_schema(cls, schema, precision=10):
+        """
+        Builds the cube of a `StarSchema`.
+
+        The means are weighted by the number of exploded rows behind each
+        (title, genre, region) fact, and distinct counts are kept for the
+        titles (`total_movies`) and actors (`total_actors`).
+
+        Parameters
+        ----------
+        schema : StarSchema
+            The dataset to aggregate.
+        precision : int
+            HyperLogLog precision of the distinct-count sketches.
+
+        Returns
+        -------
+        cube : Cube
+            The populated cube.
+        """
+        facts = schema.index.data
+        title_ids = facts["title_id"].to_numpy()
+        titles = schema.titles
+        cube = cls(
+            schema.index,
+            {
+                measure: titles[measure].to_numpy(dtype="float64", na_value=np.nan)[title_ids]
+                for measure in ["averageRating", "runtimeMinutes"]
+            },
+            weights=facts["rows"].to_numpy(dtype="float64"),
+            precision=precision
+        )
+        cells = schema.index.row_cells()
+        title_hashes, title_present = _hash_column(titles["primaryTitle"])
+        cube.add_distinct("total_movies", cells[title_present[title_ids]], title_hashes[title_ids[title_present[title_ids]]])
+
+        # Pair every fact cell with the actors of its title
+        starts, lengths = schema.actor_ranges(title_ids)
+        actor_rows = expand_ranges(starts, lengths)
+        actor_ids = schema.title_actor["actor_id"].to_numpy()[actor_rows]
+        actor_hashes, _ = _hash_column(schema.actors["primaryName"])
+        cube.add_distinct("total_actors", np.repeat(cells, lengths), actor_hashes[actor_ids])
+        return cube
+
+    def add_distinct(self, name: str, cells, hashes):
+        """
+        Adds a distinct-count sketch per cell.
+
+        Parameters
+        ----------
+        name : string
+            Key of the distinct count in the `rollup` summary.
+        cells : numpy array
+            Cell id of every value.
+        hashes : numpy array
+            uint64 hash of every value.
+        """
+        slots = self._slots[np.maximum(cells, 0)]
+        present = (cells >= 0) & (slots >= 0)
+        n_slots = int(self._slots.max()) + 1
+        sketch = HyperLogLog(n_slots, self.precision)
+        sketch.add(slots[present], hashes[present])
+        self.distinct[name] = sketch
+
+        # The distinct hashes of every slot, sorted by slot
+        slots, hashes = slots[present], hashes[present]
+        order = np.lexsort((hashes, slots))
+        slots, hashes = slots[order], hashes[order]
+        first = np.ones(len(slots), dtype=bool)
+        first[1:] = (slots[1:] != slots[:-1]) | (hashes[1:] != hashes[:-1])
+        offsets = np.searchsorted(slots[first], np.arange(n_slots + 1))
+        self.distinct_values[name] = (offsets, hashes[first])
+
+    def distinct_count(self, name: str, slots):
+        """
+        Counts the distinct values of the union of some slots.
+
+        Parameters
+        ----------
+        name : string
+            The distinct count, see `add_distinct`.
+        slots : numpy array
+            The slots of the selected cells.
+
+        Returns
+        -------
+        count : int
+            The distinct count.
+        approximate : bool
+            Whether the count was estimated from the sketches.
+        """
+        offsets, hashes = self.distinct_values[name]
+        starts = offsets[slots]
+        lengths = offsets[slots + 1] - starts
+        if lengths.sum() > self.exact_limit:
+            return self.distinct[name].count(slots), True
+        return len(np.unique(hashes[expand_ranges(starts, lengths)])), False
+
+    def rollup(self, genres: list, regions: list, years: list):
+        """
+        Computes the summary statistics of a filter selection.
+
+        Parameters
+        ----------
+        genres : list
+            The selected genres.
+        regions : list
+            The selected region names.
+        years : list
+            The inclusive [start, end] year range.
+
+        Returns
+        -------
+        summary : dict
+            Every distinct count, the mean of every measure and whether
+            any distinct count is `approximate`.
+        """
+        cells = self.index.cell_ids(genres, regions, years)
+        slots = self._slots[cells]
+        slots = slots[slots >= 0]
+        summary = {"approximate": False}
+        for name in self.distinct:
+            summary[name], approximate = self.distinct_count(name, slots)
+            summary["approximate"] |= approximate
+        for measure in self.measures:
+            count = self.counts[measure][cells].sum()
+            summary[measure] = self.sums[measure][cells].sum() / count if count else np.nan
+        return summary
+
+    def line_series(self, genres: list, regions: list, years: list):
+        """
+        Computes the mean rating and runtime per genre and year of a selection.
+
+        Parameters
+        ----------
+        genres : list
+            The selected genres.
+        regions : list
+            The selected region names.
+        years : list
+            The inclusive [start, end] year range.
+
+        Returns
+        -------
+        series : pandas dataframe
+            One row per (genres, startYear) with the mean of every measure.
+        """
+        cells = self.index.cell_ids(genres, regions, years)
+        cells = cells[self._slots[cells] >= 0]
+        cube = pd.DataFrame({
+            "genres": self.index.cell_genres(cells),
+            "startYear": self.index.cell_years(cells)
+        })
+        for measure in self.measures:
+            cube[f"{measure}_sum"] = self.sums[measure][cells]
+            cube[f"{measure}_count"] = self.counts[measure][cells]
+        cube = cube.groupby(["genres", "startYear"], sort=True).sum().reset_index()
+
+        series = cube[["genres", "startYear"]].copy()
+        for measure in self.measures:
+            count = cube[f"{measure}_count"].to_numpy(dtype="float64")
+            series[measure] = np.divide(
+                cube[f"{measure}_sum"].to_numpy(), count,
+                out=np.full(len(count), np.nan), where=count > 0
+            )
+        return series
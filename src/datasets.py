@@ -0,0 +1,127 @@
+"""
+Hot reload of the dataset.
+
+`DatasetManager` holds the `Dataset` the callbacks answer from, built
+from one version of the data files. Every worker checks the version of
+the files in a background thread, builds the dataset of a new version
+next to the current one and swaps it in. A callback reads `current`
+once and uses that dataset to the end, so the requests in flight finish
+on the version they started with.
+"""
+import logging
+import os
+import threading
+import time
+
+from .loader import dataset_version
+
+logger = logging.getLogger(__name__)
+
+
+class Dataset:
+    """
+    Everything the app derives from one version of the data files.
+
+    Parameters
+    ----------
+    version : string
+        The `dataset_version` of the files.
+    backend : PandasBackend or DuckDBBackend
+        The query backend over the files, see src/backends.py.
+    search_index : NameIndex
+        The type-ahead index of the actor and movie names.
+    """
+
+    def __init__(self, version: str, backend, search_index):
+        self.version = version
+        self.backend = backend
+        self.search_index = search_index
+
+
+class DatasetManager:
+    """
+    The current `Dataset`, reloaded when its files change.
+
+    A new version is only loaded once it stayed the same over two checks,
+    so that files still being written are never read. If it fails to load
+    the current dataset is kept until the files change again.
+
+    Parameters
+    ----------
+    paths : list
+        The files the dataset is built from.
+    build : callable
+        Builds the `Dataset` of a version from the files.
+    interval : float
+        Seconds between two checks of the files, 0 disables the reload.
+    current : Dataset, optional
+        The dataset of the current version, built with `build` otherwise.
+    """
+
+    def __init__(self, paths: list, build, interval=0, current=None):
+        self.paths = list(paths)
+        self.build = build
+        self.interval = interval
+        self.reloads = 0
+        # Called with the old and the new dataset after every swap
+        self.listeners = []
+        self.current = current or build(dataset_version(*self.paths))
+        self._pending = None
+        self._failed = None
+        self._watcher_pid = None
+        self._lock = threading.Lock()
+
+    def watch(self):
+        """Starts checking the files in the background, once per process."""
+        if not self.interval or self._watcher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._watcher_pid != os.getpid():
+                self._watcher_pid = os.getpid()
+                threading.Thread(target=self._watch_loop, name="dataset-watcher", daemon=True).start()
+
+    def _watch_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Checking the dataset files failed")
+
+    def check(self):
+        """
+        Loads and swaps in the dataset of a new version of the files.
+
+        Returns
+        -------
+        reloaded : bool
+            Whether a new dataset was swapped in.
+        """
+        try:
+            version = dataset_version(*self.paths)
+        except OSError:
+            return False  # A file is being replaced
+        if version in (self.current.version, self._failed):
+            self._pending = None
+            return False
+        if version != self._pending:
+            self._pending = version
+            return False
+        self._pending = None
+        logger.info("Loading dataset version %s", version)
+        try:
+            dataset = self.build(version)
+        except Exception:
+            self._failed = version
+            logger.exception("Loading dataset version %s failed, keeping version %s", version, self.current.version)
+            return False
+        self.swap(dataset)
+        return True
+
+    def swap(self, dataset: Dataset):
+        """Makes `dataset` the current one and notifies the listeners."""
+        old, self.current = self.current, dataset
+        self.reloads += 1
+        logger.info("Swapped dataset version %s for %s", old.version, dataset.version)
+        for listener in self.listeners:
+            listener(old, dataset)
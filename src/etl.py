@@ -0,0 +1,319 @@
+"""
+Builds the dashboard dataset from the raw IMDb TSV dumps.
+
+This replaces `data/imdb_data_cleaning.ipynb`. The dumps are read in
+chunks and filtered as they are parsed, so only the rows that can end up
+in the dashboard are ever held in memory. Every stage writes its result
+to a work directory together with a fingerprint of its inputs, and is
+skipped on the next run if none of them changed. Refreshing a single
+dump therefore only reruns the stages that depend on it.
+
+Usage:
+
+    python -m src.etl --input <directory with the dumps> --output data
+"""
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .constants import genre_color_map
+
+logger = logging.getLogger(__name__)
+
+DUMPS = {
+    "basics": "title.basics.tsv",
+    "ratings": "title.ratings.tsv",
+    "akas": "title.akas.tsv",
+    "principals": "title.principals.tsv",
+    "names": "name.basics.tsv",
+}
+ACTOR_CATEGORIES = ["actor", "actress", "self"]
+OUTPUT_COLUMNS = ["tconst", "primaryTitle", "startYear", "runtimeMinutes", "averageRating",
+                  "region", "primaryName", "genres"]
+
+
+def find_dump(input_dir: str, name: str):
+    """Returns the path of a dump, accepting both the plain and the gzipped file."""
+    path = os.path.join(input_dir, DUMPS[name])
+    if not os.path.exists(path) and os.path.exists(f"{path}.gz"):
+        return f"{path}.gz"
+    return path
+
+
+def read_tsv(path: str, columns: list, chunksize: int, keep=None):
+    """
+    Reads an IMDb TSV dump chunk by chunk, keeping only matching rows.
+
+    `\\N` is parsed as missing while reading, and every column is read as
+    a string so that no chunk needs type inference.
+
+    Parameters
+    ----------
+    path : string
+        The dump to read.
+    columns : list
+        The columns to parse.
+    chunksize : int
+        Number of lines parsed at a time.
+    keep : callable, optional
+        Takes a chunk and returns a boolean mask of the rows to keep.
+
+    Returns
+    -------
+    data : pandas dataframe
+        The kept rows of every chunk.
+    """
+    chunks = []
+    reader = pd.read_csv(
+        path, sep="\t", usecols=columns, dtype=str, na_values=["\\N"], keep_default_na=False,
+        quoting=csv.QUOTE_NONE, chunksize=chunksize
+    )
+    for chunk in reader:
+        chunks.append(chunk[keep(chunk)] if keep is not None else chunk)
+    if not chunks:
+        return pd.DataFrame(columns=columns, dtype=str)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def fingerprint(paths: list, params: dict):
+    """Hashes the size and modification time of some files together with the stage parameters."""
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8"))
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class Pipeline:
+    """
+    Incremental ETL from the IMDb dumps to the dashboard dataset.
+
+    Parameters
+    ----------
+    input_dir : string
+        Directory holding the IMDb TSV dumps.
+    output_dir : string
+        Directory the dataset is written to.
+    work_dir : string
+        Directory holding the intermediate stage results and the manifest.
+    years : tuple
+        The inclusive (start, end) years to keep.
+    genres : list
+        The genres to keep.
+    chunksize : int
+        Number of lines parsed at a time.
+    """
+
+    def __init__(self, input_dir, output_dir, work_dir, years=(2011, 2020), genres=None, chunksize=500_000):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.work_dir = work_dir
+        self.years = (int(years[0]), int(years[1]))
+        self.genres = sorted(genres or genre_color_map)
+        self.chunksize = chunksize
+        self.manifest_path = os.path.join(work_dir, "manifest.json")
+        os.makedirs(work_dir, exist_ok=True)
+        os.makedirs(output_dir, exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as manifest:
+                self.manifest = json.load(manifest)
+        else:
+            self.manifest = {}
+
+    def stage_path(self, stage: str):
+        """Returns where the result of a stage is stored."""
+        return os.path.join(self.work_dir, f"{stage}.feather")
+
+    def run_stage(self, stage: str, inputs: list, build, force=False):
+        """
+        Runs a stage unless its inputs and parameters are unchanged.
+
+        Parameters
+        ----------
+        stage : string
+            Name of the stage.
+        inputs : list
+            The files the stage reads, dumps or other stage results.
+        build : callable
+            Zero-argument function computing the stage dataframe.
+        force : bool
+            Rebuild even if nothing changed.
+
+        Returns
+        -------
+        path : string
+            The stored stage result.
+        """
+        path = self.stage_path(stage)
+        key = fingerprint(inputs, {"years": self.years, "genres": self.genres})
+        if not force and self.manifest.get(stage) == key and os.path.exists(path):
+            logger.info("Stage %s is up to date", stage)
+            return path
+
+        logger.info("Running stage %s", stage)
+        data = build()
+        data.reset_index(drop=True).to_feather(f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        self.manifest[stage] = key
+        with open(self.manifest_path, "w") as manifest:
+            json.dump(self.manifest, manifest, indent=2)
+        return path
+
+    def build_titles(self):
+        """Keeps the movies released in the year range that have one of the genres."""
+        genre_pattern = r"(?:^|,)(?:" + "|".join(re.escape(genre) for genre in self.genres) + r")(?:,|$)"
+
+        def keep(chunk):
+            years = pd.to_numeric(chunk["startYear"], errors="coerce")
+            return (
+                (chunk["titleType"] == "movie")
+                & years.between(*self.years)
+                & chunk["genres"].str.contains(genre_pattern, na=False)
+            )
+
+        titles = read_tsv(
+            find_dump(self.input_dir, "basics"),
+            ["tconst", "titleType", "primaryTitle", "startYear", "runtimeMinutes", "genres"],
+            self.chunksize, keep
+        )
+        titles["startYear"] = titles["startYear"].astype("int16")
+        titles["runtimeMinutes"] = pd.to_numeric(titles["runtimeMinutes"], errors="coerce").astype("float32")
+        return titles.drop(columns="titleType")
+
+    def build_ratings(self, tconsts: set):
+        """Keeps the ratings of the selected titles."""
+        ratings = read_tsv(
+            find_dump(self.input_dir, "ratings"), ["tconst", "averageRating"],
+            self.chunksize, lambda chunk: chunk["tconst"].isin(tconsts)
+        )
+        ratings["averageRating"] = ratings["averageRating"].astype("float32")
+        return ratings
+
+    def build_akas(self, tconsts: set):
+        """Keeps the regions of the selected titles, original titles carry no region."""
+        akas = read_tsv(
+            find_dump(self.input_dir, "akas"), ["titleId", "region", "isOriginalTitle"], self.chunksize,
+            lambda chunk: (chunk["isOriginalTitle"] == "0") & chunk["titleId"].isin(tconsts)
+        )
+        return akas.rename(columns={"titleId": "tconst"})[["tconst", "region"]]
+
+    def build_principals(self, tconsts: set):
+        """Keeps the actors, actresses and self appearances of the selected titles."""
+        principals = read_tsv(
+            find_dump(self.input_dir, "principals"), ["tconst", "nconst", "category"], self.chunksize,
+            lambda chunk: chunk["category"].isin(ACTOR_CATEGORIES) & chunk["tconst"].isin(tconsts)
+        )
+        return principals[["tconst", "nconst"]]
+
+    def build_names(self, nconsts: set):
+        """Keeps the names of the selected actors."""
+        return read_tsv(
+            find_dump(self.input_dir, "names"), ["nconst", "primaryName"],
+            self.chunksize, lambda chunk: chunk["nconst"].isin(nconsts)
+        )
+
+    def build_dataset(self, paths: dict):
+        """Joins the stage results into one row per title, region, actor and genre."""
+        imdb = pd.read_feather(paths["titles"])
+        imdb = imdb.merge(pd.read_feather(paths["ratings"]), how="left", on="tconst")
+        imdb = imdb.merge(pd.read_feather(paths["akas"]), how="left", on="tconst")
+        imdb = imdb.merge(pd.read_feather(paths["principals"]), how="left", on="tconst")
+        imdb = imdb.merge(pd.read_feather(paths["names"]), how="left", on="nconst")
+        imdb["genres"] = imdb["genres"].str.split(",")
+        imdb = imdb.explode("genres")
+        imdb = imdb[imdb["genres"].isin(self.genres)]
+        return imdb[OUTPUT_COLUMNS].reset_index(drop=True)
+
+    def write_outputs(self, dataset: pd.DataFrame):
+        """Writes the feather file read by the dashboard and the year-partitioned Parquet dataset."""
+        start, end = self.years
+        feather_path = os.path.join(self.output_dir, f"imdb_{start}-{end}.feather")
+        dataset.to_feather(f"{feather_path}.tmp")
+        os.replace(f"{feather_path}.tmp", feather_path)
+
+        partitions = os.path.join(self.output_dir, f"imdb_{start}-{end}")
+        shutil.rmtree(partitions, ignore_errors=True)
+        pq.write_to_dataset(
+            pa.Table.from_pandas(dataset, preserve_index=False), partitions, partition_cols=["startYear"]
+        )
+        return feather_path
+
+    def run(self, force=False):
+        """
+        Runs every stage that is out of date and writes the outputs.
+
+        Parameters
+        ----------
+        force : bool
+            Rebuild every stage even if nothing changed.
+
+        Returns
+        -------
+        path : string
+            The feather file read by the dashboard.
+        """
+        paths = {}
+        paths["titles"] = self.run_stage(
+            "titles", [find_dump(self.input_dir, "basics")], self.build_titles, force
+        )
+        tconsts = None
+
+        def title_ids():
+            nonlocal tconsts
+            if tconsts is None:
+                tconsts = set(pd.read_feather(paths["titles"], columns=["tconst"])["tconst"])
+            return tconsts
+
+        for stage, build in [("ratings", self.build_ratings), ("akas", self.build_akas),
+                             ("principals", self.build_principals)]:
+            paths[stage] = self.run_stage(
+                stage, [find_dump(self.input_dir, stage), paths["titles"]],
+                lambda build=build: build(title_ids()), force
+            )
+        paths["names"] = self.run_stage(
+            "names", [find_dump(self.input_dir, "names"), paths["principals"]],
+            lambda: self.build_names(set(pd.read_feather(paths["principals"])["nconst"].dropna())), force
+        )
+
+        outputs_key = fingerprint(list(paths.values()), {"years": self.years, "genres": self.genres})
+        start, end = self.years
+        feather_path = os.path.join(self.output_dir, f"imdb_{start}-{end}.feather")
+        if not force and self.manifest.get("dataset") == outputs_key and os.path.exists(feather_path):
+            logger.info("Dataset is up to date")
+            return feather_path
+
+        logger.info("Writing dataset")
+        feather_path = self.write_outputs(self.build_dataset(paths))
+        self.manifest["dataset"] = outputs_key
+        with open(self.manifest_path, "w") as manifest:
+            json.dump(self.manifest, manifest, indent=2)
+        return feather_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the dashboard dataset from the IMDb TSV dumps.")
+    parser.add_argument("--input", required=True, help="Directory holding the IMDb TSV dumps.")
+    parser.add_argument("--output", default="data", help="Directory the dataset is written to.")
+    parser.add_argument("--work", default=None, help="Directory for intermediate results, defaults to <output>/etl.")
+    parser.add_argument("--start-year", type=int, default=2011)
+    parser.add_argument("--end-year", type=int, default=2020)
+    parser.add_argument("--genres", nargs="+", default=None, help="Genres to keep, defaults to the dashboard genres.")
+    parser.add_argument("--chunksize", type=int, default=500_000)
+    parser.add_argument("--force", action="store_true", help="Rebuild every stage.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    pipeline = Pipeline(
+        args.input, args.output, args.work or os.path.join(args.output, "etl"),
+        years=(args.start_year, args.end_year), genres=args.genres, chunksize=args.chunksize
+    )
+    print(pipeline.run(force=args.force))
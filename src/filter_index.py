@@ -0,0 +1,198 @@
+import numpy as np
+import pandas as pd
+
+
+def expand_ranges(starts, lengths):
+    """
+    Expands row ranges into the positions they cover, without a Python loop.
+
+    Parameters
+    ----------
+    starts : numpy array
+        First position of every range.
+    lengths : numpy array
+        Number of positions in every range.
+
+    Returns
+    -------
+    positions : numpy array
+        The concatenated positions of all ranges.
+    """
+    lengths = np.asarray(lengths, dtype="int64")
+    total = int(lengths.sum())
+    range_starts = np.repeat(np.asarray(starts, dtype="int64") - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return range_starts + np.arange(total)
+
+
+class FilterIndex:
+    """
+    Precomputed row index over genre, region and start year.
+
+    The data is sorted once by (genre, region, year) so that every
+    (genre, region) pair owns one contiguous block of rows ordered by
+    year. The block boundaries of every (genre, region, year) cell are
+    kept in an offsets table, which makes any filter selection a union of
+    row ranges followed by a single `take`, instead of full-table scans.
+
+    Parameters
+    ----------
+    data : pandas dataframe
+        The data to index.
+    genre_col : string
+        Name of the genre column.
+    region_col : string
+        Name of the region name column.
+    year_col : string
+        Name of the start year column.
+    """
+
+    def __init__(self, data: pd.DataFrame, genre_col="genres", region_col="name", year_col="startYear"):
+        self.genre_col = genre_col
+        self.region_col = region_col
+        self.year_col = year_col
+
+        data = data.copy(deep=False)
+        data[genre_col] = data[genre_col].astype("category")
+        data[region_col] = data[region_col].astype("category")
+        self.genres = list(data[genre_col].cat.categories)
+        self.regions = list(data[region_col].cat.categories)
+        self._genre_codes = {genre: code for code, genre in enumerate(self.genres)}
+        self._region_codes = {region: code for code, region in enumerate(self.regions)}
+
+        years = data[year_col].to_numpy(dtype="float64", na_value=np.nan)
+        valid_years = years[~np.isnan(years)]
+        self.min_year = int(valid_years.min()) if len(valid_years) else 0
+        self.max_year = int(valid_years.max()) if len(valid_years) else -1
+        n_years = self.max_year - self.min_year + 1
+        # Rows without a year go to an extra trailing bucket that is never selected
+        year_codes = np.where(np.isnan(years), n_years, years - self.min_year).astype("int64")
+
+        genre_codes = data[genre_col].cat.codes.to_numpy().astype("int64")
+        region_codes = data[region_col].cat.codes.to_numpy().astype("int64")
+        self._year_stride = n_years + 1
+        cells = (genre_codes * len(self.regions) + region_codes) * self._year_stride + year_codes
+        cells[(genre_codes < 0) | (region_codes < 0)] = -1  # Missing genre/region never matches
+
+        order = np.argsort(cells, kind="stable")
+        if not np.array_equal(order, np.arange(len(order))):
+            data = data.take(order)
+            cells = cells[order]
+        data.index = pd.RangeIndex(len(data))  # Unlike reset_index, never copies the columns
+        self.data = data
+
+        n_cells = len(self.genres) * len(self.regions) * self._year_stride
+        self._offsets = np.searchsorted(cells, np.arange(n_cells + 1))
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def n_cells(self):
+        """Number of (genre, region, year) cells, including the missing-year buckets."""
+        return len(self._offsets) - 1
+
+    def row_cells(self):
+        """
+        Computes the cell id of every indexed row.
+
+        Returns
+        -------
+        cells : numpy array
+            Cell id per row of `self.data`, -1 for rows that no filter matches.
+        """
+        counts = np.diff(self._offsets)
+        cells = np.full(len(self.data), -1, dtype="int64")
+        cells[self._offsets[0]:] = np.repeat(np.arange(self.n_cells), counts)
+        return cells
+
+    def cell_genres(self, cells):
+        """Returns the genre name of each cell id in `cells`."""
+        codes = np.asarray(cells) // (len(self.regions) * self._year_stride)
+        return np.asarray(self.genres, dtype=object)[codes]
+
+    def cell_regions(self, cells):
+        """Returns the region name of each cell id in `cells`."""
+        codes = np.asarray(cells) // self._year_stride % len(self.regions)
+        return np.asarray(self.regions, dtype=object)[codes]
+
+    def cell_years(self, cells):
+        """Returns the start year of each cell id in `cells`."""
+        return np.asarray(cells) % self._year_stride + self.min_year
+
+    def _selection_ranges(self, genres: list, regions: list, years: list):
+        """Returns the first cell of every selected (genre, region) block and the year code range."""
+        genre_codes = np.array(sorted(self._genre_codes[g] for g in genres or [] if g in self._genre_codes), dtype="int64")
+        region_codes = np.array(sorted(self._region_codes[r] for r in regions or [] if r in self._region_codes), dtype="int64")
+        start = max(int(years[0]), self.min_year) - self.min_year
+        end = min(int(years[1]), self.max_year) - self.min_year
+        if not len(genre_codes) or not len(region_codes) or start > end:
+            return np.empty(0, dtype="int64"), 0, -1
+
+        bases = ((genre_codes[:, None] * len(self.regions) + region_codes[None, :]) * self._year_stride).ravel()
+        return bases, start, end
+
+    def cell_ids(self, genres: list, regions: list, years: list):
+        """
+        Finds the (genre, region, year) cells covered by a filter selection.
+
+        Parameters
+        ----------
+        genres : list
+            The genres to keep.
+        regions : list
+            The region names to keep.
+        years : list
+            The inclusive [start, end] years to keep.
+
+        Returns
+        -------
+        cells : numpy array
+            Sorted cell ids.
+        """
+        bases, start, end = self._selection_ranges(genres, regions, years)
+        return (bases[:, None] + np.arange(start, end + 1)[None, :]).ravel()
+
+    def row_ids(self, genres: list, regions: list, years: list):
+        """
+        Finds the positions of the rows matching a filter selection.
+
+        Parameters
+        ----------
+        genres : list
+            The genres to keep.
+        regions : list
+            The region names to keep.
+        years : list
+            The inclusive [start, end] years to keep.
+
+        Returns
+        -------
+        rows : numpy array
+            Sorted row positions into `self.data`.
+        """
+        bases, start, end = self._selection_ranges(genres, regions, years)
+        if not len(bases):
+            return np.empty(0, dtype="int64")
+
+        starts = self._offsets[bases + start]
+        return expand_ranges(starts, self._offsets[bases + end + 1] - starts)
+
+    def filter(self, genres: list, regions: list, years: list):
+        """
+        Filters the indexed data by genres, regions and year range.
+
+        Parameters
+        ----------
+        genres : list
+            The genres to keep.
+        regions : list
+            The region names to keep.
+        years : list
+            The inclusive [start, end] years to keep.
+
+        Returns
+        -------
+        filtered_data : pandas dataframe
+            The matching rows.
+        """
+        return self.data.take(self.row_ids(genres, regions, years))
@@ -0,0 +1,367 @@
+"""
+Opt-in latency instrumentation of the callbacks and chart functions.
+
+With `IMDB_METRICS=1`, every function decorated with `instrumented` and
+every Dash callback wrapped by `instrument_callbacks` records its wall
+time, CPU time, rows in and out and the size of what it returns. The
+rows in and out are those of the dataframes it takes and returns, plus
+those it reports with `count_rows`, e.g. the rows of the query results a
+chart is rendered from. Each
+worker keeps its own metrics and regularly writes them to a shared
+directory, so that `/metrics` reports the sum over all workers in the
+Prometheus text format.
+
+With `IMDB_PROFILE_RATE` above 0, that share of the requests is also run
+under pyinstrument (an optional dependency) and the profiles of requests
+slower than `IMDB_PROFILE_SLOW_MS` are written to `IMDB_PROFILE_DIR`.
+"""
+import functools
+import glob
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import pandas as pd
+
+from .config import METRICS, METRICS_PATH, PROFILE_DIR, PROFILE_RATE, PROFILE_SLOW_MS
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# Counters recorded per function
+COUNTERS = {
+    "imdb_function_cpu_seconds_total": "CPU time spent in the function.",
+    "imdb_function_rows_in_total": "Rows of the dataframes passed to the function and of the query results it reported.",
+    "imdb_function_rows_out_total": "Rows of the dataframes returned by the function and of the chart data it reported.",
+    "imdb_function_payload_bytes_total": "Size of what the function returns, e.g. chart HTML, chart payload or callback JSON."
+}
+
+
+def _rows(value):
+    """Counts the dataframe rows in a value or a tuple of values."""
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    if isinstance(value, tuple):
+        return sum(_rows(item) for item in value)
+    return 0
+
+
+def _records(value):
+    """Counts the rows of a query result or of chart datasets, in tuples and dicts."""
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    if isinstance(value, list):
+        return sum(isinstance(item, dict) for item in value)
+    if isinstance(value, tuple):
+        return sum(_records(item) for item in value)
+    if isinstance(value, dict):
+        return sum(_records(item) for item in value.values())
+    return 0
+
+
+def _payload_size(value):
+    """Size in bytes of a string, or of a chart payload as JSON, 0 for anything else."""
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, dict):
+        try:
+            return len(json.dumps(value).encode("utf-8"))
+        except TypeError:
+            return 0
+    return 0
+
+
+def _escape(value: str):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _process_alive(pid: int):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metrics:
+    """
+    Metrics of the current process, merged with those of the other workers.
+
+    Parameters
+    ----------
+    directory : string
+        Where every process writes its metrics, as `<pid>.json`.
+    flush_interval : float
+        Seconds between two writes of this process, when it recorded new calls.
+    """
+
+    def __init__(self, directory: str, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        # Callables returning {name: value} counters, summed over the workers
+        self.collectors = []
+        # Same, for counters the workers already share, reported as they are
+        self.shared_collectors = []
+        self._functions = {}
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._flusher_pid = None
+        os.makedirs(directory, exist_ok=True)
+        # Forget the processes that are gone, e.g. the workers of a previous run
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            pid = os.path.splitext(os.path.basename(path))[0]
+            if not pid.isdigit() or not _process_alive(int(pid)):
+                os.remove(path)
+
+    def observe(self, function: str, wall: float, cpu: float, rows_in: int, rows_out: int, payload: int):
+        """Records one call of `function`."""
+        with self._lock:
+            stats = self._functions.setdefault(function, {
+                "count": 0,
+                "sum": 0.0,
+                "buckets": [0] * len(LATENCY_BUCKETS),
+                **{name: 0 for name in COUNTERS}
+            })
+            stats["count"] += 1
+            stats["sum"] += wall
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if wall <= bound:
+                    stats["buckets"][i] += 1
+            stats["imdb_function_cpu_seconds_total"] += cpu
+            stats["imdb_function_rows_in_total"] += rows_in
+            stats["imdb_function_rows_out_total"] += rows_out
+            stats["imdb_function_payload_bytes_total"] += payload
+            # Started in every worker, threads do not survive the fork
+            if self._flusher_pid != os.getpid():
+                self._flusher_pid = os.getpid()
+                threading.Thread(target=self._flush_loop, name="metrics", daemon=True).start()
+        self._dirty.set()
+
+    def _flush_loop(self):
+        while True:
+            self._dirty.wait()
+            self._dirty.clear()
+            try:
+                self.flush()
+            except OSError:
+                logger.exception("Could not write the metrics to %s", self.directory)
+            time.sleep(self.flush_interval)
+
+    def snapshot(self):
+        """Returns the metrics of this process."""
+        with self._lock:
+            functions = json.loads(json.dumps(self._functions))
+        gauges = {}
+        for collect in self.collectors:
+            for name, value in collect().items():
+                gauges[name] = gauges.get(name, 0) + value
+        return {"functions": functions, "gauges": gauges}
+
+    def flush(self):
+        """Writes the metrics of this process for the other workers."""
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as file:
+            json.dump(self.snapshot(), file)
+        os.replace(f"{path}.tmp", path)
+
+    def merged(self):
+        """Sums the metrics of every live process, this one included."""
+        snapshots = [self.snapshot()]
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            if os.path.basename(path) == f"{os.getpid()}.json":
+                continue
+            try:
+                with open(path) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue  # Being replaced or removed
+
+        functions = {}
+        gauges = {}
+        for snapshot in snapshots:
+            for function, stats in snapshot["functions"].items():
+                total = functions.setdefault(function, {
+                    "count": 0, "sum": 0.0, "buckets": [0] * len(LATENCY_BUCKETS), **{name: 0 for name in COUNTERS}
+                })
+                for name, value in stats.items():
+                    if name == "buckets":
+                        total[name] = [a + b for a, b in zip(total[name], value)]
+                    else:
+                        total[name] += value
+            for name, value in snapshot["gauges"].items():
+                gauges[name] = gauges.get(name, 0) + value
+        for collect in self.shared_collectors:
+            gauges.update(collect())
+        return functions, gauges
+
+    def prometheus(self):
+        """Renders the merged metrics in the Prometheus text format."""
+        functions, gauges = self.merged()
+        lines = [
+            "# HELP imdb_function_seconds Wall time of the function.",
+            "# TYPE imdb_function_seconds histogram"
+        ]
+        for function, stats in sorted(functions.items()):
+            label = f'function="{_escape(function)}"'
+            for bound, count in zip(LATENCY_BUCKETS, stats["buckets"]):
+                lines.append(f'imdb_function_seconds_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'imdb_function_seconds_bucket{{{label},le="+Inf"}} {stats["count"]}')
+            lines.append(f"imdb_function_seconds_sum{{{label}}} {stats['sum']}")
+            lines.append(f"imdb_function_seconds_count{{{label}}} {stats['count']}")
+        for name, description in COUNTERS.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} counter")
+            for function, stats in sorted(functions.items()):
+                lines.append(f'{name}{{function="{_escape(function)}"}} {stats[name]}')
+        typed = set()
+        for name, value in sorted(gauges.items()):
+            # Labelled counters, e.g. 'name{function="..."}', share the TYPE line of their name
+            family = name.split("{", 1)[0]
+            if family not in typed:
+                typed.add(family)
+                lines.append(f"# TYPE {family} counter")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics(METRICS_PATH) if METRICS else None
+
+# Rows reported with `count_rows` by the recorded calls running in each thread, innermost last
+_calls = threading.local()
+
+
+def record(name: str, function, args, kwargs):
+    """Calls `function` and records the call under `name`."""
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    result = None
+    counted = {"in": 0, "out": 0}
+    stack = _calls.__dict__.setdefault("stack", [])
+    stack.append(counted)
+    try:
+        result = function(*args, **kwargs)
+        return result
+    finally:
+        stack.pop()
+        metrics.observe(
+            name,
+            time.perf_counter() - wall,
+            time.thread_time() - cpu,
+            sum(_rows(arg) for arg in args) + counted["in"],
+            _rows(result) + counted["out"],
+            _payload_size(result)
+        )
+
+
+def count_rows(rows_in=None, rows_out=None):
+    """
+    Adds rows to the recorded call running in this thread, if any.
+
+    Parameters
+    ----------
+    rows_in : dataframe, tuple or dict, optional
+        What the call works on, e.g. the result of a backend query.
+    rows_out : dataframe, tuple or dict, optional
+        What the call produces, e.g. the datasets of a chart, mapping
+        every name to a list of rows.
+    """
+    stack = getattr(_calls, "stack", None)
+    if stack:
+        stack[-1]["in"] += _records(rows_in)
+        stack[-1]["out"] += _records(rows_out)
+
+
+def instrumented(function):
+    """
+    Records every call of the decorated function when the metrics are enabled.
+
+    Parameters
+    ----------
+    function : callable
+        The function to instrument.
+
+    Returns
+    -------
+    function : callable
+        The function itself if the metrics are disabled, its recording wrapper otherwise.
+    """
+    if metrics is None:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        return record(function.__name__, function, args, kwargs)
+    return wrapper
+
+
+def instrument_callbacks(app):
+    """
+    Records every call of the server-side callbacks registered on `app`.
+
+    The recorded payload is the JSON response sent to the browser.
+    """
+    if metrics is None:
+        return
+    for callback in app.callback_map.values():
+        # Clientside callbacks have no server-side function
+        if "callback" in callback:
+            callback["callback"] = _callback_wrapper(callback["callback"])
+
+
+def _callback_wrapper(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        return record(f"callback:{function.__name__}", function, args, kwargs)
+    return wrapper
+
+
+def install(server):
+    """
+    Adds the `/metrics` route and the sampling profiler to the Flask `server`.
+
+    Parameters
+    ----------
+    server : flask app
+        The Dash app's server.
+    """
+    import flask
+
+    if metrics is not None:
+        @server.route("/metrics")
+        def serve_metrics():
+            return flask.Response(metrics.prometheus(), mimetype="text/plain; version=0.0.4")
+
+    if PROFILE_RATE <= 0:
+        return
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        logger.warning("IMDB_PROFILE_RATE is set but pyinstrument is not installed, not profiling")
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+
+    @server.before_request
+    def start_profiler():
+        if random.random() < PROFILE_RATE:
+            flask.g.profiler = Profiler()
+            flask.g.profiler.start()
+
+    @server.after_request
+    def stop_profiler(response):
+        profiler = flask.g.pop("profiler", None)
+        if profiler is not None:
+            session = profiler.stop()
+            if session.duration * 1000 >= PROFILE_SLOW_MS:
+                name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{flask.request.endpoint}.html"
+                with open(os.path.join(PROFILE_DIR, name), "w") as file:
+                    file.write(profiler.output_html())
+                logger.info("Slow request to %s took %.0f ms, profile in %s",
+                            flask.request.path, session.duration * 1000, name)
+        return response
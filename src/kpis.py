@@ -0,0 +1,78 @@
+import math
+
+# KPI name, also the id of the element showing it, mapped to its formatter
+KPIS = {}
+
+
+def register_kpi(name: str):
+    """
+    Registers a KPI shown in the element with id `name`.
+
+    The decorated function receives the summary of the selection, as
+    computed once by `Cube.rollup`, and returns the value to show. A new
+    KPI only needs a function here and an element in the layout, all KPIs
+    are still sent back in a single response.
+
+    Parameters
+    ----------
+    name : string
+        Name of the KPI and id of its element.
+
+    Returns
+    -------
+    decorator : function
+        Registers the function and returns it unchanged.
+    """
+    def decorator(function):
+        KPIS[name] = function
+        return function
+    return decorator
+
+
+def distinct_count(summary: dict, name: str):
+    """Returns a distinct count of the summary, marked when it was estimated."""
+    if summary.get("approximate"):
+        return f"≈{summary[name]}"
+    return summary[name]
+
+
+@register_kpi("total_movies")
+def total_movies(summary: dict):
+    return distinct_count(summary, "total_movies")
+
+
+@register_kpi("total_actors")
+def total_actors(summary: dict):
+    return distinct_count(summary, "total_actors")
+
+
+@register_kpi("avg_runtime")
+def avg_runtime(summary: dict):
+    return round(summary["runtimeMinutes"], 0)
+
+
+@register_kpi("avg_rating")
+def avg_rating(summary: dict):
+    return round(summary["averageRating"], 1)
+
+
+def compute_kpis(summary: dict):
+    """
+    Computes every registered KPI from the summary of a selection.
+
+    Parameters
+    ----------
+    summary : dict
+        The summary statistics computed by `Cube.rollup`.
+
+    Returns
+    -------
+    values : list
+        The value of every KPI, in registration order. Missing means are
+        shown as an empty string.
+    """
+    values = []
+    for function in KPIS.values():
+        value = function(summary)
+        values.append("" if isinstance(value, float) and math.isnan(value) else value)
+    return values
@@ -1,50 +1,58 @@
-import altair as alt
-from numpy import row_stack
+from functools import lru_cache
+
 import pandas as pd
-from .constants import genre_color_map
+from .constants import genre_color
+from .instrumentation import instrumented
+from .rendering import chart_spec, render_html, to_values
 
 
-def generate_line_plot(data: pd.DataFrame, ycol: str):
+@lru_cache(maxsize=None)
+def line_plot_spec(ycol: str, genres: tuple, years=(2011, 2020)):
     """"
-    Generates the line chart for the dashboard
+    Builds the line chart spec, compiled once per y-axis, set of genres and year range
 
     Parameters
     ----------
-    data : pandas dataframe
-        The dataframe that contains the data to plot.
-    
     ycol : string
-        The column to plot on the y-axis. This must be
-        a column from the `data` dataframe.
+        The column to plot on the y-axis, "averageRating"
+        or "runtimeMinutes".
+
+    genres : tuple
+        The genres shown in the legend, in legend order.
+
+    years : tuple
+        The first and last years of the x-axis, those of the dataset.
 
     Returns
     -------
-    chart : html of altair Chart
-        The generated line chart converted to html
+    spec : dict
+        The Vega-Lite spec, reading its rows from the `line` dataset.
     """
+    import altair as alt  # Imported on first use, it is slow to import
+
     # Set up dynamic axis labels
     if ycol == "averageRating":
         label = "Average Rating (/10)"
     if ycol == "runtimeMinutes":
         label = "Average Runtime (minutes)"
-    
-    ycol = f"mean({ycol})"
+
+    ycol = f"{ycol}:Q"  # Already averaged per genre and year on the server
 
     # Filter the colours for the legend
-    genre_names = data.genres.unique()
+    genre_names = list(genres)
     genre_colors = []
     for genre in genre_names:
-        genre_colors.append(genre_color_map[genre])
+        genre_colors.append(genre_color(genre))
 
-    chart = alt.Chart(data).mark_line().encode(
-        x=alt.X("startYear",
+    chart = alt.Chart(alt.Data(name="line")).mark_line().encode(
+        x=alt.X("startYear:Q",
                 axis=alt.Axis(title="",
                               grid=False,
                               format='.0f'),
-                scale=alt.Scale(domain=(2011, 2020))),
+                scale=alt.Scale(domain=tuple(years))),
         y=alt.Y(ycol,
                 axis=alt.Axis(title=label)),
-        color=alt.Color("genres",
+        color=alt.Color("genres:N",
                         scale=alt.Scale(
                             domain=genre_names,
                             range=genre_colors
@@ -55,16 +63,16 @@ def generate_line_plot(data: pd.DataFrame, ycol: str):
                                           legendX=20,
                                           legendY=250,
                                           direction='horizontal')),
-        tooltip=[alt.Tooltip('genres', title="Genre"),
-                 alt.Tooltip('startYear', format=".0f" , title="Year"),
+        tooltip=[alt.Tooltip('genres:N', title="Genre"),
+                 alt.Tooltip('startYear:Q', format=".0f" , title="Year"),
                  alt.Tooltip(ycol, format=".1f" , title=label)]
     )
-    
+
     chart = chart + chart.mark_circle()
 
     chart = chart.interactive()
 
-    return chart.configure_axisLeft(
+    return chart_spec(chart.configure_axisLeft(
                 labelColor='#DBA506',
                 titleColor='#DBA506'
             ).configure_view(
@@ -79,4 +87,55 @@ def generate_line_plot(data: pd.DataFrame, ycol: str):
                 height=220,
                 width=430,
                 background='#000000'
-            ).to_html()
+            ))
+
+
+def line_plot_data(data: pd.DataFrame, ycol: str):
+    """"
+    Prepares the rows of the line chart
+
+    Parameters
+    ----------
+    data : pandas dataframe
+        The aggregated series to plot, one row per `genres` and
+        `startYear` holding the mean of each measure.
+
+    ycol : string or list
+        The column to plot on the y-axis. This must be
+        a column from the `data` dataframe. A list keeps
+        several, for the browser to pick one.
+
+    Returns
+    -------
+    genres : tuple
+        The genres present in the data, a static parameter of the spec.
+    datasets : dict
+        The values of the `line` dataset.
+    """
+    data = data[["genres", "startYear", *([ycol] if isinstance(ycol, str) else ycol)]]
+    genres = tuple(sorted(data.genres.dropna().unique()))
+    return genres, {"line": to_values(data)}
+
+
+@instrumented
+def generate_line_plot(data: pd.DataFrame, ycol: str):
+    """"
+    Generates the line chart for the dashboard
+
+    Parameters
+    ----------
+    data : pandas dataframe
+        The aggregated series to plot, one row per `genres` and
+        `startYear` holding the mean of each measure.
+
+    ycol : string
+        The column to plot on the y-axis. This must be
+        a column from the `data` dataframe.
+
+    Returns
+    -------
+    chart : html of altair Chart
+        The generated line chart converted to html
+    """
+    genres, datasets = line_plot_data(data, ycol)
+    return render_html(line_plot_spec(ycol, genres), datasets)
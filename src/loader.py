@@ -0,0 +1,324 @@
+import fcntl
+import hashlib
+import logging
+import os
+import resource
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+
+logger = logging.getLogger(__name__)
+
+# String columns kept dictionary encoded, they repeat once per actor/genre/region
+CATEGORICAL_COLUMNS = ["tconst", "primaryTitle", "primaryName", "genres", "region"]
+FLOAT_COLUMNS = ["runtimeMinutes", "averageRating"]
+
+
+def resident_memory():
+    """
+    Returns the resident set size of the current process in bytes.
+
+    Falls back to the peak resident size where /proc is unavailable.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def dataset_version(*paths):
+    """
+    Identifies the current version of some data files.
+
+    Parameters
+    ----------
+    *paths : string
+        The files the dataset is built from.
+
+    Returns
+    -------
+    version : string
+        Hex digest of the name, size and modification time of every file.
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_region_codes(path: str):
+    """
+    Loads the region lookup table.
+
+    Parameters
+    ----------
+    path : string
+        Path to `country_codes.csv`.
+
+    Returns
+    -------
+    region_codes : pandas dataframe
+        Region `name` and numeric `country_code` indexed by the ISO alpha-2 code.
+    """
+    region_codes = pd.read_csv(path, usecols=["name", "alpha_2", "country_code"])
+    region_codes = region_codes.dropna(subset=["alpha_2"]).drop_duplicates("alpha_2")
+    region_codes["country_code"] = region_codes["country_code"].astype("int16")
+    return region_codes.set_index("alpha_2")
+
+
+def _compact_table(table: pa.Table):
+    """Dictionary encodes the string columns and downcasts the numeric ones."""
+    for column in table.column_names:
+        position = table.schema.get_field_index(column)
+        values = table.column(column)
+        if column in CATEGORICAL_COLUMNS and not pa.types.is_dictionary(values.type):
+            values = values.dictionary_encode()
+        elif column == "startYear":
+            values = pc.cast(values, pa.int16() if values.null_count == 0 else pa.float32())
+        elif column in FLOAT_COLUMNS:
+            values = pc.cast(values, pa.float32())
+        else:
+            continue
+        table = table.set_column(position, column, values)
+    return table.unify_dictionaries()
+
+
+def attach_regions(data: pd.DataFrame, region_codes: pd.DataFrame):
+    """
+    Adds the region `name` and `country_code` columns from the lookup table.
+
+    Both columns are derived from the categories of `region` instead of
+    merging the country metadata onto every row. Rows whose region is not
+    in the lookup table are dropped, like the inner merge used to do.
+
+    Parameters
+    ----------
+    data : pandas dataframe
+        The data with a categorical `region` column.
+    region_codes : pandas dataframe
+        The lookup table from `load_region_codes`.
+
+    Returns
+    -------
+    data : pandas dataframe
+        The data with the region columns added.
+    """
+    data = data[data["region"].isin(region_codes.index)]
+    region = data["region"].cat.remove_unused_categories()
+    lookup = region_codes.loc[region.cat.categories]
+    data = data.assign(
+        region=region,
+        name=region.cat.rename_categories(lookup["name"].to_numpy()),
+        country_code=lookup["country_code"].to_numpy()[region.cat.codes.to_numpy()]
+    )
+    return data.reset_index(drop=True)
+
+
+def load_dataset(data_path: str, codes_path: str):
+    """
+    Loads the IMDb dataset in a compact in-memory layout.
+
+    The title, actor, genre and region strings become categoricals, the
+    year becomes int16 and the ratings and runtimes float32. The country
+    metadata is resolved through a small region lookup table.
+
+    Parameters
+    ----------
+    data_path : string
+        Path to the IMDb feather file.
+    codes_path : string
+        Path to `country_codes.csv`.
+
+    Returns
+    -------
+    data : pandas dataframe
+        The dataset ready for the dashboard.
+    """
+    rss_before = resident_memory()
+    table = feather.read_table(data_path)
+    if "Unnamed: 0" in table.column_names:
+        table = table.drop(["Unnamed: 0"])  # Leftover row number from the CSV export
+    data = _compact_table(table).to_pandas()
+    del table
+    data = attach_regions(data, load_region_codes(codes_path))
+    rss_after = resident_memory()
+    logger.info(
+        "Loaded %d rows from %s: %.1f MB in memory, resident memory %.1f MB -> %.1f MB",
+        len(data), data_path, data.memory_usage(deep=True).sum() / 1024 ** 2,
+        rss_before / 1024 ** 2, rss_after / 1024 ** 2
+    )
+    return data
+
+
+def _to_arrow(data: pd.DataFrame):
+    """Converts the dataset to an Arrow table, keeping NaN floats as values so they map back without a copy."""
+    columns = {}
+    for column in data.columns:
+        values = data[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes = values.cat.codes.to_numpy()
+            columns[column] = pa.DictionaryArray.from_arrays(
+                pa.array(codes, mask=codes < 0),
+                pa.array(values.cat.categories.to_numpy(dtype=object))
+            )
+        else:
+            columns[column] = pa.array(values.to_numpy())
+    return pa.table(columns)
+
+
+def write_ipc(data: pd.DataFrame, path: str):
+    """
+    Writes the dataset to an uncompressed Arrow IPC file.
+
+    The file is written next to `path` and renamed into place, so
+    concurrent workers never see a partially written file.
+
+    Parameters
+    ----------
+    data : pandas dataframe
+        The dataset to write.
+    path : string
+        Destination of the IPC file.
+    """
+    table = _to_arrow(data)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def read_ipc(path: str):
+    """
+    Memory-maps an Arrow IPC file written by `write_ipc`.
+
+    Numeric columns point straight into the mapped file, so every process
+    mapping it shares the same physical pages through the OS page cache.
+
+    Parameters
+    ----------
+    path : string
+        The IPC file to map.
+
+    Returns
+    -------
+    data : pandas dataframe
+        The mapped dataset.
+    """
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def load_shared_tables(data_path: str, codes_path: str, directory: str, build):
+    """
+    Loads a set of tables from memory-mapped Arrow IPC files.
+
+    The tables are (re)built from the feather file when the directory is
+    missing or holds another `dataset_version` of its inputs. With
+    gunicorn's `--preload` this happens once in the master process,
+    otherwise the first worker to start, or to reload a new version,
+    builds them while the others wait. A rebuild is written to a temporary
+    directory and swapped into place, so workers never map a half-written
+    set, and the workers still mapping the previous files keep them.
+
+    Parameters
+    ----------
+    data_path : string
+        Path to the IMDb feather file.
+    codes_path : string
+        Path to `country_codes.csv`.
+    directory : string
+        Directory holding one `<table>.arrow` file per table.
+    build : callable
+        Turns the dataset returned by `load_dataset` into a dict mapping
+        table names to dataframes.
+
+    Returns
+    -------
+    tables : dict
+        Maps every table name to a dataframe backed by its mapped file.
+    """
+    rss_before = resident_memory()
+    version = dataset_version(data_path, codes_path)
+    version_path = os.path.join(directory, "version")
+    os.makedirs(os.path.dirname(os.path.abspath(directory)), exist_ok=True)
+    with open(f"{directory}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        current = None
+        if os.path.exists(version_path):
+            with open(version_path) as file:
+                current = file.read()
+        if current != version:
+            tables = build(load_dataset(data_path, codes_path))
+            tmp_directory = f"{directory}.{os.getpid()}.tmp"
+            os.makedirs(tmp_directory, exist_ok=True)
+            for name, table in tables.items():
+                write_ipc(table, os.path.join(tmp_directory, f"{name}.arrow"))
+            del tables
+            with open(os.path.join(tmp_directory, "version"), "w") as file:
+                file.write(version)
+            if os.path.isdir(directory):
+                stale_directory = f"{directory}.{os.getpid()}.stale"
+                os.replace(directory, stale_directory)
+                shutil.rmtree(stale_directory, ignore_errors=True)
+            os.replace(tmp_directory, directory)
+            logger.info("Wrote shared tables of version %s to %s", version, directory)
+
+        tables = {
+            file_name[:-len(".arrow")]: read_ipc(os.path.join(directory, file_name))
+            for file_name in sorted(os.listdir(directory)) if file_name.endswith(".arrow")
+        }
+    logger.info(
+        "Mapped %d tables from %s, resident memory %.1f MB -> %.1f MB",
+        len(tables), directory, rss_before / 1024 ** 2, resident_memory() / 1024 ** 2
+    )
+    return tables
+
+
+def load_dataset_legacy(data_path: str, codes_path: str):
+    """
+    Loads the dataset the way the dashboard originally did, for comparison.
+
+    Parameters
+    ----------
+    data_path : string
+        Path to the IMDb feather file.
+    codes_path : string
+        Path to `country_codes.csv`.
+
+    Returns
+    -------
+    data : pandas dataframe
+        The feather data merged with the full country metadata.
+    """
+    data = pd.read_feather(data_path)
+    country_codes = pd.read_csv(codes_path)
+    return pd.merge(data, country_codes, left_on="region", right_on="alpha_2")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from .config import COUNTRY_CODES_PATH, DATA_PATH
+
+    parser = argparse.ArgumentParser(description="Compare the memory used by the legacy and compact loaders.")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--codes", default=COUNTRY_CODES_PATH)
+    args = parser.parse_args()
+
+    for loader in [load_dataset_legacy, load_dataset]:
+        rss_before = resident_memory()
+        data = loader(args.data, args.codes)
+        rss_after = resident_memory()
+        print(
+            f"{loader.__name__}: {len(data)} rows, "
+            f"frame {data.memory_usage(deep=True).sum() / 1024 ** 2:.1f} MB, "
+            f"resident {rss_before / 1024 ** 2:.1f} MB -> {rss_after / 1024 ** 2:.1f} MB"
+        )
+        del data
@@ -1,29 +1,32 @@
-from cgitb import lookup
-import altair as alt
+from functools import lru_cache
+
 import pandas as pd
-from vega_datasets import data  # Required for the map
+from .instrumentation import instrumented
+from .rendering import chart_spec, render_html, to_values
 
+# The world map of vega-datasets, used unless a local copy is served from the assets
+WORLD_MAP_FILE = "world-110m.json"
+WORLD_MAP_CDN_URL = f"https://cdn.jsdelivr.net/npm/vega-datasets@v1.29.0/data/{WORLD_MAP_FILE}"
 
-def generate_map(df: pd.DataFrame):
+
+@lru_cache(maxsize=None)
+def map_spec(world_url: str = WORLD_MAP_CDN_URL):
     """"
-    Generates the map for the dashboard
+    Builds the map spec, compiled once per world map location
 
     Parameters
     ----------
-    df : pandas dataframe
-        The dataframe that contains the data to plot.
+    world_url : string
+        URL of the world TopoJSON file with a `countries` object.
 
     Returns
     -------
-    chart : html of altair Chart
-        The generated map converted to html
+    spec : dict
+        The Vega-Lite spec, looking the countries up in the `map` dataset.
     """
-    world_map = alt.topo_feature(data.world_110m.url, "countries")
+    import altair as alt  # Imported on first use, it is slow to import
 
-    # Get the top rated movie for each country code
-    df = df.groupby(["country_code"]).apply(lambda x: x.sort_values(["averageRating"], ascending=False)).reset_index(drop=True)
-    df = df[["primaryTitle", "country_code", "averageRating"]].drop_duplicates().groupby(["country_code"]).head(1)
-    df["fill"] = 1  # Colour the map only if the country exists
+    world_map = alt.topo_feature(world_url, "countries")
 
     map = alt.Chart(
         world_map
@@ -32,7 +35,7 @@ def generate_map(df: pd.DataFrame):
         strokeWidth=0.3
     ).transform_lookup(
         lookup="id",
-        from_=alt.LookupData(df, "country_code", ["averageRating", "primaryTitle", "fill"])
+        from_=alt.LookupData(alt.Data(name="map"), "country_code", ["averageRating", "primaryTitle", "fill"])
     ).encode(
         tooltip=[alt.Tooltip('averageRating:O', title="Average Rating"),
                  alt.Tooltip('primaryTitle:N', title="Title")],
@@ -42,10 +45,116 @@ def generate_map(df: pd.DataFrame):
                         legend=None)
     ).project(type="equalEarth").configure(background='#000000')
 
-    return map.configure_view(
+    return chart_spec(map.configure_view(
                 strokeWidth=0
             ).properties(
                 height=300,
                 width=640,
                 background='#000000'
-            ).to_html()
+            ))
+
+
+def top_rated_per_country(df: pd.DataFrame, by=("country_code",)):
+    """"
+    Finds the top rated movie of every group with one sort
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        Rows with `primaryTitle`, `averageRating` and the `by` columns.
+    by : tuple
+        The grouping columns, the last one being `country_code`.
+
+    Returns
+    -------
+    top : pandas dataframe
+        One row per group, ties broken by title.
+    """
+    by = list(by)
+    top = df[by + ["primaryTitle", "averageRating"]].sort_values(
+        by + ["averageRating", "primaryTitle"],
+        ascending=[True] * len(by) + [False, True],
+        na_position="last"
+    )
+    return top.drop_duplicates(by)
+
+
+class TopRatedIndex:
+    """"
+    Top rated movie of every country, precomputed per (genre, year)
+
+    A selection of genres and years only merges the precomputed cells,
+    at most one row per (genre, year, country), instead of the movies.
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        Rows with `genres`, `startYear`, `country_code`, `primaryTitle`
+        and `averageRating` covering every region.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.cells = top_rated_per_country(df, by=("genres", "startYear", "country_code"))
+        self.cells = self.cells.reset_index(drop=True)
+
+    def select(self, genres: list, years: list):
+        """"
+        Finds the top rated movie of every country for some genres and years
+
+        Parameters
+        ----------
+        genres : list
+            The selected genres.
+        years : list
+            The inclusive [start, end] year range.
+
+        Returns
+        -------
+        top : pandas dataframe
+            One row per country.
+        """
+        cells = self.cells
+        selected = cells[
+            cells.genres.isin(genres)
+            & (cells.startYear >= years[0])
+            & (cells.startYear <= years[1])
+        ]
+        return top_rated_per_country(selected)
+
+
+def map_data(df: pd.DataFrame):
+    """"
+    Prepares the top rated movie of every country for the map
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        The dataframe that contains the data to plot.
+
+    Returns
+    -------
+    datasets : dict
+        The values of the `map` dataset.
+    """
+    df = top_rated_per_country(df)
+    df["averageRating"] = df["averageRating"].astype("float64").round(1)  # Ratings are stored as float32
+    df["fill"] = 1  # Colour the map only if the country exists
+    return {"map": to_values(df[["primaryTitle", "country_code", "averageRating", "fill"]])}
+
+
+@instrumented
+def generate_map(df: pd.DataFrame):
+    """"
+    Generates the map for the dashboard
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        The dataframe that contains the data to plot.
+
+    Returns
+    -------
+    chart : html of altair Chart
+        The generated map converted to html
+    """
+    return render_html(map_spec(), map_data(df))
@@ -0,0 +1,196 @@
+import json
+from urllib.parse import urlencode
+
+import pandas as pd
+
+DEFAULT_EMBED_OPTIONS = {"actions": False}
+
+# Where the Vega libraries are loaded from when they are not vendored
+CDN_URL = "https://cdn.jsdelivr.net/npm"
+
+# Folder of the assets holding the vendored Vega libraries, see src/vendor_assets.py
+VEGA_ASSETS = "vega"
+
+# Same page as altair's "standard" template, with the URLs of the Vega libraries passed in
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="UTF-8">
+  <style>
+    #vis.vega-embed {{
+      width: 100%;
+      display: flex;
+    }}
+
+    #vis.vega-embed details,
+    #vis.vega-embed details summary {{
+      position: relative;
+    }}
+  </style>
+{scripts}
+</head>
+<body>
+  <div id="vis"></div>
+  <script>
+    (function(vegaEmbed) {{
+      var spec = {spec};
+      var embedOpt = {embed_options};
+
+      function showError(el, error){{
+          el.innerHTML = ('<div style="color:red;">'
+                          + '<p>JavaScript Error: ' + error.message + '</p>'
+                          + "<p>This usually means there's a typo in your chart specification. "
+                          + "See the javascript console for the full traceback.</p>"
+                          + '</div>');
+          throw error;
+      }}
+      const el = document.getElementById('vis');
+      vegaEmbed("#vis", spec, embedOpt)
+        .catch(error => showError(el, error));
+    }})(vegaEmbed);
+  </script>
+</body>
+</html>"""
+
+
+def chart_spec(chart):
+    """
+    Compiles an Altair chart built on named data to a Vega-Lite spec.
+
+    Parameters
+    ----------
+    chart : altair Chart
+        The chart, its datasets referenced by name with `alt.Data(name=...)`.
+
+    Returns
+    -------
+    spec : dict
+        The Vega-Lite spec without any data values.
+    """
+    return chart.to_dict()
+
+
+def to_values(data: pd.DataFrame):
+    """
+    Converts a dataframe to the JSON records Vega expects.
+
+    Parameters
+    ----------
+    data : pandas dataframe
+        The data of one named dataset.
+
+    Returns
+    -------
+    values : list
+        One dict per row, with categoricals and missing values made JSON safe.
+    """
+    # Same records as altair's `to_values`, without importing altair
+    return data.astype(object).where(data.notna(), None).to_dict("records")
+
+
+def vega_libraries():
+    """
+    Lists the Vega libraries the charts load, in loading order.
+
+    Returns
+    -------
+    libraries : list
+        The (path in the assets, CDN URL) of vega, vega-lite and
+        vega-embed, in the versions altair targets.
+    """
+    import altair as alt  # Only imported for the Vega versions it targets
+
+    return [
+        (f"{VEGA_ASSETS}/{name}@{version}.min.js", f"{CDN_URL}/{name}@{version}")
+        for name, version in [
+            ("vega", alt.VEGA_VERSION), ("vega-lite", alt.VEGALITE_VERSION), ("vega-embed", alt.VEGAEMBED_VERSION)
+        ]
+    ]
+
+
+def render_html(spec: dict, datasets: dict, embed_options=None, scripts=None):
+    """
+    Renders a spec and its data to a standalone HTML document.
+
+    Parameters
+    ----------
+    spec : dict
+        A spec returned by `chart_spec`.
+    datasets : dict
+        Maps every dataset name of the spec to its values.
+    embed_options : dict, optional
+        Options passed to vega-embed.
+    scripts : list, optional
+        URLs of the Vega libraries, those of the CDN by default.
+
+    Returns
+    -------
+    html : string
+        The chart as an HTML document, for an iframe's `srcDoc`.
+    """
+    if scripts is None:
+        scripts = [url for _, url in vega_libraries()]
+    spec = {**spec, "datasets": {**spec.get("datasets", {}), **datasets}}
+    embed_options = dict(embed_options or DEFAULT_EMBED_OPTIONS)
+    embed_options.setdefault("mode", "vega-lite")
+    return HTML_TEMPLATE.format(
+        scripts="\n".join(f'  <script type="text/javascript" src="{url}"></script>' for url in scripts),
+        spec=json.dumps(spec),
+        embed_options=json.dumps(embed_options)
+    )
+
+
+def spec_url(prefix: str, chart: str, **params):
+    """
+    Builds the URL the browser fetches a cached chart spec from.
+
+    Parameters
+    ----------
+    prefix : string
+        The app's requests pathname prefix.
+    chart : string
+        The chart name.
+    **params
+        The static parameters of the spec, lists are sent comma separated.
+
+    Returns
+    -------
+    url : string
+        The spec URL, identical for identical parameters.
+    """
+    query = {
+        name: ",".join(map(str, value)) if isinstance(value, (list, tuple)) else value
+        for name, value in sorted(params.items())
+    }
+    url = f"{prefix}charts/spec/{chart}"
+    return f"{url}?{urlencode(query)}" if query else url
+
+
+def chart_payload(spec, datasets: dict, embed_options=None, head=None):
+    """
+    Builds the data-only update sent to a persistent Vega view.
+
+    Parameters
+    ----------
+    spec : string or dict
+        URL of the chart spec, see `spec_url`, or the URLs of its specs by
+        value of the input the browser picks the spec with.
+    datasets : dict
+        Maps every dataset name of the spec to its values.
+    embed_options : dict, optional
+        Options passed to vega-embed when the view is first created.
+    head : list, optional
+        Datasets the browser cuts to as many rows as the value of the
+        chart's input.
+
+    Returns
+    -------
+    payload : dict
+        The value of the chart's payload store.
+    """
+    return {
+        "spec": spec,
+        "datasets": datasets,
+        "embed": embed_options or DEFAULT_EMBED_OPTIONS,
+        "head": head or []
+    }
@@ -0,0 +1,90 @@
+"""
+Compression and conditional responses for the Dash JSON endpoints.
+
+The callback responses carry whole chart documents or payloads and
+compress well, with brotli when it is installed and gzip otherwise.
+Every response also gets a strong ETag, the hash of its body. The page
+sends the ETags of the responses it holds for an output with the next
+request for it, see src/assets/conditional_updates.js, and an identical
+response is answered with 304 Not Modified and no body.
+"""
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:  # Optional, gzip is used without it
+    brotli = None
+
+from .config import HTTP_COMPRESSION
+
+# Dash endpoints whose responses get an ETag and are compressed
+PATHS = ("/_dash-update-component", "/_dash-layout", "/_dash-dependencies")
+
+# Smaller responses are sent as they are
+MIN_COMPRESS_BYTES = 1024
+
+
+def body_etag(body: bytes):
+    """Returns the strong ETag of a response body."""
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def compress(body: bytes, accept_encodings):
+    """
+    Compresses a response body with the best encoding the client accepts.
+
+    Parameters
+    ----------
+    body : bytes
+        The response body.
+    accept_encodings : werkzeug Accept
+        The parsed `Accept-Encoding` header of the request.
+
+    Returns
+    -------
+    encoding : string or None
+        The `Content-Encoding` of the returned body, None if it is not compressed.
+    body : bytes
+        The body to send.
+    """
+    if len(body) < MIN_COMPRESS_BYTES:
+        return None, body
+    if brotli is not None and accept_encodings["br"]:
+        return "br", brotli.compress(body, quality=5)
+    if accept_encodings["gzip"]:
+        return "gzip", gzip.compress(body, compresslevel=6)
+    return None, body
+
+
+def install(server):
+    """
+    Adds ETags, conditional responses and compression to the Dash endpoints of the Flask `server`.
+
+    Parameters
+    ----------
+    server : flask app
+        The Dash app's server.
+    """
+    import flask
+
+    @server.after_request
+    def finish_response(response):
+        request = flask.request
+        if (response.status_code != 200 or response.direct_passthrough or "Content-Encoding" in response.headers
+                or not request.path.endswith(PATHS)):
+            return response
+        body = response.get_data()
+        etag = body_etag(body)
+        response.set_etag(etag)
+        if request.if_none_match.contains(etag):
+            response.status_code = 304
+            response.set_data(b"")
+            return response
+        if HTTP_COMPRESSION:
+            encoding, body = compress(body, request.accept_encodings)
+            if encoding:
+                response.set_data(body)
+                response.headers["Content-Encoding"] = encoding
+            response.vary.add("Accept-Encoding")
+        return response
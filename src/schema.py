@@ -0,0 +1,239 @@
+import numpy as np
+import pandas as pd
+
+from .filter_index import FilterIndex, expand_ranges
+
+TITLE_COLUMNS = ["tconst", "primaryTitle", "startYear", "runtimeMinutes", "averageRating"]
+
+
+def _unique_pairs(left, right, n_right):
+    """Returns the distinct (left, right) integer pairs, sorted, and how often each occurs."""
+    keys, counts = np.unique(left.astype("int64") * n_right + right, return_counts=True)
+    return keys // n_right, keys % n_right, counts
+
+
+class StarSchema:
+    """
+    Normalised IMDb dataset with integer keys.
+
+    The cleaned data repeats every movie once per (actor, genre, region).
+    Here each movie is stored once in `titles` and linked to its genres,
+    regions and actors by bridge tables, and every query returns the grain
+    a chart needs without deduplicating at request time.
+
+    Tables
+    ------
+    titles : one row per movie, the row position is the `title_id`
+    actors : one row per actor name, the row position is the `actor_id`
+    title_genre : (title_id, genres) pairs
+    title_region : (title_id, name, country_code) pairs
+    title_actor : (title_id, actor_id) pairs sorted by title
+    title_cells : (title_id, genres, name, country_code, startYear) facts,
+        with the number of original rows behind each of them in `rows`,
+        indexed by a `FilterIndex`
+
+    Parameters
+    ----------
+    titles, actors, title_genre, title_region, title_actor, title_cells : pandas dataframe
+        The tables described above.
+    """
+
+    table_names = ["titles", "actors", "title_genre", "title_region", "title_actor", "title_cells"]
+
+    def __init__(self, titles, actors, title_genre, title_region, title_actor, title_cells):
+        self.titles = titles
+        self.actors = actors
+        self.title_genre = title_genre
+        self.title_region = title_region
+        self.title_actor = title_actor
+        self.index = FilterIndex(title_cells)
+        self._actor_offsets = np.searchsorted(
+            title_actor["title_id"].to_numpy(), np.arange(len(titles) + 1)
+        )
+
+    @classmethod
+    def from_rows(cls, data: pd.DataFrame):
+        """
+        Normalises the exploded title x actor x genre x region rows.
+
+        Parameters
+        ----------
+        data : pandas dataframe
+            The dataset as returned by `load_dataset`.
+
+        Returns
+        -------
+        schema : StarSchema
+            The normalised dataset.
+        """
+        data = data[data["tconst"].notna()]
+        tconst = data["tconst"].astype("category").cat.remove_unused_categories()
+        title_ids = tconst.cat.codes.to_numpy().astype("int64")
+        first_rows = np.unique(title_ids, return_index=True)[1]
+        titles = data.iloc[first_rows][TITLE_COLUMNS].reset_index(drop=True)
+        titles["tconst"] = tconst.iloc[first_rows].to_numpy()
+
+        genre = data["genres"].astype("category")
+        region = data["name"].astype("category")
+        actor = data["primaryName"].astype("category").cat.remove_unused_categories()
+        genre_codes = genre.cat.codes.to_numpy().astype("int64")
+        region_codes = region.cat.codes.to_numpy().astype("int64")
+        actor_codes = actor.cat.codes.to_numpy().astype("int64")
+        genres = genre.cat.categories
+        regions = region.cat.categories
+
+        # Country code of every region category
+        country_codes = np.zeros(len(regions), dtype="int16")
+        has_region = region_codes >= 0
+        country_codes[region_codes[has_region]] = data["country_code"].to_numpy()[has_region]
+
+        present = genre_codes >= 0
+        ids, codes, _ = _unique_pairs(title_ids[present], genre_codes[present], len(genres))
+        title_genre = pd.DataFrame({
+            "title_id": ids.astype("int32"),
+            "genres": pd.Categorical.from_codes(codes, genres)
+        })
+
+        ids, codes, _ = _unique_pairs(title_ids[has_region], region_codes[has_region], len(regions))
+        title_region = pd.DataFrame({
+            "title_id": ids.astype("int32"),
+            "name": pd.Categorical.from_codes(codes, regions),
+            "country_code": country_codes[codes]
+        })
+
+        present = actor_codes >= 0
+        ids, codes, _ = _unique_pairs(title_ids[present], actor_codes[present], len(actor.cat.categories))
+        title_actor = pd.DataFrame({"title_id": ids.astype("int32"), "actor_id": codes.astype("int32")})
+        actors = pd.DataFrame({"primaryName": actor.cat.categories.to_numpy(dtype=object)})
+
+        present = (genre_codes >= 0) & has_region
+        ids, cell_codes, rows = _unique_pairs(
+            title_ids[present], genre_codes[present] * len(regions) + region_codes[present], len(genres) * len(regions)
+        )
+        title_cells = pd.DataFrame({
+            "title_id": ids.astype("int32"),
+            "genres": pd.Categorical.from_codes(cell_codes // len(regions), genres),
+            "name": pd.Categorical.from_codes(cell_codes % len(regions), regions),
+            "country_code": country_codes[cell_codes % len(regions)],
+            "startYear": titles["startYear"].to_numpy()[ids],
+            "rows": rows.astype("int32")
+        })
+        return cls(titles, actors, title_genre, title_region, title_actor, title_cells)
+
+    @classmethod
+    def from_tables(cls, tables: dict):
+        """Rebuilds the schema from the tables returned by `tables`."""
+        return cls(*[tables[name] for name in cls.table_names])
+
+    @property
+    def tables(self):
+        """Maps every table name to its dataframe, `title_cells` in filter index order."""
+        return {
+            "titles": self.titles,
+            "actors": self.actors,
+            "title_genre": self.title_genre,
+            "title_region": self.title_region,
+            "title_actor": self.title_actor,
+            "title_cells": self.index.data
+        }
+
+    def actor_ranges(self, title_ids):
+        """
+        Locates the actors of some titles in `title_actor`.
+
+        Parameters
+        ----------
+        title_ids : numpy array
+            The titles to look up.
+
+        Returns
+        -------
+        starts, lengths : numpy array
+            First `title_actor` row and number of actors of every title.
+        """
+        starts = self._actor_offsets[title_ids]
+        return starts, self._actor_offsets[np.asarray(title_ids) + 1] - starts
+
+    def _with_titles(self, frame: pd.DataFrame, columns: list):
+        """Adds title columns to a frame holding a `title_id` column."""
+        title_ids = frame["title_id"].to_numpy()
+        for column in columns:
+            frame[column] = self.titles[column].to_numpy()[title_ids]
+        return frame
+
+    def box_rows(self, genres: list, regions: list, years: list):
+        """
+        Returns one row per selected (title, genre, region).
+
+        Parameters
+        ----------
+        genres : list
+            The selected genres.
+        regions : list
+            The selected region names.
+        years : list
+            The inclusive [start, end] year range.
+
+        Returns
+        -------
+        rows : pandas dataframe
+            The selected facts with the country code, title, rating and runtime.
+        """
+        cells = self.index.filter(genres, regions, years)
+        frame = cells[["title_id", "genres", "name", "country_code", "startYear"]].copy()
+        return self._with_titles(frame, ["primaryTitle", "runtimeMinutes", "averageRating"])
+
+    def map_rows(self, genres: list, regions: list, years: list):
+        """
+        Returns one row per selected (title, region).
+
+        Parameters
+        ----------
+        genres : list
+            The selected genres.
+        regions : list
+            The selected region names.
+        years : list
+            The inclusive [start, end] year range.
+
+        Returns
+        -------
+        rows : pandas dataframe
+            The selected titles with their region, country code and rating.
+        """
+        cells = self.index.filter(genres, regions, years)
+        region_codes = cells["name"].cat.codes.to_numpy()
+        _, first_rows = np.unique(
+            cells["title_id"].to_numpy().astype("int64") * len(self.index.regions) + region_codes,
+            return_index=True
+        )
+        frame = cells.iloc[first_rows][["title_id", "name", "country_code"]].reset_index(drop=True)
+        return self._with_titles(frame, ["primaryTitle", "averageRating"])
+
+    def actor_rows(self, genres: list, regions: list, years: list):
+        """
+        Returns one row per (title, actor) of the selected titles.
+
+        Parameters
+        ----------
+        genres : list
+            The selected genres.
+        regions : list
+            The selected region names.
+        years : list
+            The inclusive [start, end] year range.
+
+        Returns
+        -------
+        rows : pandas dataframe
+            The actor name, title and rating of every pair.
+        """
+        cells = self.index.filter(genres, regions, years)
+        title_ids = np.unique(cells["title_id"].to_numpy())
+        rows = expand_ranges(*self.actor_ranges(title_ids))
+        pairs = self.title_actor.iloc[rows]
+        frame = pd.DataFrame({
+            "title_id": pairs["title_id"].to_numpy(),
+            "primaryName": self.actors["primaryName"].to_numpy()[pairs["actor_id"].to_numpy()]
+        })
+        return self._with_titles(frame, ["primaryTitle", "averageRating"])
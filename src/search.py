@@ -0,0 +1,146 @@
+import unicodedata
+
+import numpy as np
+
+# Kinds of names that can be searched, in the order their matches are listed
+SEARCH_KINDS = {"actor": "Actor", "title": "Movie"}
+
+
+def normalize(text: str):
+    """Lowercases a name and strips its accents, so that "penelope" matches "Penélope"."""
+    decomposed = unicodedata.normalize("NFKD", str(text).casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def search_value(kind: str, name: str):
+    """Returns the value of the search option picking a name."""
+    return f"{kind}:{name}"
+
+
+def search_option(value: str):
+    """Returns the dropdown option of a search value."""
+    kind, name = parse_search(value)
+    return {"label": f"{name} ({SEARCH_KINDS[kind]})", "value": value}
+
+
+def parse_search(value):
+    """Splits a search option value into (kind, name), or returns None when nothing is picked."""
+    if not value:
+        return None
+    kind, name = value.split(":", 1)
+    if kind not in SEARCH_KINDS:
+        raise ValueError(f"Unknown search kind {kind!r}")
+    return kind, name
+
+
+class NameIndex:
+    """
+    Sorted-prefix index for the type-ahead search of actor and movie names.
+
+    Every name gets an integer code. The normalised names and, separately,
+    each of their words after the first are sorted once with the codes of
+    their names, so the names matching a prefix are one contiguous slice
+    found by binary search.
+
+    Parameters
+    ----------
+    names : dict
+        Maps every kind of `SEARCH_KINDS` to its names. Missing and empty
+        names are skipped, `find` returns positions in these lists.
+    """
+
+    def __init__(self, names: dict):
+        self.kinds = []
+        self.names = []
+        self.positions = []
+        for kind in SEARCH_KINDS:
+            kind_names = [
+                (position, name) for position, name in enumerate(names.get(kind, [])) if isinstance(name, str) and name
+            ]
+            self.kinds.extend([kind] * len(kind_names))
+            self.names.extend(name for _, name in kind_names)
+            self.positions.extend(position for position, _ in kind_names)
+        self.kinds = np.array(self.kinds, dtype=object)
+        self.names = np.array(self.names, dtype=object)
+        self.positions = np.array(self.positions, dtype="int64")
+
+        starts = []
+        words = []
+        for code, name in enumerate(self.names):
+            key = normalize(name)
+            starts.append((key, code))
+            # Every later word, with the rest of the name to keep the matches ordered
+            for position in range(1, len(key)):
+                if key[position - 1] == " " and key[position] != " ":
+                    words.append((key[position:], code))
+        self._starts = self._sorted(starts)
+        self._words = self._sorted(words)
+
+    @staticmethod
+    def _sorted(entries: list):
+        entries.sort()
+        keys = np.array([key for key, _ in entries], dtype=object)
+        codes = np.array([code for _, code in entries], dtype="int64")
+        return keys, codes
+
+    @staticmethod
+    def _prefix(index: tuple, prefix: str, limit: int):
+        """Returns the codes of at most `limit` entries starting with `prefix`, in key order."""
+        keys, codes = index
+        start = np.searchsorted(keys, prefix, side="left")
+        end = np.searchsorted(keys, prefix + "\U0010ffff", side="left")
+        return codes[start:min(end, start + limit)]
+
+    def search(self, query: str, limit=10):
+        """
+        Finds the names matching what the user typed.
+
+        Names starting with the query come first, then names with a later
+        word starting with it, each in alphabetical order.
+
+        Parameters
+        ----------
+        query : string
+            The text typed in the search box.
+        limit : int
+            Maximum number of matches.
+
+        Returns
+        -------
+        matches : list
+            (kind, name) of every match.
+        """
+        prefix = normalize(query).strip()
+        if not prefix:
+            return []
+        codes = np.concatenate([self._prefix(self._starts, prefix, limit), self._prefix(self._words, prefix, limit)])
+        # A name is listed once, where it first matches
+        _, first = np.unique(codes, return_index=True)
+        codes = codes[np.sort(first)][:limit]
+        return list(zip(self.kinds[codes], self.names[codes]))
+
+    def find(self, kind: str, name: str):
+        """
+        Looks up a name picked in the search box.
+
+        Parameters
+        ----------
+        kind : string
+            One of `SEARCH_KINDS`.
+        name : string
+            The exact name.
+
+        Returns
+        -------
+        positions : numpy array
+            Positions of the name in the list of its kind given to the index.
+        """
+        keys, codes = self._starts
+        key = normalize(name)
+        codes = codes[np.searchsorted(keys, key, side="left"):np.searchsorted(keys, key, side="right")]
+        codes = codes[(self.kinds[codes] == kind) & (self.names[codes] == name)]
+        return np.sort(self.positions[codes])
+
+    def options(self, query: str, limit=10):
+        """Returns the matches of `search` as dropdown options."""
+        return [search_option(search_value(kind, name)) for kind, name in self.search(query, limit)]
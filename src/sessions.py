@@ -0,0 +1,94 @@
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class LatestRequests:
+    """
+    Latest filter update of every browser session, shared by all workers.
+
+    The browser numbers its filter updates. Every callback working on an
+    update checks it against the latest number registered for its session
+    and drops it once a newer one exists, instead of computing and rendering
+    charts the browser will throw away. The state lives in a small SQLite
+    file so that all gunicorn workers see the same sessions.
+
+    Parameters
+    ----------
+    path : string
+        Location of the SQLite file, created if missing.
+    max_age : float
+        Seconds after which an idle session is forgotten.
+    """
+
+    def __init__(self, path: str, max_age=24 * 60 * 60):
+        self.path = path
+        self.max_age = max_age
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS latest (session TEXT PRIMARY KEY, seq INTEGER, updated REAL)"
+            )
+            connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+
+    @contextmanager
+    def _connect(self):
+        """Opens a connection, commits what it ran if nothing failed and closes it."""
+        with closing(sqlite3.connect(self.path, timeout=5)) as connection, connection:
+            yield connection
+
+    def register(self, session: str, seq: int):
+        """
+        Records a filter update and tells whether it is the latest one.
+
+        Parameters
+        ----------
+        session : string
+            Id of the browser session.
+        seq : int
+            Number of the update within the session.
+
+        Returns
+        -------
+        latest : bool
+            False if a newer update of the session was registered first.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("DELETE FROM latest WHERE updated < ?", (now - self.max_age,))
+            connection.execute(
+                "INSERT INTO latest VALUES (?, ?, ?) "
+                "ON CONFLICT (session) DO UPDATE SET seq = max(seq, excluded.seq), updated = excluded.updated",
+                (session, seq, now)
+            )
+            latest, = connection.execute("SELECT seq FROM latest WHERE session = ?", (session,)).fetchone()
+        return latest <= seq
+
+    def is_stale(self, session: str, seq: int):
+        """Tells whether a newer update than `seq` was registered for `session`."""
+        with self._connect() as connection:
+            row = connection.execute("SELECT seq FROM latest WHERE session = ?", (session,)).fetchone()
+        return row is not None and row[0] > seq
+
+    def skip(self):
+        """Counts one dropped stale request and returns the total."""
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO counters VALUES ('stale_skipped', 1) "
+                "ON CONFLICT (name) DO UPDATE SET value = value + 1"
+            )
+            skipped, = connection.execute("SELECT value FROM counters WHERE name = 'stale_skipped'").fetchone()
+        logger.debug("Dropped a stale request, %d so far", skipped)
+        return skipped
+
+    @property
+    def stale_skipped(self):
+        """Number of stale requests dropped by all workers."""
+        with self._connect() as connection:
+            row = connection.execute("SELECT value FROM counters WHERE name = 'stale_skipped'").fetchone()
+        return row[0] if row else 0
@@ -0,0 +1,41 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PhaseTimer:
+    """
+    Wall-clock time of consecutive phases, e.g. of the app startup.
+
+    The first phase starts when the timer is created, every call to `mark`
+    ends the current phase and starts the next one.
+
+    Parameters
+    ----------
+    name : string
+        What is being timed, used in the report.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.phases = {}
+        self._started = self._last = time.perf_counter()
+
+    def mark(self, phase: str):
+        """Ends the current phase under the name `phase`."""
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0) + now - self._last
+        self._last = now
+
+    @property
+    def total(self):
+        """Seconds from the creation of the timer to the last mark."""
+        return self._last - self._started
+
+    def report(self):
+        """Logs the time of every phase and the total, and returns the report."""
+        phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.phases.items())
+        report = f"{self.name} took {self.total:.2f}s: {phases}"
+        logger.info(report)
+        return report
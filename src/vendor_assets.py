@@ -0,0 +1,221 @@
+"""
+Downloads the third-party files the dashboard otherwise loads from a CDN
+into `src/assets`, so that serving the app needs no external network.
+
+Run it once at build time, the app picks the files up on startup and
+falls back to the CDN, with a warning, for any file that is missing::
+
+    python -m src.vendor_assets
+
+The world map is reduced to the `countries` object the map draws and to
+the arcs those countries use, then its arcs are simplified and quantized
+more coarsely. The Vega libraries are downloaded in the versions the
+installed altair targets.
+"""
+import argparse
+import json
+import logging
+import os
+import urllib.request
+
+import numpy as np
+
+from .map_plot import WORLD_MAP_CDN_URL, WORLD_MAP_FILE
+from .rendering import vega_libraries
+
+logger = logging.getLogger(__name__)
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+
+# Largest distance, in degrees, between the simplified world map and the original,
+# well below one pixel of the map at the size it is drawn
+WORLD_MAP_TOLERANCE = 0.1
+
+# Positions per axis the simplified world map is quantized to
+WORLD_MAP_QUANTIZATION = 10_000
+
+
+def download(url: str):
+    """Returns the body of `url`."""
+    with urllib.request.urlopen(url, timeout=60) as response:
+        return response.read()
+
+
+def _geometry_arcs(geometry: dict):
+    """Yields every arc index referenced by a TopoJSON geometry, as stored."""
+    if geometry["type"] == "GeometryCollection":
+        for child in geometry["geometries"]:
+            yield from _geometry_arcs(child)
+    elif "arcs" in geometry:
+        stack = [geometry["arcs"]]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, list):
+                stack.extend(item)
+            else:
+                yield item
+
+
+def _remap_arcs(item, mapping: dict):
+    """Renumbers the arc indices of a nested TopoJSON arcs list, reversed arcs being negative."""
+    if isinstance(item, list):
+        return [_remap_arcs(child, mapping) for child in item]
+    return mapping[item] if item >= 0 else ~mapping[~item]
+
+
+def _remap_geometry(geometry: dict, mapping: dict):
+    """Returns a copy of a TopoJSON geometry with its arcs renumbered."""
+    geometry = dict(geometry)
+    if geometry["type"] == "GeometryCollection":
+        geometry["geometries"] = [_remap_geometry(child, mapping) for child in geometry["geometries"]]
+    elif "arcs" in geometry:
+        geometry["arcs"] = _remap_arcs(geometry["arcs"], mapping)
+    return geometry
+
+
+def simplify_topology(topology: dict, objects: list):
+    """
+    Keeps some objects of a TopoJSON topology and only the arcs they use.
+
+    Parameters
+    ----------
+    topology : dict
+        The parsed TopoJSON file.
+    objects : list
+        Names of the objects to keep.
+
+    Returns
+    -------
+    topology : dict
+        The reduced topology, its arcs renumbered.
+    """
+    kept = {name: topology["objects"][name] for name in objects}
+    used = sorted({
+        arc if arc >= 0 else ~arc
+        for geometry in kept.values()
+        for arc in _geometry_arcs(geometry)
+    })
+    mapping = {old: new for new, old in enumerate(used)}
+    return {
+        **topology,
+        "objects": {name: _remap_geometry(geometry, mapping) for name, geometry in kept.items()},
+        "arcs": [topology["arcs"][arc] for arc in used]
+    }
+
+
+def _douglas_peucker(points, tolerance: float):
+    """
+    Picks the points of a line kept by the Douglas-Peucker simplification.
+
+    Parameters
+    ----------
+    points : numpy array
+        The (n, 2) positions of the line.
+    tolerance : float
+        Largest distance between the simplified line and a dropped point.
+
+    Returns
+    -------
+    keep : numpy array
+        Boolean mask of the points to keep, always including both ends.
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    ranges = [(0, len(points) - 1)]
+    if len(points) > 3 and (points[0] == points[-1]).all():
+        # A closed ring is split at its farthest point, so that it keeps an area
+        farthest = int(np.argmax(np.hypot(*(points - points[0]).T)))
+        keep[farthest] = True
+        ranges = [(0, farthest), (farthest, len(points) - 1)]
+    while ranges:
+        start, end = ranges.pop()
+        if end - start < 2:
+            continue
+        inner = points[start + 1:end] - points[start]
+        direction = points[end] - points[start]
+        length = np.hypot(*direction)
+        if length:
+            distances = np.abs(inner[:, 0] * direction[1] - inner[:, 1] * direction[0]) / length
+        else:
+            distances = np.hypot(*inner.T)
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            keep[start + 1 + farthest] = True
+            ranges.extend([(start, start + 1 + farthest), (start + 1 + farthest, end)])
+    return keep
+
+
+def simplify_arcs(topology: dict, tolerance: float, quantization: int):
+    """
+    Simplifies the arcs of a TopoJSON topology and quantizes them.
+
+    Every arc is simplified on its own and keeps its ends, so the borders
+    shared by neighbouring countries stay shared.
+
+    Parameters
+    ----------
+    topology : dict
+        The parsed TopoJSON file, quantized or not.
+    tolerance : float
+        Largest distance, in the units of the coordinates, between a
+        simplified arc and the original.
+    quantization : int
+        Number of positions per axis of the quantized topology.
+
+    Returns
+    -------
+    topology : dict
+        The topology with its arcs simplified, quantized and delta-encoded.
+    """
+    transform = topology.get("transform")
+    arcs = []
+    for arc in topology["arcs"]:
+        points = np.asarray(arc, dtype="float64")[:, :2]
+        if transform:
+            points = np.cumsum(points, axis=0) * transform["scale"] + transform["translate"]
+        arcs.append(points[_douglas_peucker(points, tolerance)])
+
+    positions = np.concatenate(arcs)
+    low = positions.min(axis=0)
+    extent = positions.max(axis=0) - low
+    scale = np.where(extent > 0, extent / (quantization - 1), 1)
+    quantized = []
+    for points in arcs:
+        points = np.round((points - low) / scale).astype("int64")
+        # Points falling on the position of the previous one are dropped, the ends are kept
+        moved = np.ones(len(points), dtype=bool)
+        moved[1:-1] = (points[1:-1] != points[:-2]).any(axis=1)
+        points = points[moved]
+        quantized.append(np.concatenate([points[:1], np.diff(points, axis=0)]).tolist())
+    return {**topology, "transform": {"scale": scale.tolist(), "translate": low.tolist()}, "arcs": quantized}
+
+
+def vendor_world_map(directory: str):
+    """Downloads the world map, simplifies its `countries` and writes them to `directory`."""
+    topology = simplify_topology(json.loads(download(WORLD_MAP_CDN_URL)), ["countries"])
+    topology = simplify_arcs(topology, WORLD_MAP_TOLERANCE, WORLD_MAP_QUANTIZATION)
+    path = os.path.join(directory, WORLD_MAP_FILE)
+    with open(path, "w") as file:
+        json.dump(topology, file, separators=(",", ":"))
+    logger.info("Wrote %s, %d bytes", path, os.path.getsize(path))
+
+
+def vendor_vega(directory: str):
+    """Downloads vega, vega-lite and vega-embed to `directory`."""
+    for path, url in vega_libraries():
+        script = download(url)
+        path = os.path.join(directory, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(script)
+        logger.info("Wrote %s, %d bytes", path, len(script))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download the CDN assets of the dashboard into src/assets.")
+    parser.add_argument("--output", default=ASSETS_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    vendor_world_map(args.output)
+    vendor_vega(args.output)
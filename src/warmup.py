@@ -0,0 +1,82 @@
+"""
+Pre-renders the charts of the most common selections into the render cache.
+
+Run it at deploy time, after the dataset is in place and with the same
+environment as the app, so that the first visitors of the default
+dashboard get their charts from the cache::
+
+    python -m src.warmup
+    python -m src.warmup --selections selections.json
+
+A selections file holds a list of {"genres": [...], "regions": [...],
+"years": [start, end]} objects.
+"""
+import argparse
+import json
+import logging
+import time
+
+from .bar_chart import TOP_K
+
+logger = logging.getLogger(__name__)
+
+# The initial values of the filters, the years default to those of the dataset
+DEFAULT_SELECTIONS = [
+    {
+        "genres": ["Action", "Horror", "Romance"],
+        "regions": ["United States of America", "India"]
+    }
+]
+
+
+def warm(app_module, selections: list):
+    """
+    Renders every chart of some selections into the render cache.
+
+    Parameters
+    ----------
+    app_module : module
+        The `src.app` module.
+    selections : list
+        The selections to render, with every y-axis and top N value. A
+        selection without "years" spans the whole dataset.
+
+    Returns
+    -------
+    rendered : int
+        Number of charts rendered, including those already cached.
+    """
+    rendered = 0
+    backend = app_module.dataset_manager.current.backend
+    for selection in selections:
+        years = selection.get("years") or [backend.min_year, backend.max_year]
+        state = app_module.update_data(None, selection["genres"], selection["regions"], years)
+        if app_module.BROWSER_INPUTS:
+            # The browser picks the y-axis and the top N from one payload per chart
+            rendered += len(app_module.render_charts(state, None, None, app_module.CHART_SPECS))
+            continue
+        rendered += len(app_module.render_charts(state, "averageRating", TOP_K, ["box", "map", "line"]))
+        rendered += len(app_module.render_charts(state, "runtimeMinutes", TOP_K, ["line"]))
+        for top_n in range(1, TOP_K + 1):
+            rendered += len(app_module.render_charts(state, "averageRating", top_n, ["bar"]))
+    return rendered
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-render the most common selections into the render cache.")
+    parser.add_argument("--selections", help="JSON file listing the selections, the default filters otherwise")
+    args = parser.parse_args()
+
+    selections = DEFAULT_SELECTIONS
+    if args.selections:
+        with open(args.selections) as file:
+            selections = json.load(file)
+
+    from . import app
+
+    start = time.perf_counter()
+    rendered = warm(app, selections)
+    logger.info(
+        "Warmed %d charts of %d selections in %.1f s, %d charts cached",
+        rendered, len(selections), time.perf_counter() - start, len(app.render_cache)
+    )